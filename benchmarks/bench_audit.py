@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+from decimal import Decimal
+
+from matching.order_book import OrderBook
+from models.models import Order, Product
+from models.types import Side, OrderType, TimeInForceType, OrderStatus
+from utils.audit import audit_logger
+
+
+def new_orders(n: int) -> list:
+    rnd = random.Random(1)
+    orders = list()
+    for i in range(1, n + 1):
+        side = Side.SideBuy if rnd.random() < 0.5 else Side.SideSell
+        # prices around 100.00 so that about half of the orders match
+        price = Decimal(10000 + rnd.randint(-50, 50)).scaleb(-2)
+        orders.append(Order(_id=i, created_at=0, product_id="BTC-USD", user_id=i % 100, client_oid="",
+                            price=price, size=Decimal(rnd.randint(1, 10)), funds=Decimal("0.00"),
+                            _type=OrderType.OrderTypeLimit, side=side, time_in_force=TimeInForceType.GoodTillCanceled,
+                            status=OrderStatus.OrderStatusNew))
+    return orders
+
+
+def orders_per_sec(product: Product, orders: list) -> (float, int):
+    order_book = OrderBook(product, 0, 0)
+    logs = 0
+    start = time.perf_counter()
+    for order in orders:
+        logs += len(order_book.apply_order(order))
+    return len(orders) / (time.perf_counter() - start), logs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="matcher throughput with the audit log off and on")
+    parser.add_argument("--orders", type=int, default=200000)
+    args = parser.parse_args()
+
+    product = Product(_id="BTC-USD", base_currency="BTC", quote_currency="USD", base_scale=6, quote_scale=2)
+    orders = new_orders(args.orders)
+
+    logger = audit_logger.logger
+    logger.propagate = False
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "audit.log")
+        handler = logging.FileHandler(path)
+        handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+        logger.addHandler(handler)
+
+        logger.setLevel(logging.WARNING)
+        off, logs = orders_per_sec(product, orders)
+
+        logger.setLevel(logging.INFO)
+        sync, _ = orders_per_sec(product, orders)
+
+        audit_logger.start()
+        background, _ = orders_per_sec(product, orders)
+        start = time.perf_counter()
+        audit_logger.stop()
+        drain = time.perf_counter() - start
+        dropped = audit_logger.dropped
+
+        audit_logger.configure(sample_every={"match": 10, "open": 10, "done": 10})
+        sampled, _ = orders_per_sec(product, orders)
+
+        logger.removeHandler(handler)
+        handler.close()
+
+    print("orders={} logs={}".format(args.orders, logs))
+    print("audit off:                    {:>9.0f} orders/s".format(off))
+    print("audit on, written inline:     {:>9.0f} orders/s".format(sync))
+    print("audit on, background thread:  {:>9.0f} orders/s ({} dropped, {:.2f}s to drain)".format(
+        background, dropped, drain))
+    print("audit on, inline, 1 in 10:    {:>9.0f} orders/s".format(sampled))
+
+
+if __name__ == "__main__":
+    main()
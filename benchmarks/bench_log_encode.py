@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import argparse
+import time
+from decimal import Decimal
+
+from matching.log import Log, OpenLog, DoneLog, MatchLog
+from matching.log_codec import JsonLogEncoder, BinaryLogEncoder
+from matching.order_book import BookOrder
+from models.types import Side, OrderType, TimeInForceType, DoneReason
+
+
+def new_logs(n: int) -> list:
+    # the mix of an order book where every taker fills one maker: open, match, done, done
+    logs = list()
+    for i in range(0, n, 4):
+        maker = BookOrder(i + 1, 1, Decimal("10000.00"), Decimal("1.000000"), Decimal("0.00"), Side.SideSell,
+                          OrderType.OrderTypeLimit, TimeInForceType.GoodTillCanceled)
+        taker = BookOrder(i + 2, 2, Decimal("10000.00"), Decimal("1.000000"), Decimal("0.00"), Side.SideBuy,
+                          OrderType.OrderTypeLimit, TimeInForceType.GoodTillCanceled)
+        logs.append(OpenLog(i + 1, "BTC-USD", maker))
+        logs.append(MatchLog(i + 2, "BTC-USD", i // 4 + 1, taker, maker, maker.price, maker.size))
+        logs.append(DoneLog(i + 3, "BTC-USD", maker, Decimal("0.000000"), DoneReason.DoneReasonFilled))
+        logs.append(DoneLog(i + 4, "BTC-USD", taker, Decimal("0.000000"), DoneReason.DoneReasonFilled))
+    return logs[:n]
+
+
+def measure(encode, logs: list, batch_size: int) -> (float, float):
+    start = time.perf_counter()
+    size = 0
+    for i in range(0, len(logs), batch_size):
+        size += sum(len(payload) for payload in encode(logs[i:i + batch_size]))
+    elapsed = time.perf_counter() - start
+    return len(logs) / elapsed, size / len(logs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="logs serialized per second")
+    parser.add_argument("--logs", type=int, default=200000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    logs = new_logs(args.logs)
+    encoders = [
+        ("Log.to_json_str", lambda batch: [Log.to_json_str(log).encode("utf8") for log in batch]),
+        ("JsonLogEncoder", JsonLogEncoder().encode),
+        ("BinaryLogEncoder", BinaryLogEncoder().encode),
+    ]
+    print("logs={} batch_size={}".format(args.logs, args.batch_size))
+    for name, encode in encoders:
+        rate, size = measure(encode, logs, args.batch_size)
+        print("{:<18} {:>12.0f} logs/s {:>8.1f} bytes/log".format(name, rate, size))
+
+
+if __name__ == "__main__":
+    main()
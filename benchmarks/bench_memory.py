@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import argparse
+import gc
+import tracemalloc
+from decimal import Decimal
+
+from matching.order_book import BookOrder, Depth
+from models.types import Side, OrderType, TimeInForceType
+
+
+class DictBookOrder(object):
+    # BookOrder as it was before __slots__, kept as the reference for the report
+    def __init__(self, order_id: int, user_id: int, price: Decimal,
+                 size: Decimal, funds: Decimal, side: Side, _type: OrderType,
+                 time_in_force: TimeInForceType):
+        self.order_id: int = order_id
+        self.user_id: int = user_id
+        self.price: Decimal = price
+        self.size: Decimal = size
+        self.funds: Decimal = funds
+        self.side: Side = side
+        self.type: OrderType = _type
+        self.time_in_force: TimeInForceType = time_in_force
+
+
+def bytes_per_order(order_class, n: int, levels: int, use_ticks: bool = False) -> float:
+    gc.collect()
+    tracemalloc.start()
+    depth = Depth(Side.SideSell)
+    if use_ticks:
+        prices = [10000 + i for i in range(levels)]
+    else:
+        prices = [Decimal(10000 + i).scaleb(-2) for i in range(levels)]
+    before = tracemalloc.get_traced_memory()[0]
+
+    for i in range(n):
+        # sizes and funds are parsed per order, so every order holds its own values
+        if use_ticks:
+            size, funds = 1000000 + i % 7, 0
+        else:
+            size, funds = Decimal("1.000000"), Decimal("0.00")
+        depth.add(order_class(i + 1, i % 1000, prices[i % levels], size, funds,
+                              Side.SideSell, OrderType.OrderTypeLimit, TimeInForceType.GoodTillCanceled))
+
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description="bytes per resting order of the order book")
+    parser.add_argument("--orders", type=int, default=100000)
+    parser.add_argument("--levels", type=int, default=1000)
+    args = parser.parse_args()
+
+    before = bytes_per_order(DictBookOrder, args.orders, args.levels)
+    after = bytes_per_order(BookOrder, args.orders, args.levels)
+    after_ticks = bytes_per_order(BookOrder, args.orders, args.levels, use_ticks=True)
+    print("orders={} levels={}".format(args.orders, args.levels))
+    print("__dict__ BookOrder:          {:.1f} bytes/order".format(before))
+    print("__slots__ BookOrder:         {:.1f} bytes/order ({:.1f}% saved)".format(
+        after, (before - after) * 100 / before))
+    print("__slots__ BookOrder, ticks:  {:.1f} bytes/order ({:.1f}% saved)".format(
+        after_ticks, (before - after_ticks) * 100 / before))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import argparse
+import asyncio
+import time
+from collections import namedtuple
+from decimal import Decimal
+
+from matching.kafka_order import KafkaOrderReader
+from models.models import Order, Product
+from models.types import Side, OrderType, TimeInForceType, OrderStatus
+
+Record = namedtuple("Record", ["offset", "value"])
+
+
+class MemoryConsumer(object):
+    # the records of the topic, returned in fetches of max_records as getmany does
+    def __init__(self, records: list):
+        self.records = records
+        self.pos = 0
+
+    async def fetch_messages(self, max_records: int, timeout_ms: int = 1000) -> list:
+        records = self.records[self.pos:self.pos + max_records]
+        self.pos += len(records)
+        return records
+
+
+def new_records(n: int) -> list:
+    records = list()
+    for i in range(n):
+        side = Side.SideBuy if i % 2 == 0 else Side.SideSell
+        order = Order(_id=i + 1, created_at=1695783003020967000, product_id="BTC-USD", user_id=i % 1000,
+                      client_oid="", price=Decimal(10000 + i % 100).scaleb(-2), size=Decimal("1.000000"),
+                      funds=Decimal("0.00"), _type=OrderType.OrderTypeLimit, side=side,
+                      time_in_force=TimeInForceType.GoodTillCanceled, status=OrderStatus.OrderStatusNew)
+        records.append(Record(i, Order.to_json_str(order).encode("utf8")))
+    return records
+
+
+async def fetch_all(records: list, product, max_records: int, decode_in_thread: bool) -> float:
+    reader = KafkaOrderReader(product_id="BTC-USD", brokers=["127.0.0.1:9092"], group_id="bench", product=product,
+                              max_records=max_records, decode_in_thread=decode_in_thread,
+                              consumer=MemoryConsumer(records))
+    start = time.perf_counter()
+    n = 0
+    while n < len(records):
+        n += len(await reader.fetch_orders())
+    return n / (time.perf_counter() - start)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="orders fetched and decoded per second")
+    parser.add_argument("--orders", type=int, default=200000)
+    parser.add_argument("--max-records", type=int, default=500)
+    args = parser.parse_args()
+
+    product = Product(_id="BTC-USD", base_currency="BTC", quote_currency="USD", base_scale=6, quote_scale=2)
+    records = new_records(args.orders)
+
+    print("orders={} max_records={}".format(args.orders, args.max_records))
+    for name, tick_product in (("decimal", None), ("ticks", product)):
+        for decode_in_thread in (False, True):
+            rate = await fetch_all(records, tick_product, args.max_records, decode_in_thread)
+            print("{:<8} decode_in_thread={:<5} {:>12.0f} orders/s".format(name, str(decode_in_thread), rate))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import argparse
+import random
+import time
+from decimal import Decimal
+
+from matching.engine import Snapshot
+from matching.order_book import BookOrder, OrderBook
+from matching.snapshot_codec import BinarySnapshotCodec
+from models.models import Product
+from models.types import Side, OrderType, TimeInForceType
+
+
+def new_order_book(product: Product, n: int, levels: int) -> OrderBook:
+    order_book = OrderBook(product, 0, 0)
+    rnd = random.Random(n)
+    for i in range(n):
+        # bids below 100.00 and asks above it, so nothing crosses
+        side = Side.SideBuy if i % 2 == 0 else Side.SideSell
+        offset = rnd.randrange(1, levels + 1)
+        price = Decimal(10000 - offset if side == Side.SideBuy else 10000 + offset).scaleb(-2)
+        order_book.depths[side].add(BookOrder(i + 1, i % 1000, price, Decimal("1.000000"), Decimal("0.00"), side,
+                                              OrderType.OrderTypeLimit, TimeInForceType.GoodTillCanceled))
+    return order_book
+
+
+def restore_per_order(product: Product, snapshot) -> OrderBook:
+    # restore as it was before the bulk load, one Depth.add per order
+    order_book = OrderBook(product, 0, 0)
+    for order in snapshot.orders:
+        order_book.depths[order.side].add(order)
+    return order_book
+
+
+def main():
+    parser = argparse.ArgumentParser(description="order book restore time versus book size")
+    parser.add_argument("--orders", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--levels", type=int, default=1000)
+    args = parser.parse_args()
+
+    product = Product(_id="BTC-USD", base_currency="BTC", quote_currency="USD", base_scale=6, quote_scale=2)
+    codec = BinarySnapshotCodec()
+    print("{:>10} {:>12} {:>12} {:>12} {:>12}".format("orders", "decode", "per-order", "bulk", "bulk+sort"))
+    for n in args.orders:
+        data = codec.encode(Snapshot(new_order_book(product, n, args.levels).snapshot(), 0))
+
+        start = time.perf_counter()
+        snapshot = codec.decode(data).order_book_snapshot
+        decode_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        restore_per_order(product, snapshot)
+        per_order_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        OrderBook(product, 0, 0).restore(snapshot)
+        bulk_time = time.perf_counter() - start
+
+        # a snapshot in time priority only, as written before the bulk load
+        snapshot.orders.sort(key=lambda order: order.order_id)
+        start = time.perf_counter()
+        OrderBook(product, 0, 0).restore(snapshot)
+        sort_time = time.perf_counter() - start
+
+        print("{:>10} {:>11.3f}s {:>11.3f}s {:>11.3f}s {:>11.3f}s".format(n, decode_time, per_order_time, bulk_time,
+                                                                         sort_time))
+
+
+if __name__ == "__main__":
+    main()
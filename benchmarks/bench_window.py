@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import argparse
+import json
+import random
+import time
+
+from utils.bitmap import TA
+from utils.utils import JsonEncoder
+from utils.window import Window, WindowException
+
+
+class ListWindow(object):
+    # Window as it was before the bytearray ring, a list of ints that is never cleared, kept as the
+    # reference for the report
+    def __init__(self, _min, _max):
+        self.min = _min
+        self.max = _max
+        self.cap = _max - _min
+        self.data = [0] * ((self.cap + 7) // 8)
+
+    def put(self, val):
+        i = val % self.cap
+        if val <= self.min:
+            raise WindowException("expired val {}".format(val))
+        elif val > self.max:
+            delta = val - self.max
+            self.min += delta
+            self.max += delta
+            self.data[i // 8] |= TA[i % 8]
+        elif self.data[i // 8] & TA[i % 8]:
+            raise WindowException("existed val {}".format(val))
+        else:
+            self.data[i // 8] |= TA[i % 8]
+
+
+def new_ids(pattern: str, n: int, cap: int) -> list:
+    rnd = random.Random(1)
+    ids = list()
+    val = 0
+    for _ in range(n):
+        if pattern == "sequential":
+            val += 1
+        elif pattern == "gaps":
+            # ids of the other products of a shared sequence
+            val += rnd.randint(1, 16)
+        else:
+            # mostly sequential, with a jump beyond the window now and then
+            val += 1 if rnd.random() < 0.999 else cap * 2
+        ids.append(val)
+
+    if pattern != "sequential":
+        # orders of concurrent gateways arrive slightly out of id order
+        for i in range(0, n, 32):
+            block = ids[i:i + 32]
+            rnd.shuffle(block)
+            ids[i:i + 32] = block
+    return ids
+
+
+def puts_per_sec(window, ids: list) -> (float, int):
+    rejected = 0
+    start = time.perf_counter()
+    for val in ids:
+        try:
+            window.put(val)
+        except WindowException:
+            rejected += 1
+    return len(ids) / (time.perf_counter() - start), rejected
+
+
+def main():
+    parser = argparse.ArgumentParser(description="order id window puts per second and snapshot size")
+    parser.add_argument("--ids", type=int, default=1000000)
+    parser.add_argument("--caps", type=str, default="10000,1000000")
+    args = parser.parse_args()
+
+    for cap in [int(cap) for cap in args.caps.split(",")]:
+        print("cap={} ids={}".format(cap, args.ids))
+        for pattern in ("sequential", "gaps", "jumps"):
+            ids = new_ids(pattern, args.ids, cap)
+            before, before_rejected = puts_per_sec(ListWindow(0, cap), ids)
+            after, after_rejected = puts_per_sec(Window(0, cap), ids)
+            # every id is new, a rejection is a stale bit of an earlier lap or an id expired by a jump
+            print("  {:<10}  list: {:>10.0f} puts/s {:>7} rejected   bytearray: {:>10.0f} puts/s {:>7} rejected".format(
+                pattern, before, before_rejected, after, after_rejected))
+
+        window = Window(0, cap)
+        legacy = json.dumps(list(window.bit_map.data))
+        print("  json window: {} bytes as a list of ints, {} bytes as base64; binary window: {} bytes".format(
+            len(legacy), len(json.dumps(window.bit_map.data, cls=JsonEncoder)), len(window.bit_map.data)))
+
+
+if __name__ == "__main__":
+    main()
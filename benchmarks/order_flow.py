@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import random
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from matching.order_book import OrderBook
+from models.models import Order, Product
+from models.types import Side, OrderType, TimeInForceType, OrderStatus
+from utils.utils import to_ticks
+
+# kinds of generated orders
+FLOW_LIMIT: str = "limit"
+FLOW_MARKET: str = "market"
+FLOW_CANCEL: str = "cancel"
+FLOW_IOC: str = "ioc"
+FLOW_FOK: str = "fok"
+FLOW_GTX: str = "gtx"
+
+# relative weights of the kinds, the weight of cancels grows with the book beyond its target depth
+DEFAULT_MIX: Dict[str, float] = {
+    FLOW_LIMIT: 0.50,
+    FLOW_MARKET: 0.05,
+    FLOW_CANCEL: 0.20,
+    FLOW_IOC: 0.15,
+    FLOW_FOK: 0.05,
+    FLOW_GTX: 0.05,
+}
+
+
+class OrderFlowGenerator(object):
+    """
+    Seeded synthetic order flow of a product: the same seed and parameters give the same orders.
+
+    Limit prices are drawn around the mid price with a gaussian offset of price_sigma ticks, biased
+    to the passive side so that most limit orders rest and the others cross. Cancels pick one of
+    the resting orders the generator knows of, and are drawn more often while the book is above
+    target_depth, so the book stays around that depth. The orders are decimals, or integer ticks
+    with use_ticks, like the orders read by the engine.
+    """
+
+    def __init__(self, product: Product, seed: int = 1, mix: Optional[Dict[str, float]] = None,
+                 mid: Decimal = Decimal("100.00"), price_sigma: float = 50, target_depth: int = 10000,
+                 max_size: int = 10, use_ticks: bool = False):
+        self.product: Product = product
+        self.rnd: random.Random = random.Random(seed)
+        self.mix: Dict[str, float] = dict(DEFAULT_MIX if mix is None else mix)
+        self.kinds: List[str] = list(self.mix.keys())
+        self.mid_ticks: int = to_ticks(mid, product.quote_scale)
+        self.price_sigma: float = price_sigma
+        self.target_depth: int = max(target_depth, 1)
+        self.max_size: int = max_size
+        self.use_ticks: bool = use_ticks
+        self.next_id: int = 1
+        # orders that may be resting, as far as the generator knows, for the cancels
+        self.live: List[Order] = list()
+
+    def new_order(self, side: Side, price_ticks: int, size: int, funds_ticks: int = 0,
+                  _type: OrderType = OrderType.OrderTypeLimit,
+                  time_in_force: TimeInForceType = TimeInForceType.GoodTillCanceled) -> Order:
+        product = self.product
+        if self.use_ticks:
+            # size in ticks of base_scale, funds in ticks of base_scale + quote_scale
+            price = price_ticks
+            size = to_ticks(Decimal(size), product.base_scale)
+            funds = funds_ticks * 10 ** product.base_scale
+        else:
+            price = Decimal(price_ticks).scaleb(-product.quote_scale)
+            size = Decimal(size)
+            funds = Decimal(funds_ticks).scaleb(-product.quote_scale)
+
+        order = Order(_id=self.next_id, created_at=self.next_id, product_id=product.id,
+                      user_id=self.rnd.randrange(1, 1001), client_oid="", price=price, size=size, funds=funds,
+                      _type=_type, side=side, time_in_force=time_in_force, status=OrderStatus.OrderStatusNew)
+        self.next_id += 1
+        return order
+
+    def limit_price(self, side: Side, passive: bool) -> int:
+        offset = abs(int(self.rnd.gauss(0, self.price_sigma)))
+        if passive:
+            offset += 1
+        else:
+            offset = -offset
+        # bids below the mid, asks above it when passive
+        ticks = self.mid_ticks - offset if side == Side.SideBuy else self.mid_ticks + offset
+        return max(ticks, 1)
+
+    def next_kind(self) -> str:
+        if len(self.live) == 0:
+            return FLOW_LIMIT
+        weights = [self.mix[kind] * (len(self.live) / self.target_depth if kind == FLOW_CANCEL else 1)
+                   for kind in self.kinds]
+        return self.rnd.choices(self.kinds, weights)[0]
+
+    def cancel(self) -> Order:
+        i = self.rnd.randrange(len(self.live))
+        order = self.live[i]
+        self.live[i] = self.live[-1]
+        self.live.pop()
+        return Order(_id=order.id, created_at=order.created_at, product_id=order.product_id,
+                     user_id=order.user_id, client_oid="", price=order.price, size=order.size, funds=order.funds,
+                     _type=order.type, side=order.side, time_in_force=order.time_in_force,
+                     status=OrderStatus.OrderStatusCancelling)
+
+    def next_order(self) -> Order:
+        kind = self.next_kind()
+        if kind == FLOW_CANCEL:
+            return self.cancel()
+
+        side = Side.SideBuy if self.rnd.random() < 0.5 else Side.SideSell
+        size = self.rnd.randint(1, self.max_size)
+        if kind == FLOW_MARKET:
+            if side == Side.SideBuy:
+                # market buys spend funds
+                return self.new_order(side, 0, 0, funds_ticks=size * self.mid_ticks, _type=OrderType.OrderTypeMarket)
+            return self.new_order(side, 0, size, _type=OrderType.OrderTypeMarket)
+
+        time_in_force = {
+            FLOW_LIMIT: TimeInForceType.GoodTillCanceled,
+            FLOW_IOC: TimeInForceType.ImmediateOrCancel,
+            FLOW_FOK: TimeInForceType.FillOrKill,
+            FLOW_GTX: TimeInForceType.GoodTillCrossing,
+        }[kind]
+        # limit and GTX orders mostly rest, IOC and FOK orders mostly take
+        passive = self.rnd.random() < (0.8 if kind in (FLOW_LIMIT, FLOW_GTX) else 0.2)
+        order = self.new_order(side, self.limit_price(side, passive), size, time_in_force=time_in_force)
+        if kind in (FLOW_LIMIT, FLOW_GTX):
+            self.live.append(order)
+        return order
+
+    def orders(self, n: int) -> List[Order]:
+        return [self.next_order() for _ in range(n)]
+
+    def book_orders(self, n: int) -> List[Order]:
+        # n resting limit orders that do not cross, to build a book of that depth
+        orders = list()
+        for i in range(n):
+            side = Side.SideBuy if i % 2 == 0 else Side.SideSell
+            order = self.new_order(side, self.limit_price(side, True), self.rnd.randint(1, self.max_size))
+            self.live.append(order)
+            orders.append(order)
+        return orders
+
+
+def apply(order_book: OrderBook, order: Order) -> list:
+    # the order book operation of an order, as Engine.apply_order
+    if order.status == OrderStatus.OrderStatusCancelling:
+        return order_book.cancel_order(order)
+    return order_book.apply_order(order)
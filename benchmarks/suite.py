@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import argparse
+import gc
+import json
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+from benchmarks.order_flow import OrderFlowGenerator, apply
+from matching.engine import Snapshot
+from matching.order_book import OrderBook
+from models.models import Product
+from utils.window import Window
+
+PERCENTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+class Case(object):
+    # a benchmark: setup() builds its input, run(input) returns the latency of each operation in ns
+    def __init__(self, name: str, setup: Callable, run: Callable):
+        self.name: str = name
+        self.setup: Callable = setup
+        self.run: Callable = run
+
+
+def timed(operation: Callable, items) -> List[int]:
+    latencies = list()
+    perf_counter_ns = time.perf_counter_ns
+    for item in items:
+        start = perf_counter_ns()
+        operation(item)
+        latencies.append(perf_counter_ns() - start)
+    return latencies
+
+
+def new_book(product: Product, args) -> OrderBook:
+    order_book = OrderBook(product, 0, 0, use_ticks=args.ticks)
+    generator = OrderFlowGenerator(product, seed=args.seed, target_depth=args.depth, use_ticks=args.ticks)
+    for order in generator.book_orders(args.depth):
+        order_book.apply_order(order)
+    return order_book
+
+
+def new_cases(product: Product, args) -> List[Case]:
+    def setup_flow():
+        generator = OrderFlowGenerator(product, seed=args.seed, target_depth=args.depth, use_ticks=args.ticks)
+        order_book = OrderBook(product, 0, 0, use_ticks=args.ticks)
+        for order in generator.book_orders(args.depth):
+            order_book.apply_order(order)
+        return order_book, generator.orders(args.orders)
+
+    def run_flow(flow):
+        order_book, orders = flow
+        return timed(lambda order: apply(order_book, order), orders)
+
+    def setup_cancel():
+        generator = OrderFlowGenerator(product, seed=args.seed, target_depth=args.depth, use_ticks=args.ticks)
+        order_book = OrderBook(product, 0, 0, use_ticks=args.ticks)
+        for order in generator.book_orders(args.depth):
+            order_book.apply_order(order)
+        return order_book, [generator.cancel() for _ in range(args.depth)]
+
+    def run_cancel(flow):
+        order_book, orders = flow
+        return timed(order_book.cancel_order, orders)
+
+    def run_snapshot(order_book):
+        return timed(lambda _: order_book.snapshot(), range(args.repeat))
+
+    def setup_restore():
+        return new_book(product, args).snapshot()
+
+    def run_restore(snapshot):
+        return timed(lambda _: OrderBook(product, 0, 0, use_ticks=args.ticks).restore(snapshot), range(args.repeat))
+
+    def setup_json():
+        return Snapshot(new_book(product, args).snapshot(), 0)
+
+    def run_json(snapshot):
+        return timed(lambda _: Snapshot.from_json_str(Snapshot.to_json_str(snapshot)), range(args.repeat))
+
+    def setup_window():
+        # mostly increasing ids with gaps
+        generator = OrderFlowGenerator(product, seed=args.seed)
+        ids = list()
+        val = 0
+        for _ in range(args.orders):
+            val += generator.rnd.randint(1, 4)
+            ids.append(val)
+        return Window(0, 10000), ids
+
+    def run_window(window_ids):
+        window, ids = window_ids
+        return timed(window.put, ids)
+
+    return [
+        Case("apply_order", setup_flow, run_flow),
+        Case("cancel_order", setup_cancel, run_cancel),
+        Case("snapshot", lambda: new_book(product, args), run_snapshot),
+        Case("restore", setup_restore, run_restore),
+        Case("snapshot_json", setup_json, run_json),
+        Case("window_put", setup_window, run_window),
+    ]
+
+
+def percentile(latencies: List[int], p: float) -> int:
+    # latencies sorted ascending
+    return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+
+def run_case(case: Case, memory: bool) -> dict:
+    gc.collect()
+    latencies = sorted(case.run(case.setup()))
+    total = sum(latencies)
+    result = {
+        "ops": len(latencies),
+        "ops_per_sec": len(latencies) * 1e9 / total if total > 0 else 0.0,
+        "max_us": latencies[-1] / 1000,
+    }
+    for p in PERCENTILES:
+        result["p{:g}_us".format(p * 100)] = percentile(latencies, p) / 1000
+
+    if memory:
+        # a second run under tracemalloc, which slows it down too much to be timed
+        gc.collect()
+        tracemalloc.start()
+        case.run(case.setup())
+        result["peak_kb"] = tracemalloc.get_traced_memory()[1] / 1024
+        tracemalloc.stop()
+    return result
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], threshold: float) -> List[str]:
+    # the cases slower than the baseline by more than threshold, or with a peak memory that grew as much
+    regressions = list()
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        if result["ops_per_sec"] < base["ops_per_sec"] * (1 - threshold):
+            regressions.append("{}: {:.0f} ops/s, baseline {:.0f} ops/s".format(
+                name, result["ops_per_sec"], base["ops_per_sec"]))
+        if "peak_kb" in result and "peak_kb" in base and result["peak_kb"] > base["peak_kb"] * (1 + threshold):
+            regressions.append("{}: peak {:.0f} KiB, baseline {:.0f} KiB".format(
+                name, result["peak_kb"], base["peak_kb"]))
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="order book benchmark suite on a seeded order flow")
+    parser.add_argument("--orders", type=int, default=100000, help="orders of the flow and window ids")
+    parser.add_argument("--depth", type=int, default=10000, help="resting orders of the book")
+    parser.add_argument("--repeat", type=int, default=20, help="runs of the snapshot and restore cases")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--ticks", action="store_true", help="run the order book in tick mode")
+    parser.add_argument("--cases", type=str, default="", help="comma separated names, all cases by default")
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="skip the peak memory runs")
+    parser.add_argument("--save", type=str, help="write the results to this json file")
+    parser.add_argument("--baseline", type=str, help="compare with the results of this json file")
+    parser.add_argument("--threshold", type=float, default=0.1, help="tolerated slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    product = Product(_id="BTC-USD", base_currency="BTC", quote_currency="USD", base_scale=6, quote_scale=2)
+    names = [name for name in args.cases.split(",") if name]
+    cases = [case for case in new_cases(product, args) if not names or case.name in names]
+
+    results = dict()
+    print("{:<14} {:>8} {:>11} {:>9} {:>9} {:>9} {:>9} {:>10} {:>10}".format(
+        "case", "ops", "ops/s", "p50 us", "p90 us", "p99 us", "p99.9 us", "max us", "peak KiB"))
+    for case in cases:
+        result = run_case(case, args.memory)
+        results[case.name] = result
+        print("{:<14} {:>8} {:>11.0f} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f} {:>10.1f} {:>10}".format(
+            case.name, result["ops"], result["ops_per_sec"], result["p50_us"], result["p90_us"], result["p99_us"],
+            result["p99.9_us"], result["max_us"],
+            "{:.0f}".format(result["peak_kb"]) if "peak_kb" in result else "-"))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print("REGRESSION {}".format(regression))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
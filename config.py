@@ -7,6 +7,67 @@ base_currency = "BTC"
 quote_currency = "USD"
 base_scale = 6
 quote_scale = 2
+# products hosted by one process, each a dict of id, base_currency, quote_currency, base_scale and
+# quote_scale. Empty for the single product above.
+products = []
+# interval in seconds of the per-product stats log, 0 disables it
+stats_interval = 60
+# metrics in the Prometheus text format: served on http://metrics_host:metrics_port/metrics, 0 disables
+# it, and/or written to metrics_file every metrics_interval seconds, "" disables it. The workers
+# serve on metrics_port + their index, and {worker} in metrics_file is replaced by their index.
+metrics_host = "127.0.0.1"
+metrics_port = 0
+metrics_file = ""
+metrics_interval = 10
+# worker processes the products are spread over, 0 runs them all in this process. Products are
+# placed by consistent hashing unless pinned here, as product_id -> worker index.
+workers = 0
+worker_assignment = {}
+# workers report their health every health_interval seconds, and are restarted when they exit or
+# do not report for health_timeout seconds
+health_interval = 5
+health_timeout = 30
+restart_backoff = 1
+# match on integer ticks of base_scale/quote_scale instead of decimals
+use_ticks = False
+# number of the latest order ids remembered to reject duplicate orders, snapshotted as cap / 8 bytes
+order_id_window_cap = 10000
+
+# maximum number of orders applied in one batch
+max_batch_size = 1000
+# group commit of the logs: time a group may wait for more logs, its maximum size, and the number
+# of groups sent to kafka without waiting for their acknowledgements
+commit_linger_ms = 2
+commit_max_records = 1000
+commit_max_bytes = 1048576
+commit_max_in_flight = 4
+
+# snapshot store, redis or file
+snapshot_store = "redis"
+# directory and number of kept full snapshots of the file snapshot store
+snapshot_dir = "./snapshots"
+snapshot_generations = 3
+# snapshot format, json or binary
+snapshot_format = "json"
+# seconds without a new snapshot before one is requested
+snapshot_interval = 30
+# number of delta snapshots written between full snapshots, 0 writes full snapshots only
+snapshot_delta_chain = 0
+# a full snapshot is written once the deltas since the last one hold more orders than this
+snapshot_delta_max_changes = 100000
+
+# level-2 market data feed on the matching_l2_<product> topic, published as the logs are committed,
+# with a full depth checkpoint every market_data_checkpoint_interval seconds
+market_data = False
+market_data_checkpoint_interval = 10
+
+# audit log of the fetched orders and the match/open/done logs, written by a background thread
+# through a ring of audit_ring_size records. audit_levels overrides the level of an event type
+# (fetch: DEBUG, match/open/done: INFO), audit_sample_every writes one of every n events of a type,
+# e.g. {"match": 10}
+audit_ring_size = 65536
+audit_levels = {}
+audit_sample_every = {}
 
 # redis
 redis_ip = "127.0.0.1"
@@ -14,4 +75,11 @@ redis_port = 6379
 
 # kafka
 kafka_brokers = ["127.0.0.1:9092"]
-group_id = "order-reader-{}-group".format(product_id)
+# format of the logs on the matching_message_<product> topic, json or binary
+log_format = "json"
+# consumer group of the order consumer shared by the products of a host, {worker} is replaced by the
+# index of the worker, so each worker is assigned all the partitions of its own products
+group_id = "order-reader-host-{worker}-group"
+# maximum number of orders per fetch, and whether they are decoded in a worker thread
+fetch_max_records = 500
+fetch_decode_in_thread = False
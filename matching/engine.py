@@ -4,25 +4,98 @@ import asyncio
 import json
 import logging
 import sys
+import time
 from asyncio import Queue, wait, FIRST_COMPLETED, wait_for, gather
 from decimal import Decimal
-from typing import Optional, List
+from collections import deque
+from typing import Optional, List, Union, Deque, Tuple
 
 from matching.kafka_log import KafkaLogStore
 from matching.kafka_order import KafkaOrderReader
 from matching.log import Log
-from matching.order_book import OrderBookSnapshot, BookOrder, OrderBook
+from matching.market_data import MarketDataPublisher
+from matching.order_book import OrderBookSnapshot, OrderBookDelta, OrderBookCapture, BookOrder, OrderBook, \
+    ORDER_ID_WINDOW_CAP
 from models.models import OrderException, Product, Order
 from models.types import OrderType, Side, TimeInForceType, OrderStatus
+from utils.audit import audit, AUDIT_FETCH
+from utils.metrics import Histogram
 from utils.utils import JsonEncoder
 from utils.window import Window
 
 
+def parse_number(v):
+    if isinstance(v, int):
+        return v
+    return Decimal(v)
+
+
+def book_order_from_dict(order_dict: dict) -> BookOrder:
+    order_id = int(order_dict.get("order_id"))
+    user_id = int(order_dict.get("user_id"))
+    # books in tick mode are stored with integer ticks
+    price = parse_number(order_dict.get("price"))
+    size = parse_number(order_dict.get("size"))
+    funds = parse_number(order_dict.get("funds"))
+
+    _type = order_dict.get("type")
+    if _type == "limit":
+        order_type = OrderType.OrderTypeLimit
+    elif _type == "market":
+        order_type = OrderType.OrderTypeMarket
+    else:
+        raise OrderException("invalid OrderType")
+
+    side = order_dict.get("side")
+    if side == "buy":
+        order_side = Side.SideBuy
+    elif side == "sell":
+        order_side = Side.SideSell
+    else:
+        raise OrderException("invalid Side")
+
+    time_in_force = order_dict.get("time_in_force")
+    if time_in_force == "GTC":
+        order_time_in_force = TimeInForceType.GoodTillCanceled
+    elif time_in_force == "IOC":
+        order_time_in_force = TimeInForceType.ImmediateOrCancel
+    elif time_in_force == "GTX":
+        order_time_in_force = TimeInForceType.GoodTillCrossing
+    elif time_in_force == "FOK":
+        order_time_in_force = TimeInForceType.FillOrKill
+    else:
+        raise OrderException("invalid TimeInForceType")
+
+    return BookOrder(order_id=order_id, user_id=user_id, price=price,
+                     size=size, funds=funds, side=order_side,
+                     _type=order_type, time_in_force=order_time_in_force)
+
+
 class Snapshot(object):
-    def __init__(self, order_book_snapshot: Optional[OrderBookSnapshot], order_offset: int):
-        self.order_book_snapshot: Optional[OrderBookSnapshot] = order_book_snapshot
+    def __init__(self, order_book_snapshot: Optional[Union[OrderBookSnapshot, OrderBookDelta, OrderBookCapture]],
+                 order_offset: int):
+        # a full snapshot of the order book, or a delta to the previous snapshot. Between the applier
+        # and run_snapshots it is the OrderBookCapture of either.
+        self.order_book_snapshot: Optional[Union[OrderBookSnapshot, OrderBookDelta, OrderBookCapture]] = \
+            order_book_snapshot
         self.order_offset: int = order_offset
 
+    def is_delta(self) -> bool:
+        if isinstance(self.order_book_snapshot, OrderBookCapture):
+            return self.order_book_snapshot.base_log_seq is not None
+        return isinstance(self.order_book_snapshot, OrderBookDelta)
+
+    @staticmethod
+    def merge(snapshot, newer):
+        # fold a newer snapshot into a snapshot, a delta is merged into its base
+        if not newer.is_delta():
+            return newer
+        if snapshot.is_delta():
+            order_book_snapshot = snapshot.order_book_snapshot.merge(newer.order_book_snapshot)
+        else:
+            order_book_snapshot = snapshot.order_book_snapshot.apply_delta(newer.order_book_snapshot)
+        return Snapshot(order_book_snapshot=order_book_snapshot, order_offset=newer.order_offset)
+
     @staticmethod
     def to_json_str(snapshot):
         return json.dumps(vars(snapshot), cls=JsonEncoder)
@@ -43,47 +116,8 @@ class Snapshot(object):
         order_id_window_dict = order_book_snapshot_dict.get("order_id_window")
 
         # parse orders
-        orders = list()
         orders_list = list() if orders_list is None else orders_list
-        for order_dict in orders_list:
-            order_id = int(order_dict.get("order_id"))
-            user_id = int(order_dict.get("user_id"))
-            price = Decimal(order_dict.get("price"))
-            size = Decimal(order_dict.get("size"))
-            funds = Decimal(order_dict.get("funds"))
-
-            _type = order_dict.get("type")
-            if _type == "limit":
-                order_type = OrderType.OrderTypeLimit
-            elif _type == "market":
-                order_type = OrderType.OrderTypeMarket
-            else:
-                raise OrderException("invalid OrderType")
-
-            side = order_dict.get("side")
-            if side == "buy":
-                order_side = Side.SideBuy
-            elif side == "sell":
-                order_side = Side.SideSell
-            else:
-                raise OrderException("invalid Side")
-
-            time_in_force = order_dict.get("time_in_force")
-            if time_in_force == "GTC":
-                order_time_in_force = TimeInForceType.GoodTillCanceled
-            elif time_in_force == "IOC":
-                order_time_in_force = TimeInForceType.ImmediateOrCancel
-            elif time_in_force == "GTX":
-                order_time_in_force = TimeInForceType.GoodTillCrossing
-            elif time_in_force == "FOK":
-                order_time_in_force = TimeInForceType.FillOrKill
-            else:
-                raise OrderException("invalid TimeInForceType")
-
-            book_order = BookOrder(order_id=order_id, user_id=user_id, price=price,
-                                   size=size, funds=funds, side=order_side,
-                                   _type=order_type, time_in_force=order_time_in_force)
-            orders.append(book_order)
+        orders = [book_order_from_dict(order_dict) for order_dict in orders_list]
 
         # parse order_id_window
         window_min = int(order_id_window_dict.get("min"))
@@ -93,6 +127,14 @@ class Snapshot(object):
         order_id_window = Window.from_raw(_min=window_min, _max=window_max,
                                           _cap=window_cap, bitmap_data=window_bitmap_data)
 
+        if "base_log_seq" in order_book_snapshot_dict:
+            base_log_seq = int(order_book_snapshot_dict.get("base_log_seq"))
+            removed = [int(order_id) for order_id in order_book_snapshot_dict.get("removed")]
+            order_book_delta = OrderBookDelta(product_id=product_id, base_log_seq=base_log_seq, orders=orders,
+                                              removed=removed, trade_seq=trade_seq, log_seq=log_seq,
+                                              order_id_window=order_id_window)
+            return Snapshot(order_book_snapshot=order_book_delta, order_offset=order_offset)
+
         order_book_snapshot = OrderBookSnapshot(product_id=product_id, orders=orders,
                                                 trade_seq=trade_seq, log_seq=log_seq,
                                                 order_id_window=order_id_window)
@@ -100,19 +142,61 @@ class Snapshot(object):
 
 
 class OffsetOrder(object):
-    def __init__(self, offset: int, order: Order):
+    __slots__ = ("offset", "order", "fetched_ns")
+
+    def __init__(self, offset: int, order: Order, fetched_ns: int = 0):
         self.offset: int = offset
         self.order: Order = order
+        # perf_counter_ns of the fetch of the order, 0 if unknown
+        self.fetched_ns: int = fetched_ns
+
+
+class EngineStats(object):
+    # counters of an engine, read by the host of the engine for its per-product metrics
+    __slots__ = ("fetched", "orders", "batches", "logs", "apply_ns", "committed_seq", "snapshots", "captures",
+                 "capture_ns", "max_capture_ns", "fetch_to_apply", "apply", "apply_to_commit", "log_store",
+                 "snapshot_materialize", "snapshot_store")
+
+    def __init__(self):
+        # orders put in order_chan by the fetcher, and applied
+        self.fetched: int = 0
+        self.orders: int = 0
+        self.batches: int = 0
+        self.logs: int = 0
+        # time spent applying orders
+        self.apply_ns: int = 0
+        # seq of the last acknowledged log
+        self.committed_seq: int = 0
+        self.snapshots: int = 0
+        # snapshots captured by the applier, the total and the longest time it paused for them
+        self.captures: int = 0
+        self.capture_ns: int = 0
+        self.max_capture_ns: int = 0
+        # latencies in ns: from the fetch of an order to the end of its batch, of the batches, from the end
+        # of a batch to the acknowledgement of its logs, from the send of a log group to its acknowledgement,
+        # and of the materialization and the store of the snapshots
+        self.fetch_to_apply: Histogram = Histogram()
+        self.apply: Histogram = Histogram()
+        self.apply_to_commit: Histogram = Histogram()
+        self.log_store: Histogram = Histogram()
+        self.snapshot_materialize: Histogram = Histogram()
+        self.snapshot_store: Histogram = Histogram()
 
 
 class Engine(object):
     def __init__(self, product: Product, order_reader: KafkaOrderReader, log_store: KafkaLogStore,
-                 snapshot_store):
+                 snapshot_store, use_ticks: bool = False, snapshot_delta_chain: int = 0,
+                 snapshot_delta_max_changes: int = 100000, max_batch_size: int = 1000, commit_linger_ms: float = 2,
+                 commit_max_records: int = 1000, commit_max_bytes: int = 1048576, commit_max_in_flight: int = 4,
+                 market_data: Optional[MarketDataPublisher] = None, order_id_window_cap: int = ORDER_ID_WINDOW_CAP,
+                 snapshot_interval: float = 30):
         # productId is the unique identifier of an engine, and each product corresponds to an engine
         self.product_id: str = product.id
         # The orderBook held by the engine, corresponding to the product, needs
-        # a snapshot and is restored from the snapshot
-        self.order_book: OrderBook = OrderBook(product, 0, 0)
+        # a snapshot and is restored from the snapshot. In tick mode the order reader and the
+        # log store must be created with the product as well.
+        self.order_book: OrderBook = OrderBook(product, 0, 0, use_ticks=use_ticks,
+                                               order_id_window_cap=order_id_window_cap)
         # for reading order
         self.order_reader: KafkaOrderReader = order_reader
         # Read the starting offset of the order, which will be restored from the snapshot when it is first started
@@ -124,31 +208,83 @@ class Engine(object):
         # The read order will be written to chan, and the offset of the order needs
         # to be carried when writing the order.
         self.order_chan: Queue = Queue(maxsize=10000)
-        # The log is written to the queue, and all the logs to be written need to enter the chan and wait
+        # The logs are written to the queue, one list of logs per batch of applied orders, and all the logs
+        # to be written need to enter the chan and wait
         self.log_chan: Queue = Queue(maxsize=10000)
+        # maximum number of orders applied per wakeup of the applier, bounds the latency of a batch
+        self.max_batch_size: int = max(max_batch_size, 1)
+        # group commit of the logs, see run_committer
+        self.commit_linger_ms: float = commit_linger_ms
+        self.commit_max_records: int = max(commit_max_records, 1)
+        self.commit_max_bytes: int = commit_max_bytes
+        self.commit_max_in_flight: int = max(commit_max_in_flight, 1)
         # To initiate a snapshot request, you need to carry the offset of the last snapshot
         self.snapshot_req_chan: Queue = Queue(maxsize=32)
         # The snapshot is completely ready, you need to ensure that all data before the snapshot has been committed
         self.snapshot_approve_req_chan: Queue = Queue(maxsize=32)
         # The snapshot data is ready and all data before the snapshot has been committed
         self.snapshot_chan: Queue = Queue(maxsize=32)
+        # Up to snapshot_delta_chain delta snapshots are written after a full snapshot, until the deltas
+        # hold more than snapshot_delta_max_changes orders. 0 disables delta snapshots.
+        self.snapshot_delta_chain: int = snapshot_delta_chain
+        self.snapshot_delta_max_changes: int = snapshot_delta_max_changes
+        # log seq of the last snapshot taken, the base of the next delta. None until the first full snapshot.
+        self.snapshot_log_seq: Optional[int] = None
+        self.snapshot_chain_len: int = 0
+        self.snapshot_chain_changes: int = 0
+        # time the applier paused to capture the last snapshot
+        self.snapshot_pause_ns: int = 0
+        # seconds without a stored snapshot before a new one is requested
+        self.snapshot_interval: float = snapshot_interval
+        self.stats: EngineStats = EngineStats()
+        # (seq of the last log, perf_counter_ns at the end of the batch) of the batches put in log_chan,
+        # until their logs are acknowledged
+        self.applied_batches: Deque[Tuple[int, int]] = deque()
+        # level-2 feed built from the price levels changed by each batch, None if it is not published
+        self.market_data: Optional[MarketDataPublisher] = market_data
+        if market_data is not None:
+            self.order_book.track_levels()
+        if snapshot_delta_chain > 0:
+            self.order_book.track_changes()
 
     def restore(self, snapshot: Snapshot):
         self.order_offset = snapshot.order_offset
         self.order_book.restore(snapshot=snapshot.order_book_snapshot)
 
     async def initialize_snapshot(self):
-        # Get the latest snapshot and use the snapshot for recovery
+        # Get the latest snapshot and the deltas written after it, and use them for recovery
         snapshot = await self.snapshot_store.get_latest()
         if snapshot is not None:
+            for delta in await self.snapshot_store.get_deltas():
+                snapshot = Snapshot.merge(snapshot, delta)
             self.restore(snapshot=snapshot)
 
+    def take_snapshot(self) -> OrderBookCapture:
+        # Take a delta snapshot when possible, and compact into a new full snapshot once the chain
+        # of deltas is too long or too large
+        changes = self.order_book.pending_changes()
+        if self.snapshot_log_seq is not None and self.snapshot_chain_len < self.snapshot_delta_chain and \
+                self.snapshot_chain_changes + changes <= self.snapshot_delta_max_changes:
+            capture = self.order_book.capture(base_log_seq=self.snapshot_log_seq)
+            self.snapshot_chain_len += 1
+            self.snapshot_chain_changes += changes
+        else:
+            capture = self.order_book.capture()
+            self.snapshot_chain_len = 0
+            self.snapshot_chain_changes = 0
+
+        self.snapshot_log_seq = capture.log_seq
+        return capture
+
     async def start(self):
         task1 = asyncio.create_task(self.run_fetcher())
         task2 = asyncio.create_task(self.run_applier())
         task3 = asyncio.create_task(self.run_committer())
         task4 = asyncio.create_task(self.run_snapshots())
-        await gather(task1, task2, task3, task4)
+        tasks = [task1, task2, task3, task4]
+        if self.market_data is not None:
+            tasks.append(asyncio.create_task(self.market_data.run()))
+        await gather(*tasks)
 
     # Responsible for continuously pulling orders and writing to chan
     async def run_fetcher(self):
@@ -164,128 +300,228 @@ class Engine(object):
 
         while True:
             try:
-                offset, order = await self.order_reader.fetch_order()
-                logging.info("fetch_order: {}".format(Order.to_json_str(order)))
-                await self.order_chan.put(OffsetOrder(offset=offset, order=order))
+                offset_orders = await self.order_reader.fetch_orders()
             except Exception as ex:
                 logging.error("{}".format(str(ex)))
+                continue
+
+            fetched_ns = time.perf_counter_ns()
+            for offset, order in offset_orders:
+                audit(AUDIT_FETCH, order, self.order_book.tick_product)
+                await self.order_chan.put(OffsetOrder(offset=offset, order=order, fetched_ns=fetched_ns))
+                self.stats.fetched += 1
 
-    # Get the order from the local queue, execute the orderBook operation, and
+    def apply_order(self, order: Order) -> List[Log]:
+        # execute the orderBook operation of an order, and return the logs it generated
+        logs: List[Log] = list()
+        if order.type == OrderType.OrderTypeMassCancel:
+            logs = self.order_book.mass_cancel(order)
+        elif order.status == OrderStatus.OrderStatusCancelling:
+            logs = self.order_book.cancel_order(order)
+        else:
+            # the time in force (GTC, IOC, GTX, FOK) is applied within the single matching pass
+            logs = self.order_book.apply_order(order)
+        return logs
+
+    def record_fetch_to_apply(self, offset_orders: List[OffsetOrder], end: int):
+        # the orders of a fetch share their fetch time, and are recorded at once
+        record = self.stats.fetch_to_apply.record
+        fetched_ns = 0
+        count = 0
+        for offset_order in offset_orders:
+            if offset_order.fetched_ns != fetched_ns:
+                if fetched_ns > 0:
+                    record(end - fetched_ns, count)
+                fetched_ns = offset_order.fetched_ns
+                count = 0
+            count += 1
+        if fetched_ns > 0:
+            record(end - fetched_ns, count)
+
+    # Get the orders from the local queue, execute the orderBook operations, and
     # respond to the snapshot request at the same time
     async def run_applier(self):
         order_offset: int = 0
+        # the pending gets are kept across iterations, a new one is only started once the previous one completed
+        order_task = asyncio.ensure_future(self.order_chan.get())
+        snapshot_task = asyncio.ensure_future(self.snapshot_req_chan.get())
 
         while True:
-            task1 = self.order_chan.get()
-            task2 = self.snapshot_req_chan.get()
-            done, pending = await wait({task1, task2}, return_when=FIRST_COMPLETED)
-            for t in done:
-                result = t.result()
-                if isinstance(result, OffsetOrder):
-                    offset_order: OffsetOrder = result
-                    logs: List[Log] = list()
-                    if offset_order.order.status == OrderStatus.OrderStatusCancelling:
-                        logs = self.order_book.cancel_order(offset_order.order)
-                    else:
-                        # IOC
-                        if offset_order.order.time_in_force == TimeInForceType.ImmediateOrCancel:
-                            logs = self.order_book.apply_order(offset_order.order)
-                            # cancel the rest size
-                            ioc_logs = self.order_book.cancel_order(offset_order.order)
-                            if len(ioc_logs) != 0:
-                                logs.extend(ioc_logs)
-                        elif offset_order.order.time_in_force == TimeInForceType.GoodTillCrossing:
-                            # GTX
-                            if self.order_book.is_order_will_not_match(offset_order.order):
-                                logs = self.order_book.apply_order(offset_order.order)
-                            else:
-                                logs = self.order_book.nullify_order(offset_order.order)
-                        elif offset_order.order.time_in_force == TimeInForceType.FillOrKill:
-                            # FOK
-                            if self.order_book.is_order_will_full_match(offset_order.order):
-                                logs = self.order_book.apply_order(offset_order.order)
-                            else:
-                                logs = self.order_book.nullify_order(offset_order.order)
-                        elif offset_order.order.time_in_force == TimeInForceType.GoodTillCanceled:
-                            # GTC
-                            logs = self.order_book.apply_order(offset_order.order)
-
-                    # Write the log generated by orderBook to chan for persistence
-                    for log in logs:
-                        await self.log_chan.put(log)
-
-                    # The offset of the record order is used to determine whether a snapshot needs to be taken
-                    order_offset = offset_order.offset
-
-                elif isinstance(result, Snapshot):
-                    snapshot: Snapshot = result
-                    # Receive a snapshot request and determine whether it is really necessary to perform a snapshot
-                    delta = order_offset - snapshot.order_offset
-                    if delta <= 1000:
-                        break
-
-                    logging.info(
-                        "should take snapshot: {} {}-[{}]-{}->".format(self.product_id, snapshot.order_offset, delta,
-                                                                       order_offset))
-
-                    # Execute the snapshot, and write the snapshot data to the approval chan
-                    snapshot.order_book_snapshot = self.order_book.snapshot()
-                    snapshot.order_offset = order_offset
-                    await self.snapshot_approve_req_chan.put(snapshot)
-
-                break
-
-    # Persist the log generated by orderBook, and need to respond to snapshot approval
+            await wait({order_task, snapshot_task}, return_when=FIRST_COMPLETED)
+
+            if order_task.done():
+                # drain the orders already in chan, up to max_batch_size, and apply them in one go
+                offset_orders: List[OffsetOrder] = [order_task.result()]
+                while len(offset_orders) < self.max_batch_size and not self.order_chan.empty():
+                    offset_orders.append(self.order_chan.get_nowait())
+                order_task = asyncio.ensure_future(self.order_chan.get())
+
+                start = time.perf_counter_ns()
+                logs: List[Log] = list()
+                for offset_order in offset_orders:
+                    logs.extend(self.apply_order(offset_order.order))
+                end = time.perf_counter_ns()
+                self.stats.apply_ns += end - start
+                self.stats.apply.record(end - start)
+                self.record_fetch_to_apply(offset_orders, end)
+                self.stats.orders += len(offset_orders)
+                self.stats.batches += 1
+                self.stats.logs += len(logs)
+
+                if self.market_data is not None:
+                    self.market_data.on_batch(self.order_book)
+
+                # Write the logs generated by orderBook to chan as one batch for persistence
+                if len(logs) > 0:
+                    self.applied_batches.append((logs[-1].get_seq(), end))
+                    await self.log_chan.put(logs)
+
+                # The offset of the record order is used to determine whether a snapshot needs to be taken
+                order_offset = offset_orders[-1].offset
+
+                # give the other engines of the loop a turn after each batch
+                await asyncio.sleep(0)
+
+            if snapshot_task.done():
+                snapshot: Snapshot = snapshot_task.result()
+                snapshot_task = asyncio.ensure_future(self.snapshot_req_chan.get())
+
+                # Receive a snapshot request and determine whether it is really necessary to perform a snapshot
+                delta = order_offset - snapshot.order_offset
+                if delta <= 1000:
+                    continue
+
+                logging.info(
+                    "should take snapshot: {} {}-[{}]-{}->".format(self.product_id, snapshot.order_offset, delta,
+                                                                   order_offset))
+
+                # Capture the snapshot, and write it to the approval chan. It is serialized by run_snapshots.
+                start = time.perf_counter_ns()
+                snapshot.order_book_snapshot = self.take_snapshot()
+                snapshot.order_offset = order_offset
+                self.snapshot_pause_ns = time.perf_counter_ns() - start
+                self.stats.captures += 1
+                self.stats.capture_ns += self.snapshot_pause_ns
+                self.stats.max_capture_ns = max(self.stats.max_capture_ns, self.snapshot_pause_ns)
+                logging.info("snapshot captured: product={} LogSeq={} pause={}us".format(
+                    self.product_id, snapshot.order_book_snapshot.log_seq, self.snapshot_pause_ns // 1000))
+                await self.snapshot_approve_req_chan.put(snapshot)
+
+    # Persist the log batches generated by orderBook, and need to respond to snapshot approval.
+    # The logs are group-committed: batches from the applier are gathered for up to commit_linger_ms,
+    # commit_max_records logs or commit_max_bytes bytes, and up to commit_max_in_flight groups are sent
+    # without waiting for their acknowledgements. The committed seq only advances over contiguous acks.
     async def run_committer(self):
+        loop = asyncio.get_running_loop()
+        # seq of the acknowledged logs, snapshots are approved on it
         seq: int = self.order_book.log_seq
-        pending_snapshot: Optional[Snapshot] = None
-        logs: List[Log] = list()
+        # seq of the last log buffered or sent, used to discard duplicate logs
+        last_seq: int = seq
+        # unapproved snapshots, in the order of their log seq
+        pending_snapshots: Deque[Snapshot] = deque()
+        # the group being gathered
+        payloads: List[bytes] = list()
+        payload_bytes: int = 0
+        deadline: float = 0
+        # (seq of the last log of the group, future of its acknowledgement, perf_counter_ns of its send),
+        # in the order they were sent
+        in_flight: Deque[Tuple[int, asyncio.Future, int]] = deque()
+        log_task = asyncio.ensure_future(self.log_chan.get())
+        snapshot_task = asyncio.ensure_future(self.snapshot_approve_req_chan.get())
+        if self.market_data is not None:
+            # the logs up to the restored seq are committed
+            self.market_data.on_commit(seq)
+
+        def ack(acked_seq: int) -> int:
+            # advance over the acknowledged groups at the head of in_flight
+            now = time.perf_counter_ns()
+            while len(in_flight) > 0 and in_flight[0][1].done():
+                group_seq, future, sent_ns = in_flight.popleft()
+                try:
+                    future.result()
+                except Exception as ex:
+                    logging.fatal("{}".format(ex))
+                    sys.exit()
+                acked_seq = group_seq
+                self.stats.log_store.record(now - sent_ns)
+            applied_batches = self.applied_batches
+            while len(applied_batches) > 0 and applied_batches[0][0] <= acked_seq:
+                self.stats.apply_to_commit.record(now - applied_batches.popleft()[1])
+            return acked_seq
 
         while True:
-            task1 = self.log_chan.get()
-            task2 = self.snapshot_approve_req_chan.get()
-            done, pending = await wait({task1, task2}, return_when=FIRST_COMPLETED)
-            for t in done:
-                result = t.result()
-                if isinstance(result, Log):
-                    log: Log = result
-                    # discard duplicate log
-                    if log.get_seq() <= seq:
-                        logging.info("discard log seq={}".format(seq))
-                        break
-
-                    # chan is not empty and buffer is not full, continue read.
-                    if self.log_chan.qsize() > 0 and len(logs) < 100:
-                        break
-
-                    try:
-                        # store log, clean buffer
-                        await self.log_store.store(logs)
-                        logs.clear()
-                    except Exception as ex:
-                        logging.fatal("{}".format(ex))
-                        sys.exit()
-
-                    # approve pending snapshot
-                    if pending_snapshot is not None and seq >= pending_snapshot.order_book_snapshot.log_seq:
-                        await self.snapshot_chan.put(pending_snapshot)
-                        pending_snapshot = None
-
-                elif isinstance(result, Snapshot):
-                    snapshot: Snapshot = result
-                    # The written seq has reached or exceeded the snapshot seq, and the snapshot request is approved
-                    if seq >= snapshot.order_book_snapshot.log_seq:
-                        await self.snapshot_chan.put(snapshot)
-                        pending_snapshot = None
-                        break
-
-                    # There are currently unapproved snapshots, but there are new snapshot requests, discard the old ones
-                    if pending_snapshot is not None:
+            tasks = {log_task, snapshot_task}
+            if len(in_flight) > 0:
+                tasks.add(in_flight[0][1])
+            timeout = None
+            if len(payloads) > 0:
+                timeout = max(deadline - loop.time(), 0)
+            await wait(tasks, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            if log_task.done():
+                batches: List[List[Log]] = [log_task.result()]
+                # take the batches already in chan as long as the group is not full
+                while not self.log_chan.empty() and len(payloads) + sum(len(batch) for batch in batches) < \
+                        self.commit_max_records:
+                    batches.append(self.log_chan.get_nowait())
+                log_task = asyncio.ensure_future(self.log_chan.get())
+
+                for batch in batches:
+                    logs: List[Log] = list()
+                    for log in batch:
+                        # discard duplicate log
+                        if log.get_seq() <= last_seq:
+                            logging.info("discard log seq={}".format(log.get_seq()))
+                            continue
+                        logs.append(log)
+                        last_seq = log.get_seq()
+
+                    if len(logs) == 0:
+                        continue
+                    if len(payloads) == 0:
+                        deadline = loop.time() + self.commit_linger_ms / 1000
+                    for payload in self.log_store.encode(logs):
+                        payloads.append(payload)
+                        payload_bytes += len(payload)
+
+            if snapshot_task.done():
+                snapshot: Snapshot = snapshot_task.result()
+                snapshot_task = asyncio.ensure_future(self.snapshot_approve_req_chan.get())
+
+                # There are currently unapproved snapshots, but there is a new full snapshot request, discard
+                # the old ones. Deltas are kept, as each delta is based on the previous snapshot.
+                if not snapshot.is_delta():
+                    while len(pending_snapshots) > 0:
+                        discarded = pending_snapshots.popleft()
                         logging.info("discard snapshot request (seq={}), new one (seq={}) received".format(
-                            pending_snapshot.order_book_snapshot.log_seq, snapshot.order_book_snapshot.log_seq))
-                    pending_snapshot = snapshot
-
-                break
+                            discarded.order_book_snapshot.log_seq, snapshot.order_book_snapshot.log_seq))
+                        discarded.order_book_snapshot.release()
+                pending_snapshots.append(snapshot)
+
+            # send the group once it is full or has lingered long enough
+            if len(payloads) > 0 and (len(payloads) >= self.commit_max_records or
+                                      payload_bytes >= self.commit_max_bytes or loop.time() >= deadline):
+                while len(in_flight) >= self.commit_max_in_flight:
+                    await wait({in_flight[0][1]})
+                    seq = ack(seq)
+                try:
+                    future = await self.log_store.send(payloads)
+                except Exception as ex:
+                    logging.fatal("{}".format(ex))
+                    sys.exit()
+                in_flight.append((last_seq, future, time.perf_counter_ns()))
+                payloads = list()
+                payload_bytes = 0
+
+            seq = ack(seq)
+            if self.market_data is not None and seq != self.stats.committed_seq:
+                # the level-2 feed follows the acknowledged logs
+                self.market_data.on_commit(seq)
+            self.stats.committed_seq = seq
+
+            # The acknowledged seq has reached or exceeded the snapshot seq, and the snapshot request is approved
+            while len(pending_snapshots) > 0 and seq >= pending_snapshots[0].order_book_snapshot.log_seq:
+                await self.snapshot_chan.put(pending_snapshots.popleft())
 
     # Initiate snapshot requests regularly, and be responsible for persisting approved snapshots
     async def run_snapshots(self):
@@ -295,12 +531,24 @@ class Engine(object):
         while True:
             task1 = self.snapshot_chan.get()
             try:
-                snapshot: Snapshot = await wait_for(task1, timeout=30)
-                # store snapshot
+                snapshot: Snapshot = await wait_for(task1, timeout=self.snapshot_interval)
+                # materialize the captured snapshot in a worker thread while the applier goes on
+                capture: OrderBookCapture = snapshot.order_book_snapshot
+                start = time.perf_counter_ns()
+                try:
+                    snapshot.order_book_snapshot = await asyncio.to_thread(capture.materialize)
+                finally:
+                    capture.release()
+                self.stats.snapshot_materialize.record(time.perf_counter_ns() - start)
+
+                # store snapshot, with its serialization
+                start = time.perf_counter_ns()
                 await self.snapshot_store.store(snapshot=snapshot)
+                self.stats.snapshot_store.record(time.perf_counter_ns() - start)
+                self.stats.snapshots += 1
 
-                logging.info("new snapshot stored: product={} OrderOffset={} LogSeq={}".format(
-                    self.product_id, snapshot.order_offset, snapshot.order_book_snapshot.log_seq))
+                logging.info("new snapshot stored: product={} OrderOffset={} LogSeq={} Delta={}".format(
+                    self.product_id, snapshot.order_offset, snapshot.order_book_snapshot.log_seq, snapshot.is_delta()))
 
                 # update offset for next snapshot request
                 order_offset = snapshot.order_offset
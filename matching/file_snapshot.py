@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import asyncio
+import logging
+import mmap
+import os
+import re
+import struct
+import zlib
+from typing import Optional, List, Dict
+
+from matching.engine import Snapshot
+from matching.snapshot_codec import BinarySnapshotCodec
+
+FILE_SNAPSHOT_PREFIX: str = "matching_snapshot_"
+FILE_SNAPSHOT_FOOTER_MAGIC: bytes = b"OBSF"
+# magic, payload length, crc32 of the payload
+FOOTER = struct.Struct("<4sQI")
+
+
+class FileSnapshotException(Exception):
+    pass
+
+
+class ChecksumWriter(object):
+    # file writer that keeps the length and the crc32 of what was written
+    def __init__(self, f):
+        self.f = f
+        self.length = 0
+        self.crc = 0
+
+    def write(self, data):
+        self.f.write(data)
+        self.length += len(data)
+        self.crc = zlib.crc32(data, self.crc)
+
+
+class FileSnapshotStore(object):
+    """
+    Snapshots on local disk, one file per snapshot:
+
+        matching_snapshot_<product>.<log_seq>.snap                  full snapshot
+        matching_snapshot_<product>.<base_log_seq>.<log_seq>.delta  delta on the snapshot or delta of base_log_seq
+
+    The deltas of a full snapshot form a chain: each delta is based on the log seq of the previous
+    one. Files are written to a temp file, fsynced and renamed, and end with a checksum footer. The
+    latest `generations` full snapshots are kept with their chains of deltas. On restore the file is
+    memory-mapped and decoded from the mapping.
+    """
+
+    def __init__(self, product_id: str, directory: str, generations: int = 3, codec=None):
+        self.product_id = product_id
+        self.directory = directory
+        self.generations = max(generations, 1)
+        # BinarySnapshotCodec or JsonSnapshotCodec
+        self.codec = BinarySnapshotCodec() if codec is None else codec
+        self.prefix = "".join([FILE_SNAPSHOT_PREFIX, product_id, "."])
+        self.snapshot_pattern = re.compile(r"^{}(\d+)\.snap$".format(re.escape(self.prefix)))
+        self.delta_pattern = re.compile(r"^{}(\d+)\.(\d+)\.delta$".format(re.escape(self.prefix)))
+        # log seq of the snapshot returned by get_latest, the base of get_deltas
+        self.latest_log_seq: Optional[int] = None
+        os.makedirs(directory, exist_ok=True)
+
+    async def store(self, snapshot: Snapshot):
+        await asyncio.to_thread(self.store_sync, snapshot)
+
+    async def get_latest(self) -> Optional[Snapshot]:
+        return await asyncio.to_thread(self.get_latest_sync)
+
+    async def get_deltas(self) -> List[Snapshot]:
+        return await asyncio.to_thread(self.get_deltas_sync)
+
+    def store_sync(self, snapshot: Snapshot):
+        order_book_snapshot = snapshot.order_book_snapshot
+        if snapshot.is_delta():
+            name = "{}{:020d}.{:020d}.delta".format(self.prefix, order_book_snapshot.base_log_seq,
+                                                    order_book_snapshot.log_seq)
+        else:
+            name = "{}{:020d}.snap".format(self.prefix, order_book_snapshot.log_seq)
+
+        path = os.path.join(self.directory, name)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            writer = ChecksumWriter(f)
+            self.codec.encode_to(snapshot, writer)
+            f.write(FOOTER.pack(FILE_SNAPSHOT_FOOTER_MAGIC, writer.length, writer.crc))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self.fsync_directory()
+
+        if not snapshot.is_delta():
+            self.prune()
+
+    def get_latest_sync(self) -> Optional[Snapshot]:
+        # the newest full snapshot that can be read, older generations are tried if it is damaged
+        for log_seq in reversed(self.snapshot_seqs()):
+            path = os.path.join(self.directory, "{}{:020d}.snap".format(self.prefix, log_seq))
+            try:
+                snapshot = self.read(path)
+            except Exception as ex:
+                logging.error("skip snapshot {}: {}".format(path, ex))
+                continue
+            self.latest_log_seq = log_seq
+            return snapshot
+        return None
+
+    def get_deltas_sync(self) -> List[Snapshot]:
+        # the chain of deltas of the latest snapshot in order, up to the first one that can not be read
+        deltas = list()
+        if self.latest_log_seq is None:
+            return deltas
+
+        for name in self.delta_chain(self.latest_log_seq, self.delta_names()):
+            path = os.path.join(self.directory, name)
+            try:
+                deltas.append(self.read(path))
+            except Exception as ex:
+                logging.error("skip delta snapshots from {}: {}".format(path, ex))
+                break
+        return deltas
+
+    def delta_names(self) -> Dict[int, List[tuple]]:
+        # (log seq, file name) of the deltas, by their base log seq
+        names: Dict[int, List[tuple]] = dict()
+        for name in os.listdir(self.directory):
+            match = self.delta_pattern.match(name)
+            if match is not None:
+                names.setdefault(int(match.group(1)), list()).append((int(match.group(2)), name))
+        return names
+
+    @staticmethod
+    def delta_chain(log_seq: int, names: Dict[int, List[tuple]]) -> List[str]:
+        # the file names of the deltas from the snapshot of log_seq, each based on the previous one,
+        # up to the first gap
+        chain = list()
+        while log_seq in names:
+            # a single delta is written on each seq, the newest one is taken otherwise
+            next_log_seq, name = max(names[log_seq])
+            chain.append(name)
+            if next_log_seq <= log_seq:
+                # a delta without logs ends the chain, as nothing can be based on it but itself
+                break
+            log_seq = next_log_seq
+        return chain
+
+    def read(self, path: str) -> Snapshot:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < FOOTER.size:
+                raise FileSnapshotException("snapshot file {} is too short".format(path))
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                with memoryview(mm) as view:
+                    magic, length, crc = FOOTER.unpack_from(view, size - FOOTER.size)
+                    if magic != FILE_SNAPSHOT_FOOTER_MAGIC or length != size - FOOTER.size:
+                        raise FileSnapshotException("invalid footer of snapshot file {}".format(path))
+
+                    with view[:length] as payload:
+                        if zlib.crc32(payload) != crc:
+                            raise FileSnapshotException("checksum mismatch of snapshot file {}".format(path))
+
+                        # the decode error is not re-raised from its traceback, which would keep views
+                        # of the mapping alive and fail to close it
+                        error = None
+                        try:
+                            return self.codec.decode(payload)
+                        except Exception as ex:
+                            error = str(ex)
+                        raise FileSnapshotException("can not decode snapshot file {}: {}".format(path, error))
+
+    def snapshot_seqs(self) -> List[int]:
+        seqs = list()
+        for name in os.listdir(self.directory):
+            match = self.snapshot_pattern.match(name)
+            if match is not None:
+                seqs.append(int(match.group(1)))
+        return sorted(seqs)
+
+    def prune(self):
+        # remove the full snapshots older than the kept generations, and the deltas that are not in
+        # the chain of a kept snapshot
+        seqs = self.snapshot_seqs()
+        if len(seqs) <= self.generations:
+            return
+
+        kept = seqs[-self.generations:]
+        names = self.delta_names()
+        chained = set()
+        for log_seq in kept:
+            chained.update(self.delta_chain(log_seq, names))
+        for log_seq in seqs[:-self.generations]:
+            os.remove(os.path.join(self.directory, "{}{:020d}.snap".format(self.prefix, log_seq)))
+        for base_names in names.values():
+            for _, name in base_names:
+                if name not in chained:
+                    os.remove(os.path.join(self.directory, name))
+
+    def fsync_directory(self):
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import asyncio
+import json
+import struct
+from typing import List, Optional, Iterable
+
+from matching.log import Log
+from matching.log_codec import new_log_encoder, decode_binary_log
+from matching.memory import Record
+from models.models import Product
+
+# a message of a binary order dump: offset and length of the message, then the message
+ORDER_RECORD_HEADER = struct.Struct("<qI")
+# a log of a binary log file: length of the encoded log, then the log
+LOG_RECORD_HEADER = struct.Struct("<I")
+
+
+class FileStoreException(Exception):
+    pass
+
+
+def read_order_file(path: str, binary: Optional[bool] = None) -> List[Record]:
+    # The messages of an order file: json lines, one order message per line at the offset of its
+    # line, or a binary dump of the order topic. The format follows the extension if not given.
+    if binary is None:
+        binary = not path.endswith((".json", ".jsonl"))
+    with open(path, "rb") as f:
+        data = f.read()
+
+    if not binary:
+        return [Record(offset, line) for offset, line in enumerate(data.splitlines()) if line.strip()]
+
+    records = list()
+    position = 0
+    while position < len(data):
+        if position + ORDER_RECORD_HEADER.size > len(data):
+            raise FileStoreException("truncated order record at {} of {}".format(position, path))
+        offset, length = ORDER_RECORD_HEADER.unpack_from(data, position)
+        position += ORDER_RECORD_HEADER.size
+        if position + length > len(data):
+            raise FileStoreException("truncated order record at {} of {}".format(position, path))
+        records.append(Record(offset, data[position:position + length]))
+        position += length
+    return records
+
+
+def write_order_file(path: str, messages: Iterable[bytes], binary: Optional[bool] = None):
+    # write order messages, the json of Order.to_json_str, at offsets 0, 1...
+    if binary is None:
+        binary = not path.endswith((".json", ".jsonl"))
+    with open(path, "wb") as f:
+        for offset, message in enumerate(messages):
+            if binary:
+                f.write(ORDER_RECORD_HEADER.pack(offset, len(message)))
+                f.write(message)
+            else:
+                f.write(message)
+                f.write(b"\n")
+
+
+class FileLogStore(object):
+    """
+    Writes the encoded logs to a file, as they would be sent to the log topic: json lines, or
+    length-prefixed binary logs. The logs are acknowledged once written to the file buffer.
+    """
+
+    def __init__(self, path: str, product: Optional[Product] = None, log_format: str = "json"):
+        self.encoder = new_log_encoder(log_format, product)
+        self.binary: bool = log_format != "json"
+        self.f = open(path, "wb")
+
+    async def start(self):
+        pass
+
+    def encode(self, logs: List[Log]) -> list:
+        return self.encoder.encode(logs)
+
+    async def send(self, payloads: list) -> asyncio.Future:
+        f = self.f
+        for payload in payloads:
+            if self.binary:
+                f.write(LOG_RECORD_HEADER.pack(len(payload)))
+                f.write(payload)
+            else:
+                f.write(payload)
+                f.write(b"\n")
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(None)
+        return future
+
+    async def store(self, logs: List[Log]):
+        await (await self.send(self.encode(logs)))
+
+    def close(self):
+        self.f.close()
+
+
+def read_log_file(path: str, log_format: str = "json") -> List[dict]:
+    # the logs of a file written by FileLogStore, as their json dicts
+    with open(path, "rb") as f:
+        data = f.read()
+    if log_format == "json":
+        return [json.loads(line) for line in data.splitlines() if line.strip()]
+
+    logs = list()
+    position = 0
+    while position < len(data):
+        length, = LOG_RECORD_HEADER.unpack_from(data, position)
+        position += LOG_RECORD_HEADER.size
+        logs.append(decode_binary_log(data[position:position + length]))
+        position += length
+    return logs
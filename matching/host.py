@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import asyncio
+import logging
+import time
+from asyncio import gather
+from typing import List, Dict, Optional
+
+from matching.engine import Engine
+from matching.file_snapshot import FileSnapshotStore
+from matching.kafka_log import KafkaLogStore
+from matching.kafka_order import KafkaOrderReader, TOPIC_ORDER_PREFIX
+from matching.market_data import MarketDataPublisher, KafkaMarketDataSink
+from matching.redis_snapshot import RedisSnapshotStore
+from matching.snapshot_codec import new_snapshot_codec
+from models.models import Product
+from utils.audit import audit_logger
+from utils.kafka import KafkaProducer, SharedKafkaConsumer
+from utils.metrics import MetricsRegistry, MetricsExporter, Metric, METRIC_COUNTER, METRIC_GAUGE, METRIC_HISTOGRAM
+from utils.redis import RedisClient
+
+
+def product_from_dict(product_dict: dict) -> Product:
+    return Product(_id=product_dict["id"], base_currency=product_dict["base_currency"],
+                   quote_currency=product_dict["quote_currency"], base_scale=int(product_dict["base_scale"]),
+                   quote_scale=int(product_dict["quote_scale"]))
+
+
+def load_products(settings) -> List[Product]:
+    # the products of the config, or the single product of the product_id, base_currency... constants
+    products = getattr(settings, "products", None)
+    if products:
+        return [product_from_dict(product_dict) for product_dict in products]
+    return [Product(_id=settings.product_id, base_currency=settings.base_currency,
+                    quote_currency=settings.quote_currency, base_scale=settings.base_scale,
+                    quote_scale=settings.quote_scale)]
+
+
+class EngineHost(object):
+    """
+    Runs one Engine per product on a shared event loop. The engines share one Kafka consumer for
+    the order topics, one Kafka producer for the log topics and one Redis client for the snapshots.
+
+    Fairness: the consumer pauses the partitions of a product with a full buffer, and every
+    applier yields to the loop after each batch of at most max_batch_size orders, so a busy
+    market takes turns with the others instead of starving them.
+    """
+
+    def __init__(self, products: List[Product], settings, worker_id: int = 0):
+        self.products: List[Product] = products
+        # the config module, or any object with the same attributes
+        self.settings = settings
+        # index of the worker process running the host, the metrics of each worker get their own port and file
+        self.worker_id: int = worker_id
+        self.engines: Dict[str, Engine] = dict()
+        self.consumer: Optional[SharedKafkaConsumer] = None
+        self.log_writer: Optional[KafkaProducer] = None
+        self.redis_client: Optional[RedisClient] = None
+        self.metrics: MetricsRegistry = MetricsRegistry()
+        self.metrics.register(self.collect_metrics)
+        self.metrics_exporter: MetricsExporter = MetricsExporter(self.metrics)
+
+    def new_snapshot_store(self, product: Product):
+        settings = self.settings
+        codec = new_snapshot_codec(settings.snapshot_format)
+        if settings.snapshot_store == "file":
+            return FileSnapshotStore(product_id=product.id, directory=settings.snapshot_dir,
+                                     generations=settings.snapshot_generations, codec=codec)
+
+        if self.redis_client is None:
+            self.redis_client = RedisClient(ip=settings.redis_ip, port=settings.redis_port)
+        return RedisSnapshotStore(product_id=product.id, ip=settings.redis_ip, port=settings.redis_port,
+                                  codec=codec, redis_client=self.redis_client)
+
+    def new_engine(self, product: Product) -> Engine:
+        settings = self.settings
+        tick_product = product if settings.use_ticks else None
+
+        log_store = KafkaLogStore(product_id=product.id, brokers=settings.kafka_brokers, product=tick_product,
+                                  log_format=settings.log_format, log_writer=self.log_writer)
+        order_reader = KafkaOrderReader(product_id=product.id, brokers=settings.kafka_brokers, product=tick_product,
+                                        max_records=settings.fetch_max_records,
+                                        decode_in_thread=settings.fetch_decode_in_thread,
+                                        consumer=self.consumer.topic_consumer(TOPIC_ORDER_PREFIX + product.id))
+
+        market_data = None
+        if settings.market_data:
+            market_data = MarketDataPublisher(product=product,
+                                              sink=KafkaMarketDataSink(product_id=product.id,
+                                                                       brokers=settings.kafka_brokers,
+                                                                       log_writer=self.log_writer),
+                                              use_ticks=settings.use_ticks,
+                                              checkpoint_interval=settings.market_data_checkpoint_interval)
+
+        return Engine(product=product, order_reader=order_reader, log_store=log_store,
+                      snapshot_store=self.new_snapshot_store(product), use_ticks=settings.use_ticks,
+                      snapshot_delta_chain=settings.snapshot_delta_chain,
+                      snapshot_delta_max_changes=settings.snapshot_delta_max_changes,
+                      max_batch_size=settings.max_batch_size, commit_linger_ms=settings.commit_linger_ms,
+                      commit_max_records=settings.commit_max_records, commit_max_bytes=settings.commit_max_bytes,
+                      commit_max_in_flight=settings.commit_max_in_flight, market_data=market_data,
+                      order_id_window_cap=settings.order_id_window_cap,
+                      snapshot_interval=settings.snapshot_interval)
+
+    async def start(self):
+        settings = self.settings
+        audit_logger.configure(ring_size=settings.audit_ring_size, levels=settings.audit_levels,
+                               sample_every=settings.audit_sample_every)
+        audit_logger.start()
+
+        self.log_writer = KafkaProducer(brokers=settings.kafka_brokers)
+        self.consumer = SharedKafkaConsumer(brokers=settings.kafka_brokers,
+                                            topics=[TOPIC_ORDER_PREFIX + product.id for product in self.products],
+                                            group_id=settings.group_id.format(worker=self.worker_id))
+        for product in self.products:
+            self.engines[product.id] = self.new_engine(product)
+
+        await self.log_writer.start()
+        await self.consumer.start()
+        for engine in self.engines.values():
+            await engine.initialize_snapshot()
+
+        tasks = [asyncio.create_task(engine.start()) for engine in self.engines.values()]
+        tasks.append(asyncio.create_task(self.run_stats()))
+        if settings.metrics_port > 0:
+            await self.metrics_exporter.start_server(settings.metrics_host, settings.metrics_port + self.worker_id)
+        if settings.metrics_file:
+            tasks.append(asyncio.create_task(self.metrics_exporter.run_file(
+                settings.metrics_file.format(worker=self.worker_id), settings.metrics_interval)))
+        await gather(*tasks)
+
+    def stats(self) -> Dict[str, dict]:
+        # per-product cumulative counters at the monotonic time of the call. It changes nothing, each
+        # reader computes its rates from the stats it read before (see stats_rates).
+        now = time.monotonic()
+        stats = dict()
+        for product_id, engine in self.engines.items():
+            engine_stats = engine.stats
+            stats[product_id] = {
+                "time": now,
+                "orders": engine_stats.orders,
+                "logs": engine_stats.logs,
+                "batches": engine_stats.batches,
+                "apply_ms": engine_stats.apply_ns / 1e6,
+                "committed_seq": engine_stats.committed_seq,
+                "snapshots": engine_stats.snapshots,
+                "snapshot_pause_us": engine.snapshot_pause_ns // 1000,
+                "queued_orders": engine.order_chan.qsize(),
+            }
+        return stats
+
+    def collect_metrics(self) -> List[Metric]:
+        # the metrics of each engine, labelled with its product
+        metrics = list()
+        for product_id, engine in self.engines.items():
+            labels = {"product": product_id}
+            engine_stats = engine.stats
+            order_book = engine.order_book
+            for name, help_text, value in (
+                    ("matching_orders_total", "orders applied", engine_stats.orders),
+                    ("matching_batches_total", "batches of orders applied", engine_stats.batches),
+                    ("matching_logs_total", "logs generated", engine_stats.logs),
+                    ("matching_matches_total", "matches", order_book.matches),
+                    ("matching_cancels_total", "resting orders cancelled on request", order_book.cancels),
+                    ("matching_snapshots_total", "snapshots stored", engine_stats.snapshots)):
+                metrics.append(Metric(name, METRIC_COUNTER, help_text, labels, value))
+
+            for name, help_text, value in (
+                    ("matching_order_chan_depth", "orders fetched and not applied", engine.order_chan.qsize()),
+                    ("matching_log_chan_depth", "log batches not taken by the committer", engine.log_chan.qsize()),
+                    ("matching_committed_seq", "seq of the last acknowledged log", engine_stats.committed_seq)):
+                metrics.append(Metric(name, METRIC_GAUGE, help_text, labels, value))
+            for side, depth in order_book.depths.items():
+                side_labels = dict(labels, side=side.value)
+                metrics.append(Metric("matching_book_orders", METRIC_GAUGE, "resting orders", side_labels,
+                                      len(depth.orders)))
+                metrics.append(Metric("matching_book_levels", METRIC_GAUGE, "price levels", side_labels,
+                                      len(depth.levels)))
+
+            for name, help_text, histogram in (
+                    ("matching_fetch_to_apply_seconds", "from the fetch of an order to the end of its batch",
+                     engine_stats.fetch_to_apply),
+                    ("matching_apply_seconds", "apply time of a batch of orders", engine_stats.apply),
+                    ("matching_apply_to_commit_seconds", "from the end of a batch to the acknowledgement of its logs",
+                     engine_stats.apply_to_commit),
+                    ("matching_log_store_seconds", "from the send of a log group to its acknowledgement",
+                     engine_stats.log_store),
+                    ("matching_snapshot_materialize_seconds", "materialization of a captured snapshot",
+                     engine_stats.snapshot_materialize),
+                    ("matching_snapshot_store_seconds", "serialization and store of a snapshot",
+                     engine_stats.snapshot_store)):
+                metrics.append(Metric(name, METRIC_HISTOGRAM, help_text, labels, histogram))
+        return metrics
+
+    @staticmethod
+    def stats_rates(stats: Dict[str, dict], last_stats: Dict[str, dict]) -> Dict[str, dict]:
+        # orders and logs per second of each product between two results of stats()
+        rates = dict()
+        for product_id, product_stats in stats.items():
+            last = last_stats.get(product_id)
+            if last is None:
+                rates[product_id] = {"orders_per_sec": 0.0, "logs_per_sec": 0.0}
+                continue
+            elapsed = max(product_stats["time"] - last["time"], 1e-9)
+            rates[product_id] = {
+                "orders_per_sec": (product_stats["orders"] - last["orders"]) / elapsed,
+                "logs_per_sec": (product_stats["logs"] - last["logs"]) / elapsed,
+            }
+        return rates
+
+    async def run_stats(self):
+        interval = self.settings.stats_interval
+        if interval <= 0:
+            return
+
+        last_stats = self.stats()
+        while True:
+            await asyncio.sleep(interval)
+            stats = self.stats()
+            rates = self.stats_rates(stats, last_stats)
+            last_stats = stats
+            for product_id, product_stats in stats.items():
+                logging.info("stats: product={} orders/s={:.0f} logs/s={:.0f} queued={} CommittedSeq={}".format(
+                    product_id, rates[product_id]["orders_per_sec"], rates[product_id]["logs_per_sec"],
+                    product_stats["queued_orders"], product_stats["committed_seq"]))
@@ -1,19 +1,37 @@
 #!/usr/bin/env python
 # encoding: utf-8
-from typing import List
+import asyncio
+from typing import List, Optional
 
 from matching.log import Log
+from matching.log_codec import new_log_encoder
+from models.models import Product
 from utils.kafka import KafkaProducer
 
 TOPIC_BOOK_MESSAGE_PREFIX = "matching_message_"
 
 
 class KafkaLogStore(object):
-    def __init__(self, product_id: str, brokers: List[str]):
+    def __init__(self, product_id: str, brokers: List[str], product: Optional[Product] = None,
+                 log_format: str = "json", log_writer: Optional[KafkaProducer] = None):
+        # set in tick mode, ticks are converted back to decimals of the product
+        self.product: Optional[Product] = product
+        # the format of the logs on the topic, json or binary, consumers of the topic must read it
+        self.encoder = new_log_encoder(log_format, product)
         self.topic = "".join([TOPIC_BOOK_MESSAGE_PREFIX, product_id])
-        self.log_writer = KafkaProducer(brokers=brokers)
+        # the producer may be shared by the log stores of several products
+        self.log_writer = KafkaProducer(brokers=brokers) if log_writer is None else log_writer
+
+    async def start(self):
+        await self.log_writer.start()
+
+    def encode(self, logs: List[Log]) -> list:
+        # one payload per log, views of a buffer of the batch
+        return self.encoder.encode(logs)
+
+    async def send(self, payloads: list) -> asyncio.Future:
+        # enqueue the encoded logs, the returned future is done once they are acknowledged
+        return await self.log_writer.send_batch(topic=self.topic, payloads=payloads)
 
     async def store(self, logs: List[Log]):
-        payloads = [Log.to_json_str(log).encode("utf8") for log in logs]
-        await self.log_writer.send_batch(topic=self.topic, payloads=payloads)
-        await self.log_writer.flush()
+        await (await self.send(self.encode(logs)))
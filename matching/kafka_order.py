@@ -1,17 +1,31 @@
 #!/usr/bin/env python
 # encoding: utf-8
-from typing import List
+import asyncio
+import logging
+from typing import List, Optional, Tuple
 
-from models.models import Order
+from models.models import Order, Product
 from utils.kafka import KafkaConsumer
 
 TOPIC_ORDER_PREFIX = "matching_order_"
 
 
 class KafkaOrderReader(object):
-    def __init__(self, product_id: str, brokers: List[str], group_id: str):
-        self.order_reader = KafkaConsumer(brokers=brokers, topic="".join([TOPIC_ORDER_PREFIX, product_id]),
-                                          group_id=group_id)
+    def __init__(self, product_id: str, brokers: List[str], group_id: Optional[str] = None,
+                 product: Optional[Product] = None, max_records: int = 500, decode_in_thread: bool = False,
+                 consumer=None):
+        # set in tick mode, orders are decoded to integer ticks of the product
+        self.product: Optional[Product] = product
+        # maximum number of orders returned by fetch_orders
+        self.max_records: int = max_records
+        # decode the orders in a worker thread, so decoding overlaps with matching
+        self.decode_in_thread: bool = decode_in_thread
+        # a KafkaConsumer of the order topic in group_id, or the TopicConsumer of a consumer shared by
+        # several readers
+        if consumer is None:
+            consumer = KafkaConsumer(brokers=brokers, topic="".join([TOPIC_ORDER_PREFIX, product_id]),
+                                     group_id=group_id)
+        self.order_reader = consumer
 
     async def start(self):
         await self.order_reader.start()
@@ -24,5 +38,25 @@ class KafkaOrderReader(object):
         if message is None:
             return 0, None
 
-        order = Order.from_json_str(json_str=message.value)
+        order = Order.from_json_str(json_str=message.value, product=self.product)
         return message.offset, order
+
+    async def fetch_orders(self) -> List[Tuple[int, Order]]:
+        # the orders available in one fetch, in offset order
+        messages = await self.order_reader.fetch_messages(max_records=self.max_records)
+        if len(messages) == 0:
+            return list()
+        if self.decode_in_thread:
+            return await asyncio.to_thread(self.decode, messages)
+        return self.decode(messages)
+
+    def decode(self, messages: list) -> List[Tuple[int, Order]]:
+        # invalid orders are logged and skipped, as fetch_order does for a single order
+        offset_orders = list()
+        for message in messages:
+            try:
+                offset_orders.append((message.offset, Order.from_json_str(json_str=message.value,
+                                                                          product=self.product)))
+            except Exception as ex:
+                logging.error("invalid order at offset {}: {}".format(message.offset, ex))
+        return offset_orders
@@ -4,9 +4,11 @@ import json
 from decimal import Decimal
 from enum import Enum
 import time
+from typing import Optional
 
+from models.models import Product
 from models.types import DoneReason, Side, TimeInForceType
-from utils.utils import JsonEncoder
+from utils.utils import JsonEncoder, from_ticks, slots_dict
 
 
 class LogType(Enum):
@@ -15,7 +17,24 @@ class LogType(Enum):
     LogTypeDone = "done"
 
 
+def log_vars(log, product: Optional[Product] = None) -> dict:
+    # In tick mode the logs carry integer ticks, they are converted back to decimals of the product
+    log_dict = slots_dict(log)
+    if product is None:
+        return log_dict
+
+    if "price" in log_dict:
+        log_dict["price"] = from_ticks(log_dict["price"], product.quote_scale)
+    if "size" in log_dict:
+        log_dict["size"] = from_ticks(log_dict["size"], product.base_scale)
+    if "remaining_size" in log_dict:
+        log_dict["remaining_size"] = from_ticks(log_dict["remaining_size"], product.base_scale)
+    return log_dict
+
+
 class Log(object):
+    __slots__ = ("type", "sequence", "product_id", "time")
+
     def __init__(self, _type: LogType, seq: int, product_id: str, _time: int):
         self.type: LogType = _type
         self.sequence: int = seq
@@ -26,11 +45,13 @@ class Log(object):
         return self.sequence
 
     @staticmethod
-    def to_json_str(log):
-        return json.dumps(vars(log), cls=JsonEncoder)
+    def to_json_str(log, product: Optional[Product] = None):
+        return json.dumps(log_vars(log, product), cls=JsonEncoder)
 
 
 class OpenLog(Log):
+    __slots__ = ("order_id", "user_id", "remaining_size", "price", "side", "time_in_force")
+
     def __init__(self, log_seq: int, product_id: str, taker_order):
         super().__init__(LogType.LogTypeOpen, log_seq, product_id, time.time_ns())
         self.order_id: int = taker_order.order_id
@@ -44,11 +65,13 @@ class OpenLog(Log):
         return self.sequence
 
     @staticmethod
-    def to_json_str(log):
-        return json.dumps(vars(log), cls=JsonEncoder)
+    def to_json_str(log, product: Optional[Product] = None):
+        return json.dumps(log_vars(log, product), cls=JsonEncoder)
 
 
 class DoneLog(Log):
+    __slots__ = ("order_id", "user_id", "remaining_size", "price", "reason", "side", "time_in_force")
+
     def __init__(self, log_seq: int, product_id: str, order, remaining_size: Decimal, reason: DoneReason):
         super().__init__(LogType.LogTypeDone, log_seq, product_id, time.time_ns())
         self.order_id: int = order.order_id
@@ -63,11 +86,14 @@ class DoneLog(Log):
         return self.sequence
 
     @staticmethod
-    def to_json_str(log):
-        return json.dumps(vars(log), cls=JsonEncoder)
+    def to_json_str(log, product: Optional[Product] = None):
+        return json.dumps(log_vars(log, product), cls=JsonEncoder)
 
 
 class MatchLog(Log):
+    __slots__ = ("trade_seq", "taker_order_id", "maker_order_id", "taker_user_id", "maker_user_id", "side", "price",
+                 "size", "taker_time_in_force", "maker_time_in_force")
+
     def __init__(self, log_seq: int, product_id: str, trade_seq: int, taker_order, maker_order,
                  price: Decimal, size: Decimal):
         super().__init__(LogType.LogTypeMatch, log_seq, product_id, time.time_ns())
@@ -86,5 +112,5 @@ class MatchLog(Log):
         return self.sequence
 
     @staticmethod
-    def to_json_str(log):
-        return json.dumps(vars(log), cls=JsonEncoder)
+    def to_json_str(log, product: Optional[Product] = None):
+        return json.dumps(log_vars(log, product), cls=JsonEncoder)
@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import json
+import struct
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from matching.log import LogType, OpenLog, DoneLog, MatchLog
+from models.models import Product
+from models.types import Side, TimeInForceType, DoneReason
+from utils.utils import from_ticks, decimal_to_raw, raw_to_decimal
+
+# enum codes of the binary log and snapshot formats
+SIDE_CODES: Dict[Side, int] = {Side.SideBuy: 1, Side.SideSell: 2}
+TIME_IN_FORCE_CODES: Dict[TimeInForceType, int] = {
+    TimeInForceType.GoodTillCanceled: 1,
+    TimeInForceType.ImmediateOrCancel: 2,
+    TimeInForceType.GoodTillCrossing: 3,
+    TimeInForceType.FillOrKill: 4,
+}
+DONE_REASON_CODES: Dict[DoneReason, int] = {DoneReason.DoneReasonFilled: 1, DoneReason.DoneReasonCancelled: 2}
+LOG_TYPE_CODES: Dict[LogType, int] = {LogType.LogTypeOpen: 1, LogType.LogTypeDone: 2, LogType.LogTypeMatch: 3}
+SIDES: Dict[int, Side] = {v: k for k, v in SIDE_CODES.items()}
+TIME_IN_FORCES: Dict[int, TimeInForceType] = {v: k for k, v in TIME_IN_FORCE_CODES.items()}
+DONE_REASONS: Dict[int, DoneReason] = {v: k for k, v in DONE_REASON_CODES.items()}
+LOG_TYPES: Dict[int, LogType] = {v: k for k, v in LOG_TYPE_CODES.items()}
+
+# the json strings of the enum values, as written by JsonEncoder
+ENUM_JSON: dict = {member: json.dumps(str(member.value)).encode("utf8")
+                   for enum in (Side, TimeInForceType, DoneReason) for member in enum}
+
+OPEN_LOG_JSON: bytes = (b'{"type": "open", "sequence": %d, "product_id": %b, "time": %d, "order_id": %d, '
+                        b'"user_id": %d, "remaining_size": %b, "price": %b, "side": %b, "time_in_force": %b}')
+DONE_LOG_JSON: bytes = (b'{"type": "done", "sequence": %d, "product_id": %b, "time": %d, "order_id": %d, '
+                        b'"user_id": %d, "remaining_size": %b, "price": %b, "reason": %b, "side": %b, '
+                        b'"time_in_force": %b}')
+MATCH_LOG_JSON: bytes = (b'{"type": "match", "sequence": %d, "product_id": %b, "time": %d, "trade_seq": %d, '
+                         b'"taker_order_id": %d, "maker_order_id": %d, "taker_user_id": %d, "maker_user_id": %d, '
+                         b'"side": %b, "price": %b, "size": %b, "taker_time_in_force": %b, '
+                         b'"maker_time_in_force": %b}')
+
+BINARY_LOG_VERSION: int = 1
+# version, log type, sequence, time, product_id length
+BINARY_LOG_HEADER: str = "<BBqqH{}s"
+# order_id, user_id, remaining_size, exponent, price, exponent, side, time_in_force
+BINARY_OPEN_LOG: str = "qqqbqbBB"
+# order_id, user_id, remaining_size, exponent, price, exponent, reason, side, time_in_force
+BINARY_DONE_LOG: str = "qqqbqbBBB"
+# trade_seq, taker_order_id, maker_order_id, taker_user_id, maker_user_id, side, price, exponent,
+# size, exponent, taker_time_in_force, maker_time_in_force
+BINARY_MATCH_LOG: str = "qqqqqBqbqbBB"
+BINARY_LOG_FORMATS: Dict[LogType, str] = {
+    LogType.LogTypeOpen: BINARY_OPEN_LOG,
+    LogType.LogTypeDone: BINARY_DONE_LOG,
+    LogType.LogTypeMatch: BINARY_MATCH_LOG,
+}
+BINARY_LOG_PREFIX = struct.Struct("<BBqqH")
+# decimals converted to coefficient and exponent kept by an encoder, prices and sizes repeat a lot
+DECIMAL_CACHE_SIZE: int = 4096
+
+
+class LogCodecException(Exception):
+    pass
+
+
+def json_number(value) -> bytes:
+    # JsonEncoder writes decimals as strings
+    if isinstance(value, Decimal):
+        return b'"%b"' % str(value).encode("utf8")
+    return json.dumps(value).encode("utf8")
+
+
+def split_payloads(buf: bytearray, ends: List[int]) -> List[memoryview]:
+    # one zero-copy payload per log of the batch buffer
+    view = memoryview(buf)
+    payloads = list()
+    start = 0
+    for end in ends:
+        payloads.append(view[start:end])
+        start = end
+    return payloads
+
+
+class JsonLogEncoder(object):
+    """
+    Writes the logs of a batch into one buffer with a dedicated writer per log type. The output
+    is byte-compatible with Log.to_json_str.
+    """
+
+    name: str = "json"
+
+    def __init__(self, product: Optional[Product] = None):
+        # set in tick mode, ticks are converted back to decimals of the product
+        self.product: Optional[Product] = product
+        # the json strings of the product ids
+        self.product_ids: Dict[str, bytes] = dict()
+        self.writers = {
+            OpenLog: self.write_open_log,
+            DoneLog: self.write_done_log,
+            MatchLog: self.write_match_log,
+        }
+
+    def encode(self, logs: list) -> List[memoryview]:
+        buf = bytearray()
+        ends = list()
+        for log in logs:
+            self.writers[type(log)](buf, log)
+            ends.append(len(buf))
+        return split_payloads(buf, ends)
+
+    def product_id(self, product_id: str) -> bytes:
+        product_id_json = self.product_ids.get(product_id)
+        if product_id_json is None:
+            product_id_json = json.dumps(product_id).encode("utf8")
+            self.product_ids[product_id] = product_id_json
+        return product_id_json
+
+    def price(self, price) -> bytes:
+        if self.product is not None:
+            price = from_ticks(price, self.product.quote_scale)
+        return json_number(price)
+
+    def size(self, size) -> bytes:
+        if self.product is not None:
+            size = from_ticks(size, self.product.base_scale)
+        return json_number(size)
+
+    def write_open_log(self, buf: bytearray, log: OpenLog):
+        buf += OPEN_LOG_JSON % (log.sequence, self.product_id(log.product_id), log.time, log.order_id, log.user_id,
+                                self.size(log.remaining_size), self.price(log.price), ENUM_JSON[log.side],
+                                ENUM_JSON[log.time_in_force])
+
+    def write_done_log(self, buf: bytearray, log: DoneLog):
+        buf += DONE_LOG_JSON % (log.sequence, self.product_id(log.product_id), log.time, log.order_id, log.user_id,
+                                self.size(log.remaining_size), self.price(log.price), ENUM_JSON[log.reason],
+                                ENUM_JSON[log.side], ENUM_JSON[log.time_in_force])
+
+    def write_match_log(self, buf: bytearray, log: MatchLog):
+        buf += MATCH_LOG_JSON % (log.sequence, self.product_id(log.product_id), log.time, log.trade_seq,
+                                 log.taker_order_id, log.maker_order_id, log.taker_user_id, log.maker_user_id,
+                                 ENUM_JSON[log.side], self.price(log.price), self.size(log.size),
+                                 ENUM_JSON[log.taker_time_in_force], ENUM_JSON[log.maker_time_in_force])
+
+
+class BinaryLogEncoder(object):
+    """
+    Compact binary log format, for consumers that can read it, all integers are little-endian:
+
+        header      version, log type, sequence, time, product_id (u16 length + utf8)
+        body        the fields of the log type, see BINARY_OPEN_LOG, BINARY_DONE_LOG and BINARY_MATCH_LOG
+
+    Decimal values are stored as a 64-bit coefficient and an 8-bit exponent, as in the binary
+    snapshot format. decode_binary_log reads a log back into the fields of its json form.
+    """
+
+    name: str = "binary"
+
+    def __init__(self, product: Optional[Product] = None):
+        # set in tick mode, the ticks are the coefficients of the product scales
+        self.product: Optional[Product] = product
+        # (log type, product_id) -> struct of the whole log, product_id bytes
+        self.structs: Dict[tuple, tuple] = dict()
+        # str of a decimal -> coefficient, exponent. Keyed by str as equal decimals may differ in exponent.
+        self.decimals: Dict[str, tuple] = dict()
+        self.writers = {
+            OpenLog: self.write_open_log,
+            DoneLog: self.write_done_log,
+            MatchLog: self.write_match_log,
+        }
+
+    def encode(self, logs: list) -> List[memoryview]:
+        buf = bytearray()
+        ends = list()
+        for log in logs:
+            self.writers[type(log)](buf, log)
+            ends.append(len(buf))
+        return split_payloads(buf, ends)
+
+    def log_struct(self, log) -> tuple:
+        key = (log.type, log.product_id)
+        log_struct = self.structs.get(key)
+        if log_struct is None:
+            product_id = log.product_id.encode("utf8")
+            log_struct = (struct.Struct(BINARY_LOG_HEADER.format(len(product_id)) + BINARY_LOG_FORMATS[log.type]),
+                          product_id, LOG_TYPE_CODES[log.type])
+            self.structs[key] = log_struct
+        return log_struct
+
+    def decimal(self, d: Decimal) -> tuple:
+        key = str(d)
+        raw = self.decimals.get(key)
+        if raw is None:
+            if len(self.decimals) >= DECIMAL_CACHE_SIZE:
+                self.decimals.clear()
+            raw = decimal_to_raw(d)
+            self.decimals[key] = raw
+        return raw
+
+    def price(self, price) -> tuple:
+        if self.product is not None and isinstance(price, int):
+            return price, -self.product.quote_scale
+        return self.decimal(price)
+
+    def size(self, size) -> tuple:
+        if self.product is not None and isinstance(size, int):
+            return size, -self.product.base_scale
+        return self.decimal(size)
+
+    def write_open_log(self, buf: bytearray, log: OpenLog):
+        log_struct, product_id, log_type = self.log_struct(log)
+        buf += log_struct.pack(BINARY_LOG_VERSION, log_type, log.sequence, log.time, len(product_id), product_id,
+                               log.order_id, log.user_id, *self.size(log.remaining_size), *self.price(log.price),
+                               SIDE_CODES[log.side], TIME_IN_FORCE_CODES[log.time_in_force])
+
+    def write_done_log(self, buf: bytearray, log: DoneLog):
+        log_struct, product_id, log_type = self.log_struct(log)
+        buf += log_struct.pack(BINARY_LOG_VERSION, log_type, log.sequence, log.time, len(product_id), product_id,
+                               log.order_id, log.user_id, *self.size(log.remaining_size), *self.price(log.price),
+                               DONE_REASON_CODES[log.reason], SIDE_CODES[log.side],
+                               TIME_IN_FORCE_CODES[log.time_in_force])
+
+    def write_match_log(self, buf: bytearray, log: MatchLog):
+        log_struct, product_id, log_type = self.log_struct(log)
+        buf += log_struct.pack(BINARY_LOG_VERSION, log_type, log.sequence, log.time, len(product_id), product_id,
+                               log.trade_seq, log.taker_order_id, log.maker_order_id, log.taker_user_id,
+                               log.maker_user_id, SIDE_CODES[log.side], *self.price(log.price),
+                               *self.size(log.size), TIME_IN_FORCE_CODES[log.taker_time_in_force],
+                               TIME_IN_FORCE_CODES[log.maker_time_in_force])
+
+
+def decode_binary_log(data) -> dict:
+    # the fields of a binary log as they are in its json form
+    data = memoryview(data)
+    version, log_type_code, sequence, _time, product_id_length = BINARY_LOG_PREFIX.unpack_from(data)
+    if version != BINARY_LOG_VERSION:
+        raise LogCodecException("unsupported log version {}".format(version))
+    log_type = LOG_TYPES.get(log_type_code)
+    if log_type is None:
+        raise LogCodecException("invalid log type {}".format(log_type_code))
+
+    offset = BINARY_LOG_PREFIX.size
+    product_id = bytes(data[offset:offset + product_id_length]).decode("utf8")
+    offset += product_id_length
+    body = struct.Struct("<" + BINARY_LOG_FORMATS[log_type])
+    if len(data) != offset + body.size:
+        raise LogCodecException("invalid {} log length {}".format(log_type.value, len(data)))
+    fields = body.unpack_from(data, offset)
+
+    log = {"type": log_type.value, "sequence": sequence, "product_id": product_id, "time": _time}
+    if log_type == LogType.LogTypeMatch:
+        (log["trade_seq"], log["taker_order_id"], log["maker_order_id"], log["taker_user_id"], log["maker_user_id"],
+         side, price, price_exponent, size, size_exponent, taker_time_in_force, maker_time_in_force) = fields
+        log["side"] = SIDES[side].value
+        log["price"] = str(raw_to_decimal(price, price_exponent))
+        log["size"] = str(raw_to_decimal(size, size_exponent))
+        log["taker_time_in_force"] = TIME_IN_FORCES[taker_time_in_force].value
+        log["maker_time_in_force"] = TIME_IN_FORCES[maker_time_in_force].value
+        return log
+
+    log["order_id"], log["user_id"], size, size_exponent, price, price_exponent = fields[:6]
+    log["remaining_size"] = str(raw_to_decimal(size, size_exponent))
+    log["price"] = str(raw_to_decimal(price, price_exponent))
+    if log_type == LogType.LogTypeDone:
+        log["reason"] = DONE_REASONS[fields[6]].value
+    log["side"] = SIDES[fields[-2]].value
+    log["time_in_force"] = TIME_IN_FORCES[fields[-1]].value
+    return log
+
+
+LOG_ENCODERS = {
+    JsonLogEncoder.name: JsonLogEncoder,
+    BinaryLogEncoder.name: BinaryLogEncoder,
+}
+
+
+def new_log_encoder(name: str, product: Optional[Product] = None):
+    encoder_class = LOG_ENCODERS.get(name)
+    if encoder_class is None:
+        raise LogCodecException("unknown log format {}".format(name))
+    return encoder_class(product)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import List, Optional, Dict, Deque
+
+from matching.order_book import OrderBook
+from models.models import Product
+from models.types import Side
+from utils.kafka import KafkaProducer
+from utils.utils import JsonEncoder, from_ticks
+
+TOPIC_L2_PREFIX: str = "matching_l2_"
+# messages kept after failed publishes before they are dropped for a checkpoint
+MARKET_DATA_MAX_KEPT: int = 10000
+# seconds before a failed publish is retried
+MARKET_DATA_RETRY_INTERVAL: float = 1
+
+
+class L2Update(object):
+    """
+    The price levels changed by the logs up to log_seq, coalesced: one (side, price, size, count)
+    change per level with its aggregate after the last of those logs. A size of 0 removes the level.
+    """
+
+    __slots__ = ("product_id", "log_seq", "changes")
+
+    def __init__(self, product_id: str, log_seq: int, changes: List[tuple]):
+        self.product_id: str = product_id
+        self.log_seq: int = log_seq
+        self.changes: List[tuple] = changes
+
+
+class L2Checkpoint(object):
+    # all price levels at log_seq as (price, size, count), from the best price to the worst
+    __slots__ = ("product_id", "log_seq", "bids", "asks")
+
+    def __init__(self, product_id: str, log_seq: int, bids: List[tuple], asks: List[tuple]):
+        self.product_id: str = product_id
+        self.log_seq: int = log_seq
+        self.bids: List[tuple] = bids
+        self.asks: List[tuple] = asks
+
+
+class KafkaMarketDataSink(object):
+    def __init__(self, product_id: str, brokers: List[str], log_writer: Optional[KafkaProducer] = None):
+        self.topic = "".join([TOPIC_L2_PREFIX, product_id])
+        # the producer may be shared with the log stores
+        self.log_writer = KafkaProducer(brokers=brokers) if log_writer is None else log_writer
+
+    async def start(self):
+        await self.log_writer.start()
+
+    async def store(self, payloads: List[bytes]):
+        await (await self.log_writer.send_batch(topic=self.topic, payloads=payloads))
+
+
+class MemoryMarketDataSink(object):
+    # keeps the published messages, a stand-in of the kafka topic for tests
+    def __init__(self):
+        self.payloads: List[bytes] = list()
+
+    async def start(self):
+        pass
+
+    async def store(self, payloads: List[bytes]):
+        self.payloads.extend(payloads)
+
+    def messages(self) -> List[dict]:
+        return [json.loads(payload) for payload in self.payloads]
+
+
+class MarketDataPublisher(object):
+    """
+    Level-2 feed of an engine, published as its logs are committed. The applier calls on_batch
+    after each batch of orders, which reads the levels the batch changed from the order book (see
+    OrderBook.level_changes) and stages them as an L2Update at the log seq of the batch, or stages
+    a full L2Checkpoint every checkpoint_interval seconds. The committer calls on_commit with the
+    seq of the acknowledged logs, and run() publishes the staged messages up to that seq, the
+    updates of one commit coalesced into one L2Update, so the feed is never ahead of the durable
+    log. Messages that fail to be published are kept and published again in order.
+    """
+
+    def __init__(self, product: Product, sink, use_ticks: bool = False, checkpoint_interval: float = 10):
+        self.product: Product = product
+        self.sink = sink
+        # set in tick mode, ticks are converted back to decimals of the product
+        self.tick_product: Optional[Product] = product if use_ticks else None
+        self.checkpoint_interval: float = checkpoint_interval
+        # L2Update and L2Checkpoint of the batches whose logs are not committed yet, in log seq order
+        self.staged: Deque[object] = deque()
+        # seq of the acknowledged logs, and the event of its changes for run()
+        self.committed_seq: int = 0
+        self.committed: asyncio.Event = asyncio.Event()
+        # committed messages not published yet, in log seq order
+        self.messages: list = list()
+        # monotonic time of the last checkpoint, None before the first one or to force the next one
+        self.checkpoint_at: Optional[float] = None
+
+    def on_batch(self, order_book: OrderBook):
+        changes = order_book.level_changes()
+        now = time.monotonic()
+        if self.checkpoint_at is None or now - self.checkpoint_at >= self.checkpoint_interval:
+            # the checkpoint is taken after the changes of the batch and supersedes them
+            self.staged.append(self.checkpoint(order_book))
+            self.checkpoint_at = now
+        elif len(changes) > 0:
+            self.staged.append(L2Update(self.product.id, order_book.log_seq, changes))
+        else:
+            return
+        if order_book.log_seq <= self.committed_seq:
+            # no new logs, the batch is already committed
+            self.committed.set()
+
+    def checkpoint(self, order_book: OrderBook) -> L2Checkpoint:
+        bids = order_book.depths[Side.SideBuy]
+        asks = order_book.depths[Side.SideSell]
+        return L2Checkpoint(self.product.id, order_book.log_seq, bids.top_levels(len(bids.keys)),
+                            asks.top_levels(len(asks.keys)))
+
+    def on_commit(self, seq: int):
+        self.committed_seq = seq
+        self.committed.set()
+
+    def flush(self):
+        # move the staged messages up to the committed seq to the messages to publish, the updates
+        # coalesced per level, a checkpoint superseding the updates before it
+        pending: Dict[tuple, tuple] = dict()
+        pending_log_seq = 0
+        while len(self.staged) > 0 and self.staged[0].log_seq <= self.committed_seq:
+            message = self.staged.popleft()
+            if isinstance(message, L2Checkpoint):
+                pending = dict()
+                self.messages.append(message)
+                continue
+            for side, price, size, count in message.changes:
+                pending[(side, price)] = (size, count)
+            pending_log_seq = message.log_seq
+
+        if len(pending) > 0:
+            changes = [(side, price, size, count) for (side, price), (size, count) in pending.items()]
+            self.messages.append(L2Update(self.product.id, pending_log_seq, changes))
+
+    def price(self, price):
+        if self.tick_product is None:
+            return price
+        return from_ticks(price, self.tick_product.quote_scale)
+
+    def size(self, size):
+        if self.tick_product is None:
+            return size
+        return from_ticks(size, self.tick_product.base_scale)
+
+    def encode(self, message) -> bytes:
+        if isinstance(message, L2Update):
+            message_dict = {
+                "type": "l2update",
+                "product_id": message.product_id,
+                "log_seq": message.log_seq,
+                "changes": [[side, self.price(price), self.size(size), count]
+                            for side, price, size, count in message.changes],
+            }
+        else:
+            message_dict = {
+                "type": "l2checkpoint",
+                "product_id": message.product_id,
+                "log_seq": message.log_seq,
+                "bids": [[self.price(price), self.size(size), count] for price, size, count in message.bids],
+                "asks": [[self.price(price), self.size(size), count] for price, size, count in message.asks],
+            }
+        return json.dumps(message_dict, cls=JsonEncoder).encode("utf8")
+
+    async def publish(self):
+        self.flush()
+        if len(self.messages) == 0:
+            return
+        messages = self.messages
+        self.messages = list()
+        try:
+            await self.sink.store([self.encode(message) for message in messages])
+        except Exception:
+            # keep the messages to publish them again before the next ones, or once too many are kept
+            # drop them for a checkpoint of the next batch, which supersedes them
+            self.messages = messages + self.messages
+            if len(self.messages) > MARKET_DATA_MAX_KEPT:
+                self.messages = list()
+                self.checkpoint_at = None
+            raise
+
+    async def run(self):
+        while True:
+            await self.committed.wait()
+            self.committed.clear()
+            try:
+                await self.publish()
+            except Exception as ex:
+                logging.error("publish market data error: {}".format(ex))
+                await asyncio.sleep(MARKET_DATA_RETRY_INTERVAL)
+                self.committed.set()
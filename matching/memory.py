@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import asyncio
+from collections import namedtuple
+from typing import List, Optional
+
+from matching.engine import Snapshot
+from matching.log import Log
+from matching.log_codec import new_log_encoder
+from models.models import Product
+
+# a message of the order topic, as read by KafkaOrderReader
+Record = namedtuple("Record", ["offset", "value"])
+
+
+class MemoryConsumer(object):
+    """
+    Stand-in of the KafkaConsumer of an order topic, serving the messages of a list. Pass it to
+    KafkaOrderReader as its consumer, so the orders are decoded as they are from Kafka.
+    """
+
+    def __init__(self, records: List[Record]):
+        self.records: List[Record] = records
+        # index of the next record
+        self.position: int = 0
+
+    async def start(self):
+        pass
+
+    def set_offset(self, offset):
+        # the first record at or after offset
+        self.position = 0
+        while self.position < len(self.records) and self.records[self.position].offset < offset:
+            self.position += 1
+
+    def exhausted(self) -> bool:
+        return self.position >= len(self.records)
+
+    async def fetch_messages(self, max_records: int, timeout_ms: int = 1000) -> list:
+        if self.exhausted():
+            # like an idle topic, wait a little instead of spinning the fetcher
+            await asyncio.sleep(min(timeout_ms, 10) / 1000)
+            return list()
+
+        records = self.records[self.position:self.position + max_records]
+        self.position += len(records)
+        # a fetch from the brokers yields to the loop
+        await asyncio.sleep(0)
+        return records
+
+
+class MemoryLogStore(object):
+    # keeps the encoded logs, acknowledged at once, or when their futures are set if auto_ack is off
+    def __init__(self, product: Optional[Product] = None, log_format: str = "json", auto_ack: bool = True):
+        self.encoder = new_log_encoder(log_format, product)
+        self.auto_ack: bool = auto_ack
+        self.payloads: List[bytes] = list()
+        # the acknowledgements of the sends made while auto_ack is off, in send order
+        self.futures: List[asyncio.Future] = list()
+
+    async def start(self):
+        pass
+
+    def encode(self, logs: List[Log]) -> list:
+        return self.encoder.encode(logs)
+
+    async def send(self, payloads: list) -> asyncio.Future:
+        # the payloads are views of the buffer of their batch, they are copied
+        self.payloads.extend(bytes(payload) for payload in payloads)
+        future = asyncio.get_running_loop().create_future()
+        if self.auto_ack:
+            future.set_result(None)
+        else:
+            self.futures.append(future)
+        return future
+
+    async def store(self, logs: List[Log]):
+        await (await self.send(self.encode(logs)))
+
+
+class MemorySnapshotStore(object):
+    # the latest full snapshot and its deltas, encoded with the codec if one is given
+    def __init__(self, codec=None):
+        self.codec = codec
+        self.snapshot = None
+        self.deltas: list = list()
+
+    async def store(self, snapshot: Snapshot):
+        data = snapshot if self.codec is None else self.codec.encode(snapshot)
+        if snapshot.is_delta():
+            self.deltas.append(data)
+        else:
+            self.snapshot = data
+            self.deltas = list()
+
+    def decode(self, data) -> Snapshot:
+        return data if self.codec is None else self.codec.decode(data)
+
+    async def get_latest(self) -> Optional[Snapshot]:
+        return None if self.snapshot is None else self.decode(self.snapshot)
+
+    async def get_deltas(self) -> List[Snapshot]:
+        return [self.decode(delta) for delta in self.deltas]
@@ -1,26 +1,39 @@
 #!/usr/bin/env python
 # encoding: utf-8
 import logging
+import math
 import sys
-import copy
+from bisect import bisect_left, insort
+from collections import OrderedDict
 from decimal import Decimal
-from typing import List, Dict
+from operator import attrgetter
+from typing import List, Dict, Optional
 
 from matching.log import MatchLog, DoneLog, OpenLog
-from models.models import Product, Order
+from models.models import Product, Order, MassCancelOrder, InvalidOrder
 from models.types import Side, OrderType, TimeInForceType, DoneReason
+from utils.audit import audit, AUDIT_MATCH, AUDIT_OPEN, AUDIT_DONE
 from utils.utils import truncate_decimal
 from utils.window import Window, WindowException
-from pytreemap import TreeMap
 
 ORDER_ID_WINDOW_CAP: int = 10000
+# price of market-buy orders in tick mode, higher than any price in ticks
+MAX_PRICE_TICKS: int = sys.maxsize
+# grid keys of the smallest window of a LiquidityIndex
+LIQUIDITY_MIN_WINDOW: int = 1024
 
 
 class DepthException(Exception):
     pass
 
 
+class OrderBookSnapshotException(Exception):
+    pass
+
+
 class BookOrder(object):
+    __slots__ = ("order_id", "user_id", "price", "size", "funds", "side", "type", "time_in_force")
+
     def __init__(self, order_id: int, user_id: int, price: Decimal,
                  size: Decimal, funds: Decimal, side: Side, _type: OrderType,
                  time_in_force: TimeInForceType):
@@ -48,52 +61,373 @@ class OrderBookSnapshot(object):
         self.log_seq: int = log_seq
         self.order_id_window: Window = order_id_window
 
+    def apply_delta(self, delta):
+        if delta.base_log_seq != self.log_seq:
+            raise OrderBookSnapshotException("delta base seq {} does not follow snapshot seq {}".format(
+                delta.base_log_seq, self.log_seq))
+
+        # changed orders keep their place, new orders are appended in the order they were added,
+        # Depth.load restores the price priority of the result with a stable sort
+        orders = {order.order_id: order for order in self.orders}
+        for order_id in delta.removed:
+            orders.pop(order_id, None)
+        for order in delta.orders:
+            orders[order.order_id] = order
+        return OrderBookSnapshot(self.product_id, list(orders.values()), delta.trade_seq, delta.log_seq,
+                                 delta.order_id_window)
+
+
+class OrderBookDelta(object):
+    # orders added, modified or removed after the snapshot at base_log_seq
+    def __init__(self, product_id: str, base_log_seq: int, orders: List, removed: List, trade_seq: int,
+                 log_seq: int, order_id_window: Window):
+        self.product_id: str = product_id
+        self.base_log_seq: int = base_log_seq
+        # current state of the added and modified orders
+        self.orders: List[BookOrder] = orders
+        # ids of the removed orders
+        self.removed: List[int] = removed
+        self.trade_seq: int = trade_seq
+        self.log_seq: int = log_seq
+        self.order_id_window: Window = order_id_window
 
-class PriceOrderIdKey(object):
-    def __init__(self, price: Decimal, order_id: int):
-        self.price = price
-        self.order_id = order_id
-
-
-def price_order_id_key_asc_comparator(l: PriceOrderIdKey, r: PriceOrderIdKey):
-    if l.price < r.price:
-        return -1
-    elif l.price > r.price:
-        return 1
-    else:
-        if l.order_id < r.order_id:
-            return -1
-        elif l.order_id > r.order_id:
-            return 1
+    def merge(self, delta):
+        # merge a delta taken after this one into a single delta from this base
+        if delta.base_log_seq != self.log_seq:
+            raise OrderBookSnapshotException("delta base seq {} does not follow delta seq {}".format(
+                delta.base_log_seq, self.log_seq))
+
+        orders = {order.order_id: order for order in self.orders}
+        removed = dict.fromkeys(self.removed)
+        for order_id in delta.removed:
+            orders.pop(order_id, None)
+            removed[order_id] = None
+        for order in delta.orders:
+            orders[order.order_id] = order
+        return OrderBookDelta(self.product_id, self.base_log_seq, list(orders.values()), list(removed.keys()),
+                              delta.trade_seq, delta.log_seq, delta.order_id_window)
+
+
+class OrderBookCapture(object):
+    """
+    The state of the order book at log_seq, taken by the applier without copying the orders.
+
+    materialize() builds the OrderBookSnapshot (or the OrderBookDelta if base_log_seq is set) and
+    may run in another thread while the applier keeps changing the book: as long as the capture
+    is registered, Depth.decr_size saves the order and its size before the first change.
+    release() must be called from the thread of the applier.
+    """
+
+    def __init__(self, order_book, base_log_seq: Optional[int] = None):
+        self.product_id: str = order_book.product.id
+        self.base_log_seq: Optional[int] = base_log_seq
+        self.trade_seq: int = order_book.trade_seq
+        self.log_seq: int = order_book.log_seq
+        self.order_id_window: Window = order_book.order_id_window.copy()
+        # orderId -> (order, size) of the captured orders changed after the capture
+        self.preserved: Dict[int, tuple] = dict()
+        self.depths: List[Depth] = [order_book.depths[Side.SideSell], order_book.depths[Side.SideBuy]]
+        if base_log_seq is None:
+            # all orders in time priority, a copy of the dicts that runs in C while the applier is paused,
+            # they are sorted by price in materialize
+            self.orders: List[List[BookOrder]] = [list(depth.orders.values()) for depth in self.depths]
+        else:
+            # ids of the changed orders
+            self.changed: List[Dict[int, None]] = [depth.changed for depth in self.depths]
+
+        for depth in self.depths:
+            if depth.changed is not None:
+                depth.changed = dict()
+            depth.captures = depth.captures + (self.preserved,)
+
+    def release(self):
+        for depth in self.depths:
+            depth.captures = tuple(preserved for preserved in depth.captures if preserved is not self.preserved)
+
+    def captured_order(self, order: BookOrder) -> BookOrder:
+        # read the live size before looking up the preserved one, decr_size preserves the size before changing it
+        size = order.size
+        preserved = self.preserved.get(order.order_id)
+        if preserved is not None:
+            size = preserved[1]
+        return BookOrder(order_id=order.order_id, user_id=order.user_id, price=order.price, size=size,
+                         funds=order.funds, side=order.side, _type=order.type, time_in_force=order.time_in_force)
+
+    def materialize(self):
+        if self.base_log_seq is None:
+            # in price-time priority, so the snapshot can be bulk loaded by Depth.load: the sort is stable
+            # and keeps the time priority within a level
+            orders = list()
+            for depth, depth_orders in zip(self.depths, self.orders):
+                depth_orders = sorted(depth_orders, key=attrgetter("price"), reverse=depth.side == Side.SideBuy)
+                orders.extend(self.captured_order(order) for order in depth_orders)
+            return OrderBookSnapshot(self.product_id, orders, self.trade_seq, self.log_seq, self.order_id_window)
+
+        delta = OrderBookDelta(self.product_id, self.base_log_seq, list(), list(), self.trade_seq, self.log_seq,
+                               self.order_id_window)
+        for depth, changed in zip(self.depths, self.changed):
+            for order_id in changed:
+                order = depth.orders.get(order_id)
+                preserved = self.preserved.get(order_id)
+                if preserved is not None:
+                    # changed after the capture, it was on the book at the capture
+                    order = preserved[0]
+                if order is None:
+                    delta.removed.append(order_id)
+                else:
+                    delta.orders.append(self.captured_order(order))
+        return delta
+
+
+class PriceLevel(object):
+    __slots__ = ("price", "orders", "size")
+
+    def __init__(self, price: Decimal):
+        self.price: Decimal = price
+        # time first order queue of the price level, orderId -> order
+        self.orders: OrderedDict = OrderedDict()
+        # total size of the orders, kept up to date by Depth.add and Depth.decr_size
+        self.size = 0
+
+    @property
+    def count(self) -> int:
+        return len(self.orders)
+
+
+class LiquidityIndex(object):
+    """
+    Cumulative size and notional (size * price) of the price levels of a depth, in a Fenwick tree
+    over the price grid of the product, so a level is updated and the liquidity at a price or
+    better is summed in O(log range) of the prices of the depth, new levels included.
+
+    The sums are ints: ticks in tick mode, and in decimal mode sizes and prices scaled by the
+    base and quote scales of the product. The tree is a dict of its nodes over a window of the
+    grid, which is doubled and the tree rebuilt when a price falls outside of it. Sizes and prices
+    that are not on the grid are summed apart in Decimal, by level, and scanned by the queries.
+    """
+
+    def __init__(self, depth, scales: Optional[tuple] = None):
+        self.depth = depth
+        # (base_scale, quote_scale) of the decimal sizes and prices, None in tick mode
+        self.scales: Optional[tuple] = scales
+        # the grid key of a price is its ticks for bids and the negative ticks for asks, like the level key
+        self.sign: int = 1 if depth.side == Side.SideBuy else -1
+        # the grid keys of the window, from low to low + window - 1, are the positions 1 to window of the tree
+        self.low: int = 0
+        self.window: int = 0
+        # position -> [size, notional] of the tree
+        self.nodes: Dict[int, list] = dict()
+        self.total_size: int = 0
+        self.total_notional: int = 0
+        # levelKey -> [size, notional] of the sizes and prices off the grid
+        self.off_grid: Dict = dict()
+        self.rebuild()
+
+    def units(self, price, size) -> Optional[tuple]:
+        # (price, size) as ints of the grid, None if they are not on it
+        if self.scales is None:
+            if type(price) is int and type(size) is int:
+                return price, size
+            return None
+        base_scale, quote_scale = self.scales
+        price = price.scaleb(quote_scale)
+        size = size.scaleb(base_scale)
+        if price != price.to_integral_value() or size != size.to_integral_value():
+            return None
+        return int(price), int(size)
+
+    def rebuild(self, grid_key: Optional[int] = None):
+        # the tree of the levels of the depth, over a window of at least twice the grid keys of the
+        # levels, the current window and grid_key
+        entries = list()
+        self.off_grid = dict()
+        for key, level in self.depth.levels.items():
+            units = self.units(level.price, level.size)
+            if units is None:
+                self.off_grid[key] = [level.size, level.size * level.price]
+            else:
+                entries.append((self.sign * units[0], units[1], units[1] * units[0]))
+
+        grid_keys = [entry[0] for entry in entries]
+        if grid_key is not None:
+            grid_keys.append(grid_key)
+        if self.window > 0:
+            grid_keys.extend((self.low, self.low + self.window - 1))
+        low = min(grid_keys, default=0)
+        span = max(grid_keys, default=0) - low + 1
+        self.window = max(1 << (2 * span - 1).bit_length(), LIQUIDITY_MIN_WINDOW)
+        self.low = low - (self.window - span) // 2
+
+        self.nodes = dict()
+        self.total_size = 0
+        self.total_notional = 0
+        for key, size, notional in entries:
+            self.update(key, size, notional)
+
+    def update(self, grid_key: int, size: int, notional: int):
+        i = grid_key - self.low + 1
+        if i < 1 or i > self.window:
+            # the depth already holds the change
+            self.rebuild(grid_key)
+            return
+
+        self.total_size += size
+        self.total_notional += notional
+        nodes = self.nodes
+        window = self.window
+        while i <= window:
+            node = nodes.get(i)
+            if node is None:
+                nodes[i] = [size, notional]
+            else:
+                node[0] += size
+                node[1] += notional
+                if node[0] == 0 and node[1] == 0:
+                    del nodes[i]
+            i += i & -i
+
+    def add(self, key, price, size):
+        # size is added to, or with a negative size removed from, the level at key, after the
+        # depth itself was updated
+        units = self.units(price, size)
+        if units is not None:
+            self.update(self.sign * units[0], units[1], units[1] * units[0])
+            return
+
+        off_grid = self.off_grid.get(key)
+        if off_grid is None:
+            self.off_grid[key] = [size, size * price]
         else:
-            return 0
-
-
-def price_order_id_key_desc_comparator(l: PriceOrderIdKey, r: PriceOrderIdKey):
-    if l.price < r.price:
-        return 1
-    elif l.price > r.price:
-        return -1
-    else:
-        if l.order_id < r.order_id:
-            return -1
-        elif l.order_id > r.order_id:
-            return 1
+            off_grid[0] += size
+            off_grid[1] += size * price
+            if off_grid[0] == 0:
+                del self.off_grid[key]
+
+    def available(self, key) -> tuple:
+        # (size, notional) of the levels with a level key of at least key, i.e. at the price of
+        # the key or better
+        if self.scales is None:
+            grid_key = key if type(key) is int else math.ceil(key)
         else:
-            return 0
+            grid_key = math.ceil(key.scaleb(self.scales[1]))
+
+        # minus the sums of the grid keys below grid_key
+        size = self.total_size
+        notional = self.total_notional
+        i = min(grid_key - self.low, self.window)
+        nodes = self.nodes
+        while i > 0:
+            node = nodes.get(i)
+            if node is not None:
+                size -= node[0]
+                notional -= node[1]
+            i -= i & -i
+        if self.scales is not None:
+            base_scale, quote_scale = self.scales
+            size = Decimal(size).scaleb(-base_scale)
+            notional = Decimal(notional).scaleb(-base_scale - quote_scale)
+
+        for off_grid_key, (off_grid_size, off_grid_notional) in self.off_grid.items():
+            if off_grid_key >= key:
+                size += off_grid_size
+                notional += off_grid_notional
+        return size, notional
 
 
 class Depth(object):
-    def __init__(self):
+    def __init__(self, side: Side, scales: Optional[tuple] = None):
+        self.side: Side = side
+        # (base_scale, quote_scale) of the decimal sizes and prices for the LiquidityIndex, None in tick mode
+        self.scales: Optional[tuple] = scales
         # all orders
         self.orders: Dict[int, BookOrder] = dict()
+        # userId -> ids of the orders of the user, in the order they were added
+        self.user_orders: Dict[int, Dict[int, None]] = dict()
         # price first, time first order queue for order match
-        # priceOrderIdKey -> orderId
-        self.queue: TreeMap = TreeMap()
+        # levelKey -> priceLevel
+        self.levels: Dict[Decimal, PriceLevel] = dict()
+        # ascending level keys, the level key is the price for bids and the negative price for
+        # asks, so the best price level is always the last one
+        self.keys: List[Decimal] = list()
+        # ids of the orders added, modified or removed since the last snapshot, in the order they
+        # were first changed. None if the changes are not tracked.
+        self.changed: Optional[Dict[int, None]] = None
+        # preserved orders of the unreleased OrderBookCaptures, replaced rather than changed in place
+        # as the captures may be read by another thread
+        self.captures: tuple = ()
+        # levelKey -> price of the price levels changed since the last OrderBook.level_changes, for
+        # the market data feed. None if the levels are not tracked.
+        self.touched: Optional[Dict[Decimal, Decimal]] = None
+        # built by the first liquidity query, then kept up to date by add and decr_size
+        self.liquidity: Optional[LiquidityIndex] = None
+
+    def level_key(self, price: Decimal) -> Decimal:
+        if self.side == Side.SideBuy:
+            return price
+        return -price
 
     def add(self, order: BookOrder):
+        key = self.level_key(order.price)
+        level = self.levels.get(key)
+        if level is None:
+            level = PriceLevel(order.price)
+            self.levels[key] = level
+            insort(self.keys, key)
+
         self.orders[order.order_id] = order
-        self.queue[PriceOrderIdKey(order.price, order.order_id)] = order.order_id
+        level.orders[order.order_id] = order
+        level.size += order.size
+        self.add_user_order(order)
+        if self.changed is not None:
+            self.changed[order.order_id] = None
+        if self.touched is not None:
+            self.touched[key] = order.price
+        if self.liquidity is not None:
+            self.liquidity.add(key, order.price, order.size)
+
+    def load(self, orders: List[BookOrder]):
+        # Bulk load orders in price-time priority, as written by full snapshots, building the
+        # price levels and the level keys in a single pass. Orders that are not in price order
+        # are sorted first, the sort is stable so the time priority within a level is kept.
+        if len(self.orders) > 0:
+            for order in orders:
+                self.add(order)
+            return
+
+        prices = [order.price for order in orders]
+        if self.side == Side.SideBuy:
+            is_sorted = all(a >= b for a, b in zip(prices, prices[1:]))
+        else:
+            is_sorted = all(a <= b for a, b in zip(prices, prices[1:]))
+        if not is_sorted:
+            orders = sorted(orders, key=attrgetter("price"), reverse=self.side == Side.SideBuy)
+
+        # from the best level to the worst, reversed at the end
+        keys = list()
+        level = None
+        for order in orders:
+            if level is None or order.price != level.price:
+                level = PriceLevel(order.price)
+                key = self.level_key(order.price)
+                self.levels[key] = level
+                keys.append(key)
+
+            self.orders[order.order_id] = order
+            level.orders[order.order_id] = order
+            level.size += order.size
+            self.add_user_order(order)
+            if self.changed is not None:
+                self.changed[order.order_id] = None
+        keys.reverse()
+        self.keys = keys
+        self.liquidity = None
+
+    def add_user_order(self, order: BookOrder):
+        user_orders = self.user_orders.get(order.user_id)
+        if user_orders is None:
+            user_orders = dict()
+            self.user_orders[order.user_id] = user_orders
+        user_orders[order.order_id] = None
 
     def decr_size(self, order_id: int, size: Decimal):
         order = self.orders.get(order_id)
@@ -103,115 +437,163 @@ class Depth(object):
         if order.size < size:
             raise DepthException("order {} Size {} less than {}".format(order_id, order.size, size))
 
+        for preserved in self.captures:
+            if order_id not in preserved:
+                preserved[order_id] = (order, order.size)
+
         order.size -= size
-        self.orders[order_id] = order
-        if order.size.is_zero():
+        if self.changed is not None:
+            self.changed[order_id] = None
+
+        key = self.level_key(order.price)
+        level = self.levels[key]
+        level.size -= size
+        if self.touched is not None:
+            self.touched[key] = order.price
+        if order.size == 0:
             del self.orders[order_id]
-            self.queue.remove(PriceOrderIdKey(order.price, order.order_id))
+            del level.orders[order_id]
+            user_orders = self.user_orders[order.user_id]
+            del user_orders[order_id]
+            if len(user_orders) == 0:
+                del self.user_orders[order.user_id]
+            if len(level.orders) == 0:
+                del self.levels[key]
+                if self.keys[-1] == key:
+                    self.keys.pop()
+                else:
+                    del self.keys[bisect_left(self.keys, key)]
+        if self.liquidity is not None:
+            self.liquidity.add(key, order.price, -size)
+
+    def best_level(self) -> Optional[PriceLevel]:
+        if len(self.keys) == 0:
+            return None
+        return self.levels[self.keys[-1]]
+
+    def best_order(self) -> Optional[BookOrder]:
+        if len(self.keys) == 0:
+            return None
+        return next(iter(self.levels[self.keys[-1]].orders.values()))
+
+    def top_levels(self, n: int) -> List[tuple]:
+        # (price, size, count) of the best n price levels, from the best price to the worst
+        levels = list()
+        if n <= 0:
+            return levels
+        for key in reversed(self.keys[-n:]):
+            level = self.levels[key]
+            levels.append((level.price, level.size, len(level.orders)))
+        return levels
+
+    def available(self, price) -> tuple:
+        # (size, notional) of the orders at price or better
+        if self.liquidity is None:
+            self.liquidity = LiquidityIndex(self, self.scales)
+        return self.liquidity.available(self.level_key(price))
+
+    def iter_levels(self):
+        # price levels from the best price to the worst
+        for key in reversed(self.keys):
+            yield self.levels[key]
+
+    def iter_orders(self):
+        # orders in price-time priority
+        for level in self.iter_levels():
+            yield from level.orders.values()
 
 
 class OrderBook(object):
-    def __init__(self, product: Product, trade_seq: int, log_seq: int):
-        asks = Depth()
-        asks.queue = TreeMap(comparator=price_order_id_key_asc_comparator)
-
-        bids = Depth()
-        bids.queue = TreeMap(comparator=price_order_id_key_desc_comparator)
+    def __init__(self, product: Product, trade_seq: int, log_seq: int, use_ticks: bool = False,
+                 order_id_window_cap: int = ORDER_ID_WINDOW_CAP):
+        scales = None if use_ticks else (product.base_scale, product.quote_scale)
+        asks = Depth(Side.SideSell, scales)
+        bids = Depth(Side.SideBuy, scales)
 
         self.product: Product = product
         self.depths: Dict[Side, Depth] = dict()
         self.trade_seq = trade_seq
         self.log_seq = log_seq
-        self.order_id_window = Window(0, ORDER_ID_WINDOW_CAP)
+        self.order_id_window_cap: int = order_id_window_cap
+        self.order_id_window = Window(0, order_id_window_cap)
+        # matches, and resting orders cancelled by cancel and mass cancel orders, since the book was created
+        self.matches: int = 0
+        self.cancels: int = 0
 
         self.depths[Side.SideBuy] = bids
         self.depths[Side.SideSell] = asks
 
-    def is_order_will_not_match(self, order: Order) -> bool:
-        taker_order = BookOrder.from_order(order)
+        # In tick mode prices, sizes and funds of the orders are integer ticks (see Order.from_json_str)
+        # and matching runs on plain ints
+        self.use_ticks: bool = use_ticks
+        # the product of the audit log records in tick mode, to write their ticks as decimals
+        self.tick_product: Optional[Product] = product if use_ticks else None
+        if use_ticks:
+            self.max_price = MAX_PRICE_TICKS
+            self.zero = 0
+            self.min_size = min
+        else:
+            self.max_price = Decimal(sys.float_info.max)
+            self.zero = Decimal(0)
+            self.min_size = Decimal.min
 
+    def market_price(self, side: Side):
         # If it's a Market-Buy order, set price to infinite high, and if it's market-sell,
         # set price to zero, which ensures that prices will cross.
-        if taker_order.type == OrderType.OrderTypeMarket:
-            if taker_order.side == Side.SideBuy:
-                taker_order.price = Decimal(sys.float_info.max)
-            else:
-                taker_order.price = Decimal(0)
-
-        maker_depth = self.depths[taker_order.side.opposite()]
+        if side == Side.SideBuy:
+            return self.max_price
+        return self.zero
 
-        if taker_order.side == Side.SideBuy:
-            e = maker_depth.queue.first_entry()
-            k, v = e.get_key(), e.get_value()
-            if k is None or v is None:
-                return True
+    def funds_to_size(self, funds, price):
+        # the size that the funds can buy at price, truncated to base_scale
+        if self.use_ticks:
+            return funds // price
+        return truncate_decimal(funds / price, self.product.base_scale)
 
-            maker_order: BookOrder = maker_depth.orders[v]
-            if taker_order.price.lt(maker_order.price):
-                return True
-        elif taker_order.side == Side.SideSell:
-            e = maker_depth.queue.first_entry()
-            k, v = e.get_key(), e.get_value()
-            if k is None or v is None:
-                return True
+    def top_levels(self, side: Side, n: int) -> List[tuple]:
+        # (price, size, count) of the best n price levels of a side, in ticks in tick mode
+        return self.depths[side].top_levels(n)
 
-            maker_order: BookOrder = maker_depth.orders[v]
-            if taker_order.price > maker_order.price:
-                return True
+    def best_bid(self) -> Optional[tuple]:
+        # (price, size, count) of the best bid level, None if there is no bid
+        levels = self.depths[Side.SideBuy].top_levels(1)
+        return levels[0] if len(levels) > 0 else None
 
-        return False
+    def best_ask(self) -> Optional[tuple]:
+        levels = self.depths[Side.SideSell].top_levels(1)
+        return levels[0] if len(levels) > 0 else None
 
-    def is_order_will_full_match(self, order: Order) -> bool:
+    def is_order_will_not_match(self, order: Order) -> bool:
         taker_order = BookOrder.from_order(order)
 
-        # If it's a Market-Buy order, set price to infinite high, and if it's market-sell,
-        # set price to zero, which ensures that prices will cross.
         if taker_order.type == OrderType.OrderTypeMarket:
-            if taker_order.side == Side.SideBuy:
-                taker_order.price = Decimal(sys.float_info.max)
-            else:
-                taker_order.price = Decimal(0)
-
-        maker_depth = self.depths[taker_order.side.opposite()]
-        for v in maker_depth.queue.values():
-            maker_order = maker_depth.orders[v]
-
-            # check whether there is price crossing between the taker and the maker
-            if (taker_order.side == Side.SideBuy and taker_order.price < maker_order.price) or (
-                    taker_order.side == Side.SideSell and taker_order.price > maker_order.price):
-                break
-
-            price = maker_order.price
-            size = Decimal(0)
-
-            if taker_order.type == OrderType.OrderTypeLimit or (
-                    taker_order.type == OrderType.OrderTypeMarket and taker_order.side == Side.SideSell):
-                if taker_order.size.is_zero():
-                    break
+            taker_order.price = self.market_price(taker_order.side)
 
-                # Take the minimum size of taker and maker as trade size
-                size = taker_order.size.min(maker_order.size)
-                # adjust the size of taker order
-                taker_order.size = taker_order.size - size
-            elif taker_order.type == OrderType.OrderTypeMarket and taker_order.size == Side.SideBuy:
-                if taker_order.funds.is_zero():
-                    break
+        best_level = self.depths[taker_order.side.opposite()].best_level()
+        if best_level is None:
+            return True
 
-                taker_size = truncate_decimal(taker_order.funds / price, self.product.base_scale)
-                if taker_size.is_zero():
-                    break
+        if taker_order.side == Side.SideBuy:
+            if taker_order.price < best_level.price:
+                return True
+        elif taker_order.side == Side.SideSell:
+            if taker_order.price > best_level.price:
+                return True
 
-                # Take the minimum size of taker and maker as trade size
-                size = taker_size.min(maker_order.size)
-                funds = size * price
+        return False
 
-                # adjust the funds of taker order
-                taker_order.funds = taker_order.funds - funds
+    def liquidity(self, side: Side, price) -> tuple:
+        # (size, notional) of the resting orders of a side at price or better, in O(log levels)
+        return self.depths[side].available(price)
 
-        if taker_order.type == OrderType.OrderTypeLimit and taker_order.size > 0:
-            return False
+    def is_order_will_full_match(self, order: Order) -> bool:
+        # market orders fill what they can, only a limit order has to find its whole size at its
+        # price or better
+        if order.type != OrderType.OrderTypeLimit:
+            return True
 
-        return True
+        size, _ = self.depths[order.side.opposite()].available(order.price)
+        return size >= order.size
 
     def apply_order(self, order: Order) -> list:
         logs = list()
@@ -223,55 +605,66 @@ class OrderBook(object):
             logging.error("{}".format(str(ex)))
             return logs
 
+        # an order that does not fit the scales of the product is cancelled whole
+        if isinstance(order, InvalidOrder):
+            return self.reject_order(order)
+
+        # FOK: the order is cancelled whole unless the liquidity at its price covers its size
+        if order.time_in_force == TimeInForceType.FillOrKill and not self.is_order_will_full_match(order):
+            return self.reject_order(order)
+
         taker_order = BookOrder.from_order(order)
 
-        # If it's a Market-Buy order, set price to infinite high, and if it's market-sell,
-        # set price to zero, which ensures that prices will cross.
         if taker_order.type == OrderType.OrderTypeMarket:
-            if taker_order.side == Side.SideBuy:
-                taker_order.price = Decimal(sys.float_info.max)
-            else:
-                taker_order.price = Decimal(0)
+            taker_order.price = self.market_price(taker_order.side)
 
-        maker_depth = copy.deepcopy(self.depths[taker_order.side.opposite()])
-        for v in maker_depth.queue.values():
-            maker_order = maker_depth.orders[v]
+        # walk the live maker depth, the best order is re-read after every fill because
+        # decr_size removes filled makers from their price level
+        maker_depth = self.depths[taker_order.side.opposite()]
+        while True:
+            maker_order = maker_depth.best_order()
+            if maker_order is None:
+                break
 
             # check whether there is price crossing between the taker and the maker
             if (taker_order.side == Side.SideBuy and taker_order.price < maker_order.price) or (
                     taker_order.side == Side.SideSell and taker_order.price > maker_order.price):
                 break
 
+            # GTX: the order only adds liquidity, it is cancelled whole if it crosses the best maker
+            if taker_order.time_in_force == TimeInForceType.GoodTillCrossing:
+                return self.reject_order(order)
+
             price = maker_order.price
-            size = Decimal(0)
+            size = self.zero
 
             if taker_order.type == OrderType.OrderTypeLimit or (
                     taker_order.type == OrderType.OrderTypeMarket and taker_order.side == Side.SideSell):
-                if taker_order.size.is_zero():
+                if taker_order.size == 0:
                     break
 
                 # Take the minimum size of taker and maker as trade size
-                size = taker_order.size.min(maker_order.size)
+                size = self.min_size(taker_order.size, maker_order.size)
                 # adjust the size of taker order
                 taker_order.size = taker_order.size - size
-            elif taker_order.type == OrderType.OrderTypeMarket and taker_order.size == Side.SideBuy:
-                if taker_order.funds.is_zero():
+            elif taker_order.type == OrderType.OrderTypeMarket and taker_order.side == Side.SideBuy:
+                if taker_order.funds == 0:
                     break
 
-                taker_size = truncate_decimal(taker_order.funds / price, self.product.base_scale)
-                if taker_size.is_zero():
+                taker_size = self.funds_to_size(taker_order.funds, price)
+                if taker_size == 0:
                     break
 
                 # Take the minimum size of taker and maker as trade size
-                size = taker_size.min(maker_order.size)
+                size = self.min_size(taker_size, maker_order.size)
                 funds = size * price
 
                 # adjust the funds of taker order
                 taker_order.funds = taker_order.funds - funds
 
             try:
-                self.depths[taker_order.side.opposite()].decr_size(maker_order.order_id, size)
-                maker_order.size -= size
+                # decr_size updates the live maker order and removes it from its price level once filled
+                maker_depth.decr_size(maker_order.order_id, size)
             except DepthException as ex:
                 logging.fatal("{}".format(ex))
                 sys.exit()
@@ -279,28 +672,37 @@ class OrderBook(object):
             # matched, write a log
             match_log = MatchLog(self.next_log_seq(), self.product.id, self.net_trade_seq(), taker_order, maker_order,
                                  price, size)
-            logging.info("MatchLog: {}".format(MatchLog.to_json_str(match_log)))
+            audit(AUDIT_MATCH, match_log, self.tick_product)
             logs.append(match_log)
+            self.matches += 1
 
             # maker is filled
-            if maker_order.size.is_zero():
+            if maker_order.size == 0:
                 done_log = DoneLog(self.next_log_seq(), self.product.id, maker_order, maker_order.size,
                                    DoneReason.DoneReasonFilled)
-                logging.info("DoneLog: {}".format(DoneLog.to_json_str(done_log)))
+                audit(AUDIT_DONE, done_log, self.tick_product)
                 logs.append(done_log)
 
-        if taker_order.type == OrderType.OrderTypeLimit and taker_order.size > 0:
+        if taker_order.type == OrderType.OrderTypeLimit and taker_order.size > 0 and \
+                taker_order.time_in_force == TimeInForceType.ImmediateOrCancel:
+            # IOC: the uncompleted size is cancelled without being put in orderBook
+            done_log = DoneLog(self.next_log_seq(), self.product.id, taker_order, taker_order.size,
+                               DoneReason.DoneReasonCancelled)
+            audit(AUDIT_DONE, done_log, self.tick_product)
+            logs.append(done_log)
+        elif taker_order.type == OrderType.OrderTypeLimit and taker_order.size > 0:
             # If taker has an uncompleted size, put taker in orderBook
             self.depths[taker_order.side].add(taker_order)
 
             open_log = OpenLog(self.next_log_seq(), self.product.id, taker_order)
-            logging.info("OpenLog: {}".format(OpenLog.to_json_str(open_log)))
+            audit(AUDIT_OPEN, open_log, self.tick_product)
             logs.append(open_log)
         else:
             remaining_size = taker_order.size
             reason = DoneReason.DoneReasonFilled
 
             if taker_order.type == OrderType.OrderTypeMarket:
+                # decimal zeros in both modes, so the log is serialized as "0" like before
                 taker_order.price = Decimal(0)
                 remaining_size = Decimal(0)
                 if (taker_order.side == Side.SideSell and taker_order.size > 0) or (
@@ -308,7 +710,7 @@ class OrderBook(object):
                     reason = DoneReason.DoneReasonCancelled
 
             done_log = DoneLog(self.next_log_seq(), self.product.id, taker_order, remaining_size, reason)
-            logging.info("DoneLog: {}".format(DoneLog.to_json_str(done_log)))
+            audit(AUDIT_DONE, done_log, self.tick_product)
             logs.append(done_log)
 
         return logs
@@ -334,42 +736,137 @@ class OrderBook(object):
 
         done_log = DoneLog(self.next_log_seq(), self.product.id, book_order, remaining_size,
                            DoneReason.DoneReasonCancelled)
-        logging.info("DoneLog: {}".format(DoneLog.to_json_str(done_log)))
+        audit(AUDIT_DONE, done_log, self.tick_product)
         logs.append(done_log)
+        self.cancels += 1
         return logs
 
-    def nullify_order(self, order: Order) -> list:
+    def mass_cancel(self, order: MassCancelOrder) -> list:
+        # cancel the resting orders of a user on the side and within the prices of the order, found
+        # through the per-user index, so k orders cost O(k log n)
         logs = list()
 
+        try:
+            self.order_id_window.put(order.id)
+        except WindowException as ex:
+            logging.error("{}".format(str(ex)))
+            return logs
+
+        sides = [order.side] if order.side is not None else [Side.SideBuy, Side.SideSell]
+        for side in sides:
+            depth = self.depths[side]
+            user_orders = depth.user_orders.get(order.user_id)
+            if user_orders is None:
+                continue
+
+            # the index is changed by decr_size, iterate over a copy
+            for order_id in list(user_orders):
+                book_order = depth.orders[order_id]
+                if (order.price_low is not None and book_order.price < order.price_low) or (
+                        order.price_high is not None and book_order.price > order.price_high):
+                    continue
+
+                remaining_size = book_order.size
+                try:
+                    depth.decr_size(order_id, remaining_size)
+                except DepthException as ex:
+                    logging.fatal("{}".format(ex))
+                    sys.exit()
+
+                done_log = DoneLog(self.next_log_seq(), self.product.id, book_order, remaining_size,
+                                   DoneReason.DoneReasonCancelled)
+                audit(AUDIT_DONE, done_log, self.tick_product)
+                logs.append(done_log)
+                self.cancels += 1
+        return logs
+
+    def nullify_order(self, order: Order) -> list:
         try:
             self.order_id_window.put(order.id)
         except WindowException as ex:
             pass
 
+        return self.reject_order(order)
+
+    def reject_order(self, order: Order) -> list:
+        # cancel a whole order that was not put in orderBook
         book_order = BookOrder.from_order(order)
         done_log = DoneLog(self.next_log_seq(), self.product.id, book_order, order.size,
                            DoneReason.DoneReasonCancelled)
-        logging.info("DoneLog: {}".format(DoneLog.to_json_str(done_log)))
-        logs.append(done_log)
-        return logs
+        audit(AUDIT_DONE, done_log, self.tick_product)
+        return [done_log]
+
+    def track_changes(self):
+        # track the changed orders for delta snapshots
+        for depth in self.depths.values():
+            depth.changed = dict()
+
+    def track_levels(self):
+        # track the changed price levels for the market data feed
+        for depth in self.depths.values():
+            depth.touched = dict()
+
+    def level_changes(self) -> List[tuple]:
+        # (side, price, size, count) of the price levels changed since the last call, the size and
+        # count are 0 for a level that is gone
+        changes = list()
+        for side, depth in self.depths.items():
+            if depth.touched is None:
+                continue
+            for key, price in depth.touched.items():
+                level = depth.levels.get(key)
+                if level is None:
+                    changes.append((side, price, self.zero, 0))
+                else:
+                    changes.append((side, level.price, level.size, len(level.orders)))
+            depth.touched = dict()
+        return changes
+
+    def pending_changes(self) -> int:
+        # number of changed orders a delta snapshot would contain
+        return sum(len(depth.changed) for depth in self.depths.values() if depth.changed is not None)
+
+    def capture(self, base_log_seq: Optional[int] = None) -> OrderBookCapture:
+        # Capture the full order book, or the changes after the snapshot at base_log_seq. A full
+        # capture is the new base of the delta snapshots.
+        if base_log_seq is not None and any(depth.changed is None for depth in self.depths.values()):
+            raise OrderBookSnapshotException("changes of the order book are not tracked")
+        return OrderBookCapture(self, base_log_seq)
 
     def snapshot(self) -> OrderBookSnapshot:
-        snapshot = OrderBookSnapshot(self.product.id, list(), self.trade_seq, self.log_seq, self.order_id_window)
-        for order in self.depths[Side.SideSell].orders.values():
-            snapshot.orders.append(order)
-        for order in self.depths[Side.SideBuy].orders.values():
-            snapshot.orders.append(order)
+        capture = self.capture()
+        snapshot = capture.materialize()
+        capture.release()
         return snapshot
 
+    def delta_snapshot(self, base_log_seq: int) -> OrderBookDelta:
+        capture = self.capture(base_log_seq)
+        delta = capture.materialize()
+        capture.release()
+        return delta
+
     def restore(self, snapshot: OrderBookSnapshot):
         self.log_seq = snapshot.log_seq
         self.trade_seq = snapshot.trade_seq
         self.order_id_window = snapshot.order_id_window
         if self.order_id_window.cap == 0:
-            self.order_id_window = Window(0, ORDER_ID_WINDOW_CAP)
+            self.order_id_window = Window(0, self.order_id_window_cap)
+        elif self.order_id_window.cap != self.order_id_window_cap:
+            # the capacity was changed since the snapshot
+            self.order_id_window = self.order_id_window.resized(self.order_id_window_cap)
 
+        orders = {Side.SideBuy: list(), Side.SideSell: list()}
         for order in snapshot.orders:
-            self.depths[order.side].add(order)
+            orders[order.side].append(order)
+        for side, depth in self.depths.items():
+            depth.load(orders[side])
+
+        # the restored orders are already in the snapshot
+        for depth in self.depths.values():
+            if depth.changed is not None:
+                depth.changed = dict()
+            if depth.touched is not None:
+                depth.touched = dict()
 
     def next_log_seq(self) -> int:
         self.log_seq += 1
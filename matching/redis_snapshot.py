@@ -1,25 +1,42 @@
 #!/usr/bin/env python
 # encoding: utf-8
-from typing import Optional
+import asyncio
+from typing import Optional, List
 
 from matching.engine import Snapshot
+from matching.snapshot_codec import JsonSnapshotCodec
 from utils.redis import RedisClient
 
 TOPIC_SNAPSHOT_PREFIX: str = "matching_snapshot_"
+TOPIC_SNAPSHOT_DELTA_PREFIX: str = "matching_snapshot_delta_"
 
 
 class RedisSnapshotStore(object):
-    def __init__(self, product_id: str, ip: str, port: int):
+    def __init__(self, product_id: str, ip: str, port: int, codec=None, redis_client: Optional[RedisClient] = None):
         self.product_id = product_id
         self.snapshot_key = "".join([TOPIC_SNAPSHOT_PREFIX, product_id])
-        self.redis_client = RedisClient(ip=ip, port=port)
+        # list of the deltas written after the snapshot
+        self.delta_key = "".join([TOPIC_SNAPSHOT_DELTA_PREFIX, product_id])
+        # the client may be shared by the snapshot stores of several products
+        self.redis_client = RedisClient(ip=ip, port=port) if redis_client is None else redis_client
+        # JsonSnapshotCodec or BinarySnapshotCodec
+        self.codec = JsonSnapshotCodec() if codec is None else codec
 
     async def store(self, snapshot: Snapshot):
-        s = Snapshot.to_json_str(snapshot=snapshot)
-        await self.redis_client.set(name=self.snapshot_key, value=s)
+        # serialize off the event loop
+        s = await asyncio.to_thread(self.codec.encode, snapshot)
+        if snapshot.is_delta():
+            await self.redis_client.rpush(name=self.delta_key, value=s)
+        else:
+            # a full snapshot replaces the previous one and its deltas
+            await self.redis_client.set_and_delete(name=self.snapshot_key, value=s, delete_name=self.delta_key)
 
     async def get_latest(self) -> Optional[Snapshot]:
         s = await self.redis_client.get(name=self.snapshot_key)
         if s is not None:
-            return Snapshot.from_json_str(s)
+            return await asyncio.to_thread(self.codec.decode, s)
         return None
+
+    async def get_deltas(self) -> List[Snapshot]:
+        deltas = await self.redis_client.lrange(name=self.delta_key, start=0, end=-1)
+        return [self.codec.decode(s) for s in deltas]
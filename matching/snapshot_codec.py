@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import io
+import struct
+from typing import Dict
+
+from matching.engine import Snapshot
+from matching.log_codec import SIDE_CODES, TIME_IN_FORCE_CODES, SIDES, TIME_IN_FORCES
+from matching.order_book import OrderBookSnapshot, OrderBookDelta, BookOrder
+from models.types import OrderType
+from utils.utils import decimal_to_raw, raw_to_decimal
+from utils.window import Window
+
+BINARY_SNAPSHOT_MAGIC: bytes = b"OBSN"
+BINARY_SNAPSHOT_VERSION: int = 1
+
+# header flags
+FLAG_ORDER_BOOK: int = 1
+FLAG_TICKS: int = 2
+FLAG_DELTA: int = 4
+
+# magic, version, flags, order_offset
+HEADER = struct.Struct("<4sBBq")
+# trade_seq, log_seq, window min, window max, window cap, bitmap length, order count
+BOOK_HEADER = struct.Struct("<qqqqqIq")
+# order_id, user_id, price, price exponent, size, size exponent, funds, funds exponent, side, type, time_in_force
+ORDER_RECORD = struct.Struct("<qqqbqbqbBBB")
+# base_log_seq, removed count
+DELTA_HEADER = struct.Struct("<qq")
+ORDER_ID = struct.Struct("<q")
+LENGTH = struct.Struct("<H")
+
+# records packed or unpacked at once while streaming
+RECORDS_PER_CHUNK: int = 4096
+
+ORDER_TYPE_CODES: Dict[OrderType, int] = {OrderType.OrderTypeLimit: 1, OrderType.OrderTypeMarket: 2}
+ORDER_TYPES: Dict[int, OrderType] = {v: k for k, v in ORDER_TYPE_CODES.items()}
+
+
+class SnapshotCodecException(Exception):
+    pass
+
+
+class JsonSnapshotCodec(object):
+    name: str = "json"
+
+    def encode(self, snapshot: Snapshot) -> bytes:
+        return Snapshot.to_json_str(snapshot).encode("utf8")
+
+    def decode(self, data) -> Snapshot:
+        return Snapshot.from_json_str(bytes(data).decode("utf8"))
+
+    def encode_to(self, snapshot: Snapshot, stream):
+        stream.write(self.encode(snapshot))
+
+    def decode_from(self, stream) -> Snapshot:
+        return self.decode(stream.read())
+
+
+class BufferReader(object):
+    # stream like reader over a buffer, reads are zero-copy memoryview slices
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.pos = 0
+
+    def read(self, n: int):
+        view = self.data[self.pos:self.pos + n]
+        self.pos += len(view)
+        return view
+
+
+def read_exactly(stream, n: int):
+    data = stream.read(n)
+    if len(data) != n:
+        raise SnapshotCodecException("truncated snapshot, expect {} bytes, got {}".format(n, len(data)))
+    return data
+
+
+class BinarySnapshotCodec(object):
+    """
+    Versioned binary snapshot format, all integers are little-endian:
+
+        header      magic "OBSN", version, flags, order_offset
+        book        product_id (u16 length + utf8), trade_seq, log_seq, window min/max/cap,
+                    bitmap length, order count, the raw bitmap bytes
+        delta       only with FLAG_DELTA: base_log_seq, removed count, the removed order ids
+        orders      fixed-width records of ORDER_RECORD
+
+    Decimal values are stored as a 64-bit coefficient and an 8-bit exponent, so they keep
+    their exponent. In tick mode (FLAG_TICKS) the coefficient is the integer tick value.
+    """
+
+    name: str = "binary"
+
+    def encode(self, snapshot: Snapshot) -> bytes:
+        stream = io.BytesIO()
+        self.encode_to(snapshot, stream)
+        return stream.getvalue()
+
+    def decode(self, data) -> Snapshot:
+        return self.decode_from(BufferReader(data))
+
+    def encode_to(self, snapshot: Snapshot, stream):
+        order_book_snapshot = snapshot.order_book_snapshot
+        if order_book_snapshot is None:
+            stream.write(HEADER.pack(BINARY_SNAPSHOT_MAGIC, BINARY_SNAPSHOT_VERSION, 0, snapshot.order_offset))
+            return
+
+        orders = order_book_snapshot.orders
+        use_ticks = len(orders) > 0 and isinstance(orders[0].price, int)
+        is_delta = isinstance(order_book_snapshot, OrderBookDelta)
+        flags = FLAG_ORDER_BOOK | (FLAG_TICKS if use_ticks else 0) | (FLAG_DELTA if is_delta else 0)
+        stream.write(HEADER.pack(BINARY_SNAPSHOT_MAGIC, BINARY_SNAPSHOT_VERSION, flags, snapshot.order_offset))
+
+        product_id = order_book_snapshot.product_id.encode("utf8")
+        stream.write(LENGTH.pack(len(product_id)))
+        stream.write(product_id)
+
+        window = order_book_snapshot.order_id_window
+        bitmap = window.bit_map.data
+        stream.write(BOOK_HEADER.pack(order_book_snapshot.trade_seq, order_book_snapshot.log_seq, window.min,
+                                      window.max, window.cap, len(bitmap), len(orders)))
+        stream.write(bitmap)
+
+        if is_delta:
+            removed = order_book_snapshot.removed
+            stream.write(DELTA_HEADER.pack(order_book_snapshot.base_log_seq, len(removed)))
+            stream.write(struct.pack("<{}q".format(len(removed)), *removed))
+
+        chunk = bytearray(ORDER_RECORD.size * RECORDS_PER_CHUNK)
+        offset = 0
+        try:
+            for order in orders:
+                if use_ticks:
+                    price, price_exponent = order.price, 0
+                    size, size_exponent = order.size, 0
+                    funds, funds_exponent = order.funds, 0
+                else:
+                    price, price_exponent = decimal_to_raw(order.price)
+                    size, size_exponent = decimal_to_raw(order.size)
+                    funds, funds_exponent = decimal_to_raw(order.funds)
+
+                ORDER_RECORD.pack_into(chunk, offset, order.order_id, order.user_id, price, price_exponent,
+                                       size, size_exponent, funds, funds_exponent, SIDE_CODES[order.side],
+                                       ORDER_TYPE_CODES[order.type], TIME_IN_FORCE_CODES[order.time_in_force])
+                offset += ORDER_RECORD.size
+                if offset == len(chunk):
+                    stream.write(chunk)
+                    offset = 0
+        except struct.error as ex:
+            raise SnapshotCodecException("order {} can not be encoded: {}".format(order.order_id, ex))
+
+        if offset > 0:
+            stream.write(memoryview(chunk)[:offset])
+
+    def decode_from(self, stream) -> Snapshot:
+        magic, version, flags, order_offset = HEADER.unpack(read_exactly(stream, HEADER.size))
+        if magic != BINARY_SNAPSHOT_MAGIC:
+            raise SnapshotCodecException("invalid snapshot magic {}".format(bytes(magic)))
+        if version != BINARY_SNAPSHOT_VERSION:
+            raise SnapshotCodecException("unsupported snapshot version {}".format(version))
+        if flags & FLAG_ORDER_BOOK == 0:
+            return Snapshot(order_book_snapshot=None, order_offset=order_offset)
+
+        use_ticks = flags & FLAG_TICKS != 0
+        product_id_length, = LENGTH.unpack(read_exactly(stream, LENGTH.size))
+        product_id = bytes(read_exactly(stream, product_id_length)).decode("utf8")
+
+        trade_seq, log_seq, window_min, window_max, window_cap, bitmap_length, order_count = BOOK_HEADER.unpack(
+            read_exactly(stream, BOOK_HEADER.size))
+        bitmap_data = bytes(read_exactly(stream, bitmap_length))
+        order_id_window = Window.from_raw(_min=window_min, _max=window_max, _cap=window_cap,
+                                          bitmap_data=bitmap_data)
+
+        is_delta = flags & FLAG_DELTA != 0
+        if is_delta:
+            base_log_seq, removed_count = DELTA_HEADER.unpack(read_exactly(stream, DELTA_HEADER.size))
+            removed = [order_id for order_id, in ORDER_ID.iter_unpack(
+                read_exactly(stream, removed_count * ORDER_ID.size))]
+
+        orders = list()
+        remaining = order_count
+        while remaining > 0:
+            n = min(remaining, RECORDS_PER_CHUNK)
+            for (order_id, user_id, price, price_exponent, size, size_exponent, funds, funds_exponent,
+                 side, _type, time_in_force) in ORDER_RECORD.iter_unpack(read_exactly(stream, n * ORDER_RECORD.size)):
+                if not use_ticks:
+                    price = raw_to_decimal(price, price_exponent)
+                    size = raw_to_decimal(size, size_exponent)
+                    funds = raw_to_decimal(funds, funds_exponent)
+                try:
+                    orders.append(BookOrder(order_id=order_id, user_id=user_id, price=price, size=size, funds=funds,
+                                            side=SIDES[side], _type=ORDER_TYPES[_type],
+                                            time_in_force=TIME_IN_FORCES[time_in_force]))
+                except KeyError as ex:
+                    raise SnapshotCodecException("invalid enum code {} of order {}".format(ex, order_id))
+            remaining -= n
+
+        if is_delta:
+            order_book_delta = OrderBookDelta(product_id=product_id, base_log_seq=base_log_seq, orders=orders,
+                                              removed=removed, trade_seq=trade_seq, log_seq=log_seq,
+                                              order_id_window=order_id_window)
+            return Snapshot(order_book_snapshot=order_book_delta, order_offset=order_offset)
+
+        order_book_snapshot = OrderBookSnapshot(product_id=product_id, orders=orders, trade_seq=trade_seq,
+                                                log_seq=log_seq, order_id_window=order_id_window)
+        return Snapshot(order_book_snapshot=order_book_snapshot, order_offset=order_offset)
+
+
+SNAPSHOT_CODECS = {
+    JsonSnapshotCodec.name: JsonSnapshotCodec,
+    BinarySnapshotCodec.name: BinarySnapshotCodec,
+}
+
+
+def new_snapshot_codec(name: str):
+    codec_class = SNAPSHOT_CODECS.get(name)
+    if codec_class is None:
+        raise SnapshotCodecException("unknown snapshot format {}".format(name))
+    return codec_class()
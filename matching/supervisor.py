@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import time
+from bisect import bisect_right
+from multiprocessing.connection import wait as wait_connections
+from typing import List, Dict, Optional
+
+from models.models import Product
+
+# points of each worker on the hash ring
+HASH_RING_REPLICAS: int = 64
+# restart delay of a worker that crashes repeatedly is doubled up to this
+MAX_RESTART_BACKOFF: float = 60
+
+
+class SupervisorException(Exception):
+    pass
+
+
+def ring_hash(key: str) -> int:
+    # stable across processes, unlike hash()
+    return int.from_bytes(hashlib.md5(key.encode("utf8")).digest()[:8], "little")
+
+
+def assign_products(products: List[Product], workers: int, pinned: Optional[Dict[str, int]] = None) \
+        -> List[List[Product]]:
+    # The products of each worker: pinned products go to their worker, the others are placed on a
+    # consistent hash ring, so adding a worker only moves the products of its ring segments
+    if workers <= 0:
+        raise SupervisorException("invalid number of workers {}".format(workers))
+    pinned = pinned or dict()
+
+    ring = sorted((ring_hash("worker-{}-{}".format(worker, i)), worker)
+                  for worker in range(workers) for i in range(HASH_RING_REPLICAS))
+    points = [point for point, _ in ring]
+
+    assignment: List[List[Product]] = [list() for _ in range(workers)]
+    for product in products:
+        worker = pinned.get(product.id)
+        if worker is None:
+            worker = ring[bisect_right(points, ring_hash(product.id)) % len(ring)][1]
+        elif not 0 <= worker < workers:
+            raise SupervisorException("product {} is pinned to unknown worker {}".format(product.id, worker))
+        assignment[worker].append(product)
+    return assignment
+
+
+def run_worker(worker_id: int, products: List[Product], conn, health_interval: float):
+    # entry point of a worker process: an EngineHost for its products, reporting health over conn
+    import config
+    from matching.host import EngineHost
+
+    logging.basicConfig(format="%(asctime)s - worker-{} - %(levelname)s - %(message)s".format(worker_id),
+                        level=logging.INFO)
+
+    async def run():
+        host = EngineHost(products=products, settings=config, worker_id=worker_id)
+
+        async def report_health():
+            while True:
+                conn.send({"worker": worker_id, "time": time.time(), "stats": host.stats()})
+                await asyncio.sleep(health_interval)
+
+        await asyncio.gather(host.start(), report_health())
+
+    asyncio.run(run())
+
+
+class WorkerProcess(object):
+    def __init__(self, worker_id: int, products: List[Product]):
+        self.worker_id: int = worker_id
+        self.products: List[Product] = products
+        self.process = None
+        self.conn = None
+        # monotonic times of the last start and the last health report
+        self.started_at: float = 0
+        self.last_health_at: float = 0
+        self.health: dict = dict()
+        self.restarts: int = 0
+        # monotonic time of the pending restart, None while running
+        self.restart_at: Optional[float] = None
+        # orders applied at the previous throughput report
+        self.last_orders: int = 0
+
+
+class Supervisor(object):
+    """
+    Runs the products in worker processes, each an EngineHost with its own event loop, so
+    independent products match on several cores.
+
+    Workers report their health and counters over a pipe every health_interval seconds. A
+    worker that exits, or stops reporting for health_timeout seconds, is restarted with a
+    backoff and restores its engines from their latest snapshots.
+    """
+
+    def __init__(self, products: List[Product], workers: int, pinned: Optional[Dict[str, int]] = None,
+                 health_interval: float = 5, health_timeout: float = 30, restart_backoff: float = 1,
+                 worker_target=run_worker):
+        self.health_interval: float = health_interval
+        self.health_timeout: float = health_timeout
+        self.restart_backoff: float = restart_backoff
+        self.worker_target = worker_target
+        # spawn, so the workers do not inherit the event loop or the connections of the supervisor
+        self.context = multiprocessing.get_context("spawn")
+        self.workers: List[WorkerProcess] = [WorkerProcess(worker_id, worker_products) for worker_id, worker_products
+                                             in enumerate(assign_products(products, workers, pinned))
+                                             if len(worker_products) > 0]
+        self.last_report_at: float = time.monotonic()
+
+    def start_worker(self, worker: WorkerProcess):
+        recv_conn, send_conn = self.context.Pipe(duplex=False)
+        worker.process = self.context.Process(target=self.worker_target,
+                                              args=(worker.worker_id, worker.products, send_conn,
+                                                    self.health_interval),
+                                              name="matching-worker-{}".format(worker.worker_id), daemon=True)
+        worker.process.start()
+        # the worker holds the sending end
+        send_conn.close()
+        worker.conn = recv_conn
+        worker.started_at = worker.last_health_at = time.monotonic()
+        worker.restart_at = None
+        worker.health = dict()
+        worker.last_orders = 0
+        logging.info("worker {} started: pid={} products={}".format(
+            worker.worker_id, worker.process.pid, [product.id for product in worker.products]))
+
+    def stop_worker(self, worker: WorkerProcess):
+        if worker.process is not None and worker.process.is_alive():
+            worker.process.terminate()
+            worker.process.join(timeout=5)
+        if worker.conn is not None:
+            worker.conn.close()
+            worker.conn = None
+
+    def schedule_restart(self, worker: WorkerProcess, reason: str):
+        self.stop_worker(worker)
+        # back off when the worker did not stay up long
+        if time.monotonic() - worker.started_at < MAX_RESTART_BACKOFF:
+            delay = min(self.restart_backoff * 2 ** worker.restarts, MAX_RESTART_BACKOFF)
+        else:
+            worker.restarts = 0
+            delay = self.restart_backoff
+        worker.restarts += 1
+        worker.restart_at = time.monotonic() + delay
+        logging.error("worker {} {}, restart in {:.1f}s".format(worker.worker_id, reason, delay))
+
+    def poll(self, timeout: float):
+        # read the health reports of the workers
+        conns = {worker.conn: worker for worker in self.workers if worker.conn is not None}
+        for conn in wait_connections(list(conns.keys()), timeout=timeout):
+            worker = conns[conn]
+            try:
+                while conn.poll():
+                    worker.health = conn.recv()
+                    worker.last_health_at = time.monotonic()
+            except (EOFError, OSError):
+                # the worker exited, check() restarts it
+                worker.conn.close()
+                worker.conn = None
+
+    def check(self):
+        now = time.monotonic()
+        for worker in self.workers:
+            if worker.restart_at is not None:
+                if now >= worker.restart_at:
+                    self.start_worker(worker)
+            elif not worker.process.is_alive():
+                self.schedule_restart(worker, "exited with code {}".format(worker.process.exitcode))
+            elif now - worker.last_health_at > self.health_timeout:
+                self.schedule_restart(worker, "sent no health report for {:.0f}s".format(now - worker.last_health_at))
+
+    def report(self) -> Dict[int, float]:
+        # orders per second of each worker since the previous report, computed from the cumulative counters
+        now = time.monotonic()
+        elapsed = max(now - self.last_report_at, 1e-9)
+        rates = dict()
+        for worker in self.workers:
+            orders = sum(stats["orders"] for stats in worker.health.get("stats", {}).values())
+            rates[worker.worker_id] = max(orders - worker.last_orders, 0) / elapsed
+            worker.last_orders = orders
+        self.last_report_at = now
+        logging.info("workers: {} total={:.0f} orders/s".format(
+            " ".join("{}={:.0f}".format(worker_id, rate) for worker_id, rate in rates.items()), sum(rates.values())))
+        return rates
+
+    def run(self):
+        for worker in self.workers:
+            self.start_worker(worker)
+
+        try:
+            while True:
+                self.poll(timeout=self.health_interval)
+                self.check()
+                if time.monotonic() - self.last_report_at >= self.health_interval:
+                    self.report()
+        finally:
+            for worker in self.workers:
+                self.stop_worker(worker)
@@ -2,9 +2,17 @@
 # encoding: utf-8
 import json
 from decimal import Decimal
+from typing import Optional
 
 from models.types import OrderType, Side, TimeInForceType, OrderStatus
-from utils.utils import JsonEncoder
+from utils.utils import JsonEncoder, to_ticks, ticks_within, from_ticks, slots_dict
+
+
+# enum values of the order messages
+ORDER_TYPES = {order_type.value: order_type for order_type in OrderType}
+SIDES = {side.value: side for side in Side}
+TIME_IN_FORCES = {time_in_force.value: time_in_force for time_in_force in TimeInForceType}
+ORDER_STATUSES = {status.value: status for status in OrderStatus}
 
 
 class OrderException(Exception):
@@ -21,6 +29,9 @@ class Product(object):
 
 
 class Order(object):
+    __slots__ = ("id", "created_at", "product_id", "user_id", "client_oid", "price", "size", "funds", "type",
+                 "side", "time_in_force", "status")
+
     def __init__(self, _id: int, created_at: int, product_id: str, user_id: int, client_oid: str, price: Decimal,
                  size: Decimal, funds: Decimal, _type: OrderType, side: Side, time_in_force: TimeInForceType,
                  status: OrderStatus):
@@ -38,12 +49,28 @@ class Order(object):
         self.status: OrderStatus = status
 
     @staticmethod
-    def to_json_str(order):
-        return json.dumps(vars(order), cls=JsonEncoder)
+    def to_json_str(order, product: Optional[Product] = None):
+        # If the product is given, the integer ticks of an order in tick mode are written as decimals of the product
+        order_dict = slots_dict(order)
+        if product is not None:
+            order_dict["price"] = from_ticks(order_dict["price"], product.quote_scale)
+            order_dict["size"] = from_ticks(order_dict["size"], product.base_scale)
+            order_dict["funds"] = from_ticks(order_dict["funds"], product.base_scale + product.quote_scale)
+            for name in ("price_low", "price_high"):
+                if order_dict.get(name) is not None:
+                    order_dict[name] = from_ticks(order_dict[name], product.quote_scale)
+        return json.dumps(order_dict, cls=JsonEncoder)
+
+    @staticmethod
+    def from_json_str(json_str: str, product: Optional[Product] = None):
+        # If the product is given, price, size and funds are scaled to integer ticks of
+        # quote_scale, base_scale and base_scale + quote_scale
+        return Order.from_dict(json.loads(json_str), product)
 
     @staticmethod
-    def from_json_str(json_str: str):
-        order_dict = json.loads(json_str)
+    def from_dict(order_dict: dict, product: Optional[Product] = None):
+        if order_dict.get("type") == OrderType.OrderTypeMassCancel.value:
+            return MassCancelOrder.from_dict(order_dict, product)
 
         order_id = int(order_dict.get("id"))
         order_created_at = int(order_dict.get("created_at"))
@@ -53,51 +80,90 @@ class Order(object):
         order_price = Decimal(order_dict.get("price"))
         order_size = Decimal(order_dict.get("size"))
         order_funds = Decimal(order_dict.get("funds"))
+        order_class = Order
+        if product is not None:
+            try:
+                order_price, order_size, order_funds = (to_ticks(order_price, product.quote_scale),
+                                                        to_ticks(order_size, product.base_scale),
+                                                        to_ticks(order_funds, product.base_scale + product.quote_scale))
+            except ValueError:
+                # more decimal places than the product, kept as decimals for the order book to reject it
+                order_class = InvalidOrder
 
-        _type = order_dict.get("type")
-        if _type == "limit":
-            order_type = OrderType.OrderTypeLimit
-        elif _type == "market":
-            order_type = OrderType.OrderTypeMarket
-        else:
+        order_type = ORDER_TYPES.get(order_dict.get("type"))
+        if order_type is None:
             raise OrderException("invalid OrderType")
 
-        side = order_dict.get("side")
-        if side == "buy":
-            order_side = Side.SideBuy
-        elif side == "sell":
-            order_side = Side.SideSell
-        else:
+        order_side = SIDES.get(order_dict.get("side"))
+        if order_side is None:
             raise OrderException("invalid Side")
 
-        time_in_force = order_dict.get("time_in_force")
-        if time_in_force == "GTC":
-            order_time_in_force = TimeInForceType.GoodTillCanceled
-        elif time_in_force == "IOC":
-            order_time_in_force = TimeInForceType.ImmediateOrCancel
-        elif time_in_force == "GTX":
-            order_time_in_force = TimeInForceType.GoodTillCrossing
-        elif time_in_force == "FOK":
-            order_time_in_force = TimeInForceType.FillOrKill
-        else:
+        order_time_in_force = TIME_IN_FORCES.get(order_dict.get("time_in_force"))
+        if order_time_in_force is None:
             raise OrderException("invalid TimeInForceType")
 
-        status = order_dict.get("status")
-        if status == "new":
-            order_status = OrderStatus.OrderStatusNew
-        elif status == "open":
-            order_status = OrderStatus.OrderStatusOpen
-        elif status == "cancelling":
-            order_status = OrderStatus.OrderStatusCancelling
-        elif status == "cancelled":
-            order_status = OrderStatus.OrderStatusCancelled
-        elif status == "partial":
-            order_status = OrderStatus.OrderStatusPartial
-        elif status == "filled":
-            order_status = OrderStatus.OrderStatusFilled
-        else:
+        order_status = ORDER_STATUSES.get(order_dict.get("status"))
+        if order_status is None:
+            raise OrderException("invalid OrderStatus")
+
+        return order_class(_id=order_id, created_at=order_created_at, product_id=order_product_id,
+                           user_id=order_user_id, client_oid=order_client_oid, price=order_price, size=order_size,
+                           funds=order_funds, _type=order_type, side=order_side, time_in_force=order_time_in_force,
+                           status=order_status)
+
+
+class InvalidOrder(Order):
+    """
+    An order of a tick mode product whose price, size or funds have more decimal places than the
+    scales of the product, so they are kept as decimals. The order book cancels it whole with a
+    DoneLog, a cancel request of such an order is applied as any other.
+    """
+
+    __slots__ = ()
+
+
+class MassCancelOrder(Order):
+    """
+    Cancels all the resting orders of user_id in one step, only those of side if it is set, and
+    only those priced within [price_low, price_high] if the bounds are set.
+    """
+
+    __slots__ = ("price_low", "price_high")
+
+    def __init__(self, _id: int, created_at: int, product_id: str, user_id: int, side: Optional[Side] = None,
+                 price_low: Optional[Decimal] = None, price_high: Optional[Decimal] = None, client_oid: str = "",
+                 status: OrderStatus = OrderStatus.OrderStatusNew):
+        super().__init__(_id=_id, created_at=created_at, product_id=product_id, user_id=user_id,
+                         client_oid=client_oid, price=Decimal(0), size=Decimal(0), funds=Decimal(0),
+                         _type=OrderType.OrderTypeMassCancel, side=side,
+                         time_in_force=TimeInForceType.GoodTillCanceled, status=status)
+        self.price_low: Optional[Decimal] = price_low
+        self.price_high: Optional[Decimal] = price_high
+
+    @staticmethod
+    def from_dict(order_dict: dict, product: Optional[Product] = None):
+        # side and the price bounds are optional, null or missing
+        order_side = None
+        if order_dict.get("side"):
+            order_side = SIDES.get(order_dict.get("side"))
+            if order_side is None:
+                raise OrderException("invalid Side")
+
+        prices = list()
+        for name, upper in (("price_low", False), ("price_high", True)):
+            price = order_dict.get(name)
+            if price is not None:
+                price = Decimal(price)
+                if product is not None:
+                    # the ticks within the bounds, which select the same prices of the product
+                    price = ticks_within(price, product.quote_scale, upper)
+            prices.append(price)
+
+        order_status = ORDER_STATUSES.get(order_dict.get("status", OrderStatus.OrderStatusNew.value))
+        if order_status is None:
             raise OrderException("invalid OrderStatus")
 
-        return Order(_id=order_id, created_at=order_created_at, product_id=order_product_id, user_id=order_user_id,
-                     client_oid=order_client_oid, price=order_price, size=order_size, funds=order_funds,
-                     _type=order_type, side=order_side, time_in_force=order_time_in_force, status=order_status)
+        return MassCancelOrder(_id=int(order_dict.get("id")), created_at=int(order_dict.get("created_at")),
+                               product_id=order_dict.get("product_id"), user_id=int(order_dict.get("user_id")),
+                               side=order_side, price_low=prices[0], price_high=prices[1],
+                               client_oid=order_dict.get("client_oid", ""), status=order_status)
@@ -6,6 +6,8 @@ from enum import Enum
 class OrderType(Enum):
     OrderTypeLimit = "limit"
     OrderTypeMarket = "market"
+    # cancels the resting orders of a user, see MassCancelOrder
+    OrderTypeMassCancel = "mass_cancel"
 
 
 class Side(Enum):
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import argparse
+import asyncio
+import logging
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+from typing import Optional, List
+
+import config
+from matching.engine import Engine
+from matching.file_snapshot import FileSnapshotStore
+from matching.file_store import read_order_file, write_order_file, FileLogStore, read_log_file
+from matching.host import load_products
+from matching.kafka_order import KafkaOrderReader
+from matching.memory import MemoryConsumer, MemoryLogStore, MemorySnapshotStore
+from matching.snapshot_codec import new_snapshot_codec
+from models.models import Order, Product
+
+# interval of the queue depth samples and of the end of replay checks
+REPLAY_SAMPLE_INTERVAL: float = 0.005
+# latency histograms of EngineStats in the report
+LATENCIES = ("fetch_to_apply", "apply", "apply_to_commit", "log_store", "snapshot_materialize", "snapshot_store")
+
+
+def select_product(product_id: Optional[str]) -> Product:
+    products = load_products(config)
+    for product in products:
+        if product_id is None or product.id == product_id:
+            return product
+    raise ValueError("unknown product {}".format(product_id))
+
+
+def new_engine(args, product: Product, consumer: MemoryConsumer) -> Engine:
+    # the engine of main.py, with the kafka and redis stand-ins
+    tick_product = product if args.ticks else None
+    order_reader = KafkaOrderReader(product_id=product.id, brokers=config.kafka_brokers, group_id="replay",
+                                    product=tick_product, max_records=config.fetch_max_records,
+                                    decode_in_thread=config.fetch_decode_in_thread, consumer=consumer)
+    if args.logs:
+        log_store = FileLogStore(args.logs, product=tick_product, log_format=args.log_format)
+    else:
+        log_store = MemoryLogStore(product=tick_product, log_format=args.log_format)
+
+    codec = new_snapshot_codec(config.snapshot_format)
+    if args.snapshot_dir:
+        snapshot_store = FileSnapshotStore(product_id=product.id, directory=args.snapshot_dir,
+                                           generations=config.snapshot_generations, codec=codec)
+    else:
+        snapshot_store = MemorySnapshotStore(codec=codec)
+
+    return Engine(product=product, order_reader=order_reader, log_store=log_store, snapshot_store=snapshot_store,
+                  use_ticks=args.ticks, snapshot_delta_chain=config.snapshot_delta_chain,
+                  snapshot_delta_max_changes=config.snapshot_delta_max_changes,
+                  max_batch_size=config.max_batch_size, commit_linger_ms=config.commit_linger_ms,
+                  commit_max_records=config.commit_max_records, commit_max_bytes=config.commit_max_bytes,
+                  commit_max_in_flight=config.commit_max_in_flight, order_id_window_cap=config.order_id_window_cap,
+                  snapshot_interval=args.snapshot_interval)
+
+
+async def replay(args) -> dict:
+    # feed the order file through the fetcher, applier, committer and snapshots of an engine, until
+    # every order is applied and all their logs are committed
+    product = select_product(args.product)
+    consumer = MemoryConsumer(read_order_file(args.orders))
+    engine = new_engine(args, product, consumer)
+    await engine.initialize_snapshot()
+
+    stats = engine.stats
+    samples = 0
+    order_chan_total = order_chan_max = log_chan_max = 0
+    start = time.perf_counter()
+    task = asyncio.create_task(engine.start())
+    try:
+        while True:
+            await asyncio.sleep(REPLAY_SAMPLE_INTERVAL)
+            if task.done():
+                # the engine stopped on an error
+                task.result()
+                raise RuntimeError("engine stopped")
+
+            samples += 1
+            order_chan_total += engine.order_chan.qsize()
+            order_chan_max = max(order_chan_max, engine.order_chan.qsize())
+            log_chan_max = max(log_chan_max, engine.log_chan.qsize())
+            if consumer.exhausted() and stats.orders == stats.fetched and engine.log_chan.empty() and \
+                    stats.committed_seq == engine.order_book.log_seq:
+                break
+        elapsed = time.perf_counter() - start
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        if isinstance(engine.log_store, FileLogStore):
+            engine.log_store.close()
+
+    return {
+        "orders": stats.orders,
+        "logs": stats.logs,
+        "seconds": elapsed,
+        "orders_per_sec": stats.orders / elapsed,
+        "logs_per_sec": stats.logs / elapsed,
+        "batches": stats.batches,
+        "apply_ms": stats.apply_ns / 1e6,
+        "order_chan_mean": order_chan_total / max(samples, 1),
+        "order_chan_max": order_chan_max,
+        "log_chan_max": log_chan_max,
+        "snapshots": stats.snapshots,
+        "captures": stats.captures,
+        "capture_mean_us": stats.capture_ns / max(stats.captures, 1) / 1000,
+        "capture_max_us": stats.max_capture_ns / 1000,
+        "latencies": {name: getattr(stats, name) for name in LATENCIES},
+    }
+
+
+def run(args) -> int:
+    report = asyncio.run(replay(args))
+    print("orders={orders} logs={logs} in {seconds:.3f}s: {orders_per_sec:.0f} orders/s {logs_per_sec:.0f} logs/s"
+          .format(**report))
+    print("batches={batches} apply={apply_ms:.0f}ms order_chan mean={order_chan_mean:.0f} max={order_chan_max} "
+          "log_chan max={log_chan_max}".format(**report))
+    print("snapshots stored={snapshots} captured={captures} pause mean={capture_mean_us:.0f}us "
+          "max={capture_max_us:.0f}us".format(**report))
+    for name, histogram in report["latencies"].items():
+        print("{:<21} n={:<8} p50={:.0f}us p99={:.0f}us p99.9={:.0f}us".format(
+            name, histogram.count, histogram.percentile(0.5) / 1000, histogram.percentile(0.99) / 1000,
+            histogram.percentile(0.999) / 1000))
+    return 0
+
+
+def generate(args) -> int:
+    # an order file of the seeded flow of benchmarks.order_flow
+    from benchmarks.order_flow import OrderFlowGenerator
+    product = select_product(args.product)
+    generator = OrderFlowGenerator(product, seed=args.seed, target_depth=args.depth)
+    messages = list()
+    for order in generator.book_orders(args.depth) + generator.orders(args.count):
+        messages.append(Order.to_json_str(order).encode("utf8"))
+    write_order_file(args.orders, messages)
+    print("{} orders written to {}".format(len(messages), args.orders))
+    return 0
+
+
+def comparable(log: dict) -> dict:
+    # a log without its time, with its amounts as decimals: logs in ticks keep the trailing zeros of their scale
+    values = dict()
+    for k, v in log.items():
+        if k == "time":
+            continue
+        if isinstance(v, str):
+            try:
+                v = Decimal(v)
+            except InvalidOperation:
+                pass
+        values[k] = v
+    return values
+
+
+def compare(args) -> int:
+    # the logs of two replays
+    logs = list()
+    for path in (args.first, args.second):
+        logs.append([comparable(log) for log in read_log_file(path, args.log_format)])
+
+    for i, (first, second) in enumerate(zip(*logs)):
+        if first != second:
+            print("log {} differs:\n  {}\n  {}".format(i, first, second))
+            return 1
+    if len(logs[0]) != len(logs[1]):
+        print("{} logs and {} logs".format(len(logs[0]), len(logs[1])))
+        return 1
+    print("{} logs are identical".format(len(logs[0])))
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="offline replay of an order file through the matching engine")
+    parser.add_argument("--product", type=str, help="product of config, the first one by default")
+    parser.add_argument("--verbose", action="store_true", help="log at INFO, including the audit log")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="replay an order file")
+    run_parser.add_argument("orders", help="order messages, .json/.jsonl lines or a binary dump")
+    run_parser.add_argument("--logs", type=str, help="write the logs to this file")
+    run_parser.add_argument("--log-format", type=str, default=config.log_format, help="json or binary")
+    run_parser.add_argument("--ticks", action="store_true", default=config.use_ticks)
+    run_parser.add_argument("--snapshot-dir", type=str, help="file snapshot store, in memory by default")
+    run_parser.add_argument("--snapshot-interval", type=float, default=1.0)
+
+    generate_parser = commands.add_parser("generate", help="write an order file of a seeded order flow")
+    generate_parser.add_argument("orders")
+    generate_parser.add_argument("--count", type=int, default=100000)
+    generate_parser.add_argument("--depth", type=int, default=10000)
+    generate_parser.add_argument("--seed", type=int, default=1)
+
+    compare_parser = commands.add_parser("compare", help="compare the log files of two replays")
+    compare_parser.add_argument("first")
+    compare_parser.add_argument("second")
+    compare_parser.add_argument("--log-format", type=str, default=config.log_format)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+                        level=logging.INFO if args.verbose else logging.WARNING)
+    return {"run": run, "generate": generate, "compare": compare}[args.command](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import logging
+from unittest import TestCase
+
+from matching.order_book import OrderBook
+from models.models import Order, Product
+from models.types import Side
+from tests.test_order_book import new_order
+from utils.audit import AuditLogger, AUDIT_MATCH, AUDIT_FETCH, AUDIT_DONE, AUDIT_OPEN
+
+
+class Record(object):
+    # counts its serializations
+    serialized = 0
+
+    def __init__(self, i: int):
+        self.i = i
+
+    @staticmethod
+    def to_json_str(record):
+        Record.serialized += 1
+        return '{{"i": {}}}'.format(record.i)
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = list()
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class AuditLoggerTest(TestCase):
+    def setUp(self):
+        self.logger = logging.getLogger("test.audit")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.handler = ListHandler()
+        self.logger.addHandler(self.handler)
+        Record.serialized = 0
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+
+    def test_levels_and_sampling(self):
+        audit_logger = AuditLogger(logger=self.logger, levels={AUDIT_DONE: "WARNING"},
+                                   sample_every={AUDIT_MATCH: 3})
+        for i in range(1, 7):
+            audit_logger.event(AUDIT_MATCH, Record(i))
+            # fetch is DEBUG, not enabled
+            audit_logger.event(AUDIT_FETCH, Record(i))
+        audit_logger.event(AUDIT_DONE, Record(7))
+
+        self.assertEqual(self.handler.messages, ['MatchLog: {"i": 3}', 'MatchLog: {"i": 6}', 'DoneLog: {"i": 7}'])
+        # the records that are not written are not serialized
+        self.assertEqual(Record.serialized, 3)
+
+    def test_tick_mode(self):
+        product = Product(_id="BTC-USD", base_currency="BTC", quote_currency="USD", base_scale=6, quote_scale=2)
+        audit_logger = AuditLogger(logger=self.logger, levels={AUDIT_FETCH: "INFO"}, flush_interval=60)
+        audit_logger.start()
+        order_book = OrderBook(product, 0, 0, use_ticks=True)
+        order = Order.from_json_str(Order.to_json_str(new_order(1, Side.SideBuy, "10.50", "1.250000")), product)
+        audit_logger.event(AUDIT_FETCH, order, order_book.tick_product)
+        for log in order_book.apply_order(order):
+            audit_logger.event(AUDIT_OPEN, log, order_book.tick_product)
+        audit_logger.stop()
+
+        # the ticks are written as the decimals of the product, like in decimal mode
+        fetch, open_log = self.handler.messages
+        self.assertIn('"price": "10.50", "size": "1.250000", "funds": "0E-8"', fetch)
+        self.assertIn('"remaining_size": "1.250000", "price": "10.50"', open_log)
+
+    def test_background_thread(self):
+        audit_logger = AuditLogger(logger=self.logger, ring_size=4, flush_interval=60)
+        audit_logger.start()
+        for i in range(6):
+            audit_logger.event(AUDIT_MATCH, Record(i))
+        # nothing is written by the applier, the records beyond the ring are dropped
+        self.assertEqual(self.handler.messages, [])
+        self.assertEqual((len(audit_logger.ring), audit_logger.dropped), (4, 2))
+
+        audit_logger.stop()
+        self.assertEqual(self.handler.messages, ['MatchLog: {{"i": {}}}'.format(i) for i in range(4)] +
+                         ["audit log dropped 2 records, ring size 4"])
+        audit_logger.event(AUDIT_MATCH, Record(9))
+        self.assertEqual(self.handler.messages[-1], 'MatchLog: {"i": 9}')
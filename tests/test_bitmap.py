@@ -3,6 +3,7 @@
 from unittest import TestCase
 
 from utils.bitmap import BitMap
+from utils.window import Window, WindowException
 
 
 class UtilsTest(TestCase):
@@ -29,3 +30,47 @@ class UtilsTest(TestCase):
         bitmap.set(3, False)
         b = bitmap.get(3)
         self.assertEqual(b, False)
+
+    def test_clear_range(self):
+        for start, end in [(0, 100), (3, 5), (5, 30), (8, 16), (13, 99)]:
+            bitmap = BitMap(100)
+            for i in range(100):
+                bitmap.set(i, True)
+            bitmap.clear_range(start, end)
+            self.assertEqual([i for i in range(100) if not bitmap.get(i)], list(range(start, end)))
+
+    def test_from_data(self):
+        bitmap = BitMap(16)
+        bitmap.set(9, True)
+        # raw bytes, base64 written by JsonEncoder and the list of ints of older snapshots
+        for data in (bytes(bitmap.data), "AAI=", [0, 2]):
+            self.assertEqual(BitMap.from_data(data).data, bytearray(b"\x00\x02"))
+
+    def test_window_slide_clears_expired_ids(self):
+        window = Window(0, 16)
+        for val in range(1, 17):
+            window.put(val)
+        with self.assertRaises(WindowException):
+            window.put(9)
+
+        # 25 takes the bit of 9, which left the window with the jump to 40
+        window.put(40)
+        window.put(25)
+        with self.assertRaises(WindowException):
+            window.put(25)
+        with self.assertRaises(WindowException):
+            window.put(24)
+
+        # a jump beyond the capacity clears the whole ring
+        window.put(1000)
+        for val in range(985, 1000):
+            window.put(val)
+
+    def test_window_resized(self):
+        window = Window(0, 16)
+        for val in (3, 10, 14, 16):
+            window.put(val)
+        resized = window.resized(8)
+        self.assertEqual((resized.min, resized.max), (8, 16))
+        self.assertEqual([val for val in range(9, 17) if resized.bit_map.get(val % 8)], [10, 14, 16])
+        self.assertEqual([val for val in range(1, 17) if window.resized(32).bit_map.get(val % 32)], [3, 10, 14, 16])
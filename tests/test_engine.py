@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import asyncio
+import json
+import time
+from typing import List
+from unittest import IsolatedAsyncioTestCase
+
+from matching.engine import Engine, OffsetOrder, Snapshot
+from matching.memory import MemoryLogStore
+from models.models import Product
+from models.types import Side
+from tests.test_order_book import new_order
+
+
+def log_seqs(log_store: MemoryLogStore) -> List[int]:
+    return [json.loads(payload)["sequence"] for payload in log_store.payloads]
+
+
+class EngineTest(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.product = Product(_id="BTC-USD", base_currency="BTC", quote_currency="USD", base_scale=6,
+                               quote_scale=2)
+        self.log_store = MemoryLogStore()
+        self.engine = Engine(product=self.product, order_reader=None, log_store=self.log_store,
+                             snapshot_store=None, max_batch_size=3)
+        self.tasks = list()
+
+    async def asyncTearDown(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def run_until(self, condition):
+        for _ in range(100):
+            if condition():
+                return
+            await asyncio.sleep(0)
+        self.fail("condition not reached")
+
+    async def test_applier_batches(self):
+        for i in range(1, 6):
+            await self.engine.order_chan.put(OffsetOrder(i, new_order(i, Side.SideSell, "10.00", "1.000000")))
+        self.tasks.append(asyncio.create_task(self.engine.run_applier()))
+
+        await self.run_until(lambda: self.engine.log_chan.qsize() == 2)
+        batches = [self.engine.log_chan.get_nowait() for _ in range(2)]
+        self.assertEqual([len(batch) for batch in batches], [3, 2])
+        self.assertEqual([log.get_seq() for batch in batches for log in batch], [1, 2, 3, 4, 5])
+
+        # a matching order yields a single batch with all its logs
+        await self.engine.order_chan.put(OffsetOrder(6, new_order(6, Side.SideBuy, "10.00", "2.000000")))
+        await self.run_until(lambda: self.engine.log_chan.qsize() == 1)
+        self.assertEqual(len(self.engine.log_chan.get_nowait()), 5)
+
+    async def test_committer_approves_snapshot(self):
+        self.tasks.append(asyncio.create_task(self.engine.run_applier()))
+        self.tasks.append(asyncio.create_task(self.engine.run_committer()))
+        for i in range(1, 5):
+            await self.engine.order_chan.put(OffsetOrder(i, new_order(i, Side.SideSell, "10.00", "1.000000")))
+        await self.run_until(lambda: len(log_seqs(self.log_store)) == 4)
+
+        snapshot = Snapshot(order_book_snapshot=self.engine.order_book.capture(), order_offset=4)
+        await self.engine.snapshot_approve_req_chan.put(snapshot)
+        await self.run_until(lambda: self.engine.snapshot_chan.qsize() == 1)
+        self.assertIs(self.engine.snapshot_chan.get_nowait(), snapshot)
+        self.assertEqual(log_seqs(self.log_store), [1, 2, 3, 4])
+
+    async def test_latency_histograms(self):
+        self.tasks.append(asyncio.create_task(self.engine.run_applier()))
+        self.tasks.append(asyncio.create_task(self.engine.run_committer()))
+        fetched_ns = time.perf_counter_ns()
+        for i in range(1, 5):
+            await self.engine.order_chan.put(OffsetOrder(i, new_order(i, Side.SideSell, "10.00", "1.000000"),
+                                                         fetched_ns=fetched_ns))
+        await self.run_until(lambda: self.engine.stats.committed_seq == 4)
+
+        # two batches of the four orders of one fetch, their logs acknowledged
+        stats = self.engine.stats
+        self.assertEqual(stats.apply.count, 2)
+        self.assertEqual(stats.fetch_to_apply.count, 4)
+        self.assertEqual(stats.apply_to_commit.count, 2)
+        self.assertGreaterEqual(stats.log_store.count, 1)
+        self.assertEqual(len(self.engine.applied_batches), 0)
+
+    async def test_committer_contiguous_acks(self):
+        self.log_store.auto_ack = False
+        self.engine.commit_linger_ms = 0
+        self.engine.commit_max_in_flight = 2
+        self.tasks.append(asyncio.create_task(self.engine.run_committer()))
+        # let the committer read its starting seq
+        await asyncio.sleep(0)
+
+        order_book = self.engine.order_book
+        for i in range(1, 4):
+            await self.engine.log_chan.put(order_book.apply_order(new_order(i, Side.SideSell, "10.00", "1.000000")))
+            await self.run_until(lambda: len(self.log_store.futures) == min(i, 2))
+        # at most two groups in flight
+        self.assertEqual(log_seqs(self.log_store), [1, 2])
+
+        await self.engine.snapshot_approve_req_chan.put(Snapshot(order_book.capture(), 3))
+        # the second group is acknowledged before the first, nothing is committed yet
+        self.log_store.futures[1].set_result(None)
+        for _ in range(10):
+            await asyncio.sleep(0)
+        self.assertEqual(self.engine.snapshot_chan.qsize(), 0)
+
+        self.log_store.futures[0].set_result(None)
+        await self.run_until(lambda: len(self.log_store.futures) == 3)
+        self.log_store.futures[2].set_result(None)
+        await self.run_until(lambda: self.engine.snapshot_chan.qsize() == 1)
+        self.assertEqual(log_seqs(self.log_store), [1, 2, 3])
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import os
+import tempfile
+from unittest import IsolatedAsyncioTestCase
+
+from matching.engine import Snapshot
+from matching.file_snapshot import FileSnapshotStore
+from matching.order_book import OrderBook
+from matching.snapshot_codec import JsonSnapshotCodec
+from models.models import Product
+from models.types import Side
+from tests.test_order_book import new_order
+from tests.test_snapshot import order_book_state
+
+
+class FileSnapshotStoreTest(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.product = Product(_id="BTC-USD", base_currency="BTC", quote_currency="USD", base_scale=6,
+                               quote_scale=2)
+        self.directory = tempfile.TemporaryDirectory()
+        self.order_book = OrderBook(self.product, 0, 0)
+        self.order_book.track_changes()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def add_order(self, _id: int):
+        self.order_book.apply_order(new_order(_id, Side.SideBuy, "{}.00".format(_id), "1.000000"))
+
+    async def restore(self, store: FileSnapshotStore) -> OrderBook:
+        snapshot = await store.get_latest()
+        for delta in await store.get_deltas():
+            snapshot = Snapshot.merge(snapshot, delta)
+        order_book = OrderBook(self.product, 0, 0)
+        order_book.restore(snapshot.order_book_snapshot)
+        return order_book
+
+    async def test_store_and_restore(self):
+        for codec in (None, JsonSnapshotCodec()):
+            store = FileSnapshotStore(self.product.id, os.path.join(self.directory.name, str(codec)), codec=codec)
+            self.assertIsNone(await store.get_latest())
+
+            self.add_order(1)
+            base = self.order_book.snapshot()
+            await store.store(Snapshot(base, 1))
+            self.add_order(2)
+            await store.store(Snapshot(self.order_book.delta_snapshot(base_log_seq=base.log_seq), 2))
+
+            restored = await self.restore(store)
+            self.assertEqual(order_book_state(restored), order_book_state(self.order_book))
+            self.assertFalse(any(name.endswith(".tmp") for name in os.listdir(store.directory)))
+
+    async def test_delta_chain(self):
+        for codec in (None, JsonSnapshotCodec()):
+            self.order_book = OrderBook(self.product, 0, 0)
+            self.order_book.track_changes()
+            store = FileSnapshotStore(self.product.id, os.path.join(self.directory.name, str(codec)), codec=codec)
+
+            # a full snapshot and three deltas, each based on the previous one like Engine.take_snapshot
+            self.add_order(1)
+            base = self.order_book.capture().materialize()
+            await store.store(Snapshot(base, 1))
+            log_seq = base.log_seq
+            for i in range(2, 5):
+                self.add_order(i)
+                delta = self.order_book.capture(base_log_seq=log_seq).materialize()
+                await store.store(Snapshot(delta, i))
+                log_seq = delta.log_seq
+
+            restored = await self.restore(store)
+            self.assertEqual(len(restored.depths[Side.SideBuy].orders), 4)
+            self.assertEqual(order_book_state(restored), order_book_state(self.order_book))
+
+            # a damaged delta ends the chain, the deltas after it are not applied
+            second = sorted(name for name in os.listdir(store.directory) if name.endswith(".delta"))[1]
+            with open(os.path.join(store.directory, second), "r+b") as f:
+                f.write(b"\xff")
+            await store.get_latest()
+            self.assertEqual(len(await store.get_deltas()), 1)
+
+    async def test_generations(self):
+        store = FileSnapshotStore(self.product.id, self.directory.name, generations=2)
+        for i in range(1, 5):
+            self.add_order(i)
+            base = self.order_book.snapshot()
+            await store.store(Snapshot(base, i))
+            self.add_order(i + 100)
+            await store.store(Snapshot(self.order_book.delta_snapshot(base_log_seq=base.log_seq), i))
+
+        names = os.listdir(self.directory.name)
+        self.assertEqual(len([name for name in names if name.endswith(".snap")]), 2)
+        self.assertEqual(len([name for name in names if name.endswith(".delta")]), 2)
+
+        # chained deltas of the kept snapshots are kept, the others are removed on the next full snapshot
+        log_seq = self.order_book.log_seq
+        for i in range(5, 7):
+            self.add_order(i + 100)
+            delta = self.order_book.capture(base_log_seq=log_seq).materialize()
+            await store.store(Snapshot(delta, i))
+            log_seq = delta.log_seq
+        self.add_order(7)
+        await store.store(Snapshot(self.order_book.snapshot(), 7))
+        names = os.listdir(self.directory.name)
+        self.assertEqual(len([name for name in names if name.endswith(".delta")]), 3)
+
+    async def test_damaged_snapshot(self):
+        store = FileSnapshotStore(self.product.id, self.directory.name)
+        self.add_order(1)
+        await store.store(Snapshot(self.order_book.snapshot(), 1))
+        self.add_order(2)
+        await store.store(Snapshot(self.order_book.snapshot(), 2))
+
+        # flip a byte of the latest snapshot, the previous generation is restored
+        latest = os.path.join(self.directory.name, sorted(os.listdir(self.directory.name))[-1])
+        with open(latest, "r+b") as f:
+            f.seek(10)
+            b = f.read(1)
+            f.seek(10)
+            f.write(bytes([b[0] ^ 0xff]))
+
+        snapshot = await store.get_latest()
+        self.assertEqual(snapshot.order_offset, 1)
+        self.assertEqual(len(snapshot.order_book_snapshot.orders), 1)
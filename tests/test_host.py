@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import asyncio
+from types import SimpleNamespace
+from unittest import IsolatedAsyncioTestCase
+
+from matching.engine import Engine, OffsetOrder
+from matching.host import EngineHost, load_products
+from models.models import Product
+from models.types import Side
+from tests.test_order_book import new_order
+
+
+class EngineHostTest(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.settings = SimpleNamespace(product_id="BTC-USD", base_currency="BTC", quote_currency="USD",
+                                        base_scale=6, quote_scale=2, products=[], stats_interval=0)
+
+    def test_load_products(self):
+        products = load_products(self.settings)
+        self.assertEqual([product.id for product in products], ["BTC-USD"])
+
+        self.settings.products = [
+            {"id": "BTC-USD", "base_currency": "BTC", "quote_currency": "USD", "base_scale": 6, "quote_scale": 2},
+            {"id": "ETH-USD", "base_currency": "ETH", "quote_currency": "USD", "base_scale": 4, "quote_scale": 2},
+        ]
+        products = load_products(self.settings)
+        self.assertEqual([product.id for product in products], ["BTC-USD", "ETH-USD"])
+        self.assertEqual(products[1].base_scale, 4)
+
+    async def test_fairness_and_stats(self):
+        host = EngineHost(load_products(self.settings), self.settings)
+        hot = Engine(product=Product(_id="BTC-USD", base_currency="BTC", quote_currency="USD", base_scale=6,
+                                     quote_scale=2),
+                     order_reader=None, log_store=None, snapshot_store=None, max_batch_size=10)
+        cold = Engine(product=Product(_id="ETH-USD", base_currency="ETH", quote_currency="USD", base_scale=6,
+                                      quote_scale=2),
+                      order_reader=None, log_store=None, snapshot_store=None, max_batch_size=10)
+        host.engines = {"BTC-USD": hot, "ETH-USD": cold}
+
+        for i in range(1, 1001):
+            hot.order_chan.put_nowait(OffsetOrder(i, new_order(i, Side.SideBuy, "10.00", "1.000000")))
+        cold.order_chan.put_nowait(OffsetOrder(1, new_order(1, Side.SideBuy, "10.00", "1.000000")))
+
+        tasks = [asyncio.create_task(hot.run_applier()), asyncio.create_task(cold.run_applier())]
+        try:
+            for _ in range(100):
+                if cold.stats.orders == 1:
+                    break
+                await asyncio.sleep(0)
+            # the cold market is served while the hot one still has a backlog
+            self.assertEqual(cold.stats.orders, 1)
+            self.assertGreater(hot.order_chan.qsize(), 900)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        stats = host.stats()
+        self.assertEqual(stats["ETH-USD"]["orders"], 1)
+        self.assertEqual(stats["BTC-USD"]["orders"], hot.stats.orders)
+        self.assertEqual(stats["BTC-USD"]["batches"], hot.stats.orders // 10)
+
+        # reading the stats resets nothing, each reader computes its rates from its previous read
+        again = host.stats()
+        self.assertEqual(again["BTC-USD"]["orders"], stats["BTC-USD"]["orders"])
+        self.assertGreaterEqual(again["BTC-USD"]["time"], stats["BTC-USD"]["time"])
+        last = {product_id: dict(product_stats, orders=0, logs=0, time=product_stats["time"] - 2)
+                for product_id, product_stats in stats.items()}
+        rates = host.stats_rates(stats, last)
+        self.assertAlmostEqual(rates["ETH-USD"]["orders_per_sec"], 0.5)
+        self.assertEqual(host.stats_rates(stats, dict())["BTC-USD"]["orders_per_sec"], 0)
@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import asyncio
+from collections import namedtuple
+from unittest import IsolatedAsyncioTestCase
+
+from utils.kafka import SharedKafkaConsumer
+
+TopicPartition = namedtuple("TopicPartition", ["topic", "partition"])
+Record = namedtuple("Record", ["offset", "value"])
+
+
+class SlowStartConsumer(object):
+    # an AIOKafkaConsumer that can not be read before its start completed
+    def __init__(self, records: dict):
+        self.records = records
+        self.started = False
+        self.starts = 0
+
+    async def start(self):
+        self.starts += 1
+        await asyncio.sleep(0.01)
+        self.started = True
+
+    async def getmany(self, timeout_ms: int, max_records: int) -> dict:
+        if not self.started:
+            raise AttributeError("'NoneType' object has no attribute 'fetched_records'")
+        records = self.records
+        self.records = dict()
+        if len(records) == 0:
+            await asyncio.sleep(timeout_ms / 1000)
+        return records
+
+    def assignment(self) -> set:
+        return set()
+
+
+class SharedKafkaConsumerTest(IsolatedAsyncioTestCase):
+    async def test_start(self):
+        topic = "matching_order_BTC-USD"
+        shared = SharedKafkaConsumer(brokers=["127.0.0.1:9092"], topics=[topic], group_id="test")
+        shared.consumer = SlowStartConsumer({TopicPartition(topic, 0): [Record(1, b"{}")]})
+        try:
+            # the readers start it concurrently, the dispatcher only reads once it is started
+            await asyncio.gather(shared.start(), shared.topic_consumer(topic).start())
+            self.assertEqual(shared.consumer.starts, 1)
+            records = await shared.topic_consumer(topic).fetch_messages(max_records=10, timeout_ms=100)
+            self.assertEqual([record.offset for record in records], [1])
+        finally:
+            shared.task.cancel()
+            await asyncio.gather(shared.task, return_exceptions=True)
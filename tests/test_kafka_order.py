@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# encoding: utf-8
+from collections import namedtuple
+from decimal import Decimal
+from unittest import IsolatedAsyncioTestCase
+
+from matching.kafka_order import KafkaOrderReader
+from models.models import Order, Product, InvalidOrder
+from models.types import Side
+from tests.test_order_book import new_order
+
+Record = namedtuple("Record", ["offset", "value"])
+
+
+class MemoryConsumer(object):
+    def __init__(self, records: list):
+        self.records = records
+
+    async def fetch_messages(self, max_records: int, timeout_ms: int = 1000) -> list:
+        records = self.records[:max_records]
+        self.records = self.records[max_records:]
+        return records
+
+
+class KafkaOrderReaderTest(IsolatedAsyncioTestCase):
+    async def test_fetch_orders(self):
+        product = Product(_id="BTC-USD", base_currency="BTC", quote_currency="USD", base_scale=6, quote_scale=2)
+        records = [Record(i, Order.to_json_str(new_order(i, Side.SideBuy, "10.00", "1.000000")).encode("utf8"))
+                   for i in range(5)]
+        # an invalid order is skipped, an order with more decimals than the product is passed on to be rejected
+        records[2] = Record(2, records[2].value.replace(b'"buy"', b'"hold"'))
+        records[4] = Record(4, records[4].value.replace(b'"10.00"', b'"10.001"'))
+
+        for decode_in_thread in (False, True):
+            reader = KafkaOrderReader(product_id="BTC-USD", brokers=["127.0.0.1:9092"], group_id="test",
+                                      product=product, max_records=3, decode_in_thread=decode_in_thread,
+                                      consumer=MemoryConsumer(list(records)))
+
+            offset_orders = await reader.fetch_orders()
+            self.assertEqual([offset for offset, _ in offset_orders], [0, 1])
+            self.assertEqual(offset_orders[0][1].price, 1000)
+            offset_orders = await reader.fetch_orders()
+            self.assertEqual([order.id for _, order in offset_orders], [3, 4])
+            self.assertIsInstance(offset_orders[1][1], InvalidOrder)
+            self.assertEqual(offset_orders[1][1].price, Decimal("10.001"))
+            self.assertEqual(await reader.fetch_orders(), [])
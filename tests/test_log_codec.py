@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import json
+from unittest import TestCase
+
+from matching.log import Log
+from matching.log_codec import JsonLogEncoder, BinaryLogEncoder, decode_binary_log, LogCodecException
+from matching.order_book import OrderBook
+from models.models import Order, Product
+from models.types import Side, OrderType, TimeInForceType
+from tests.test_order_book import new_order
+
+
+class LogCodecTest(TestCase):
+    def setUp(self):
+        self.product = Product(_id="BTC-USD", base_currency="BTC", quote_currency="USD", base_scale=6,
+                               quote_scale=2)
+
+    def tearDown(self):
+        pass
+
+    def new_logs(self, use_ticks: bool = False) -> list:
+        orders = [
+            new_order(1, Side.SideSell, "10.00", "1.000000"),
+            new_order(2, Side.SideSell, "10.50", "2.500000", time_in_force=TimeInForceType.GoodTillCrossing),
+            new_order(3, Side.SideBuy, "10.50", "2.000000"),
+            new_order(4, Side.SideBuy, "0.00", "0.000000", funds="20.00", _type=OrderType.OrderTypeMarket),
+            new_order(5, Side.SideSell, "0.00", "0.500000", _type=OrderType.OrderTypeMarket),
+        ]
+        order_book = OrderBook(self.product, 0, 0, use_ticks=use_ticks)
+        logs = list()
+        for order in orders:
+            if use_ticks:
+                order = Order.from_json_str(Order.to_json_str(order), product=self.product)
+            logs.extend(order_book.apply_order(order))
+        logs.extend(order_book.cancel_order(new_order(2, Side.SideSell, "10.50", "2.500000")))
+        return logs
+
+    def test_json_byte_compatible(self):
+        for use_ticks in (False, True):
+            product = self.product if use_ticks else None
+            logs = self.new_logs(use_ticks)
+            payloads = JsonLogEncoder(product).encode(logs)
+            self.assertEqual(len(payloads), len(logs))
+            for log, payload in zip(logs, payloads):
+                self.assertEqual(bytes(payload), Log.to_json_str(log, product).encode("utf8"))
+
+    def test_binary_round_trip(self):
+        for use_ticks in (False, True):
+            product = self.product if use_ticks else None
+            logs = self.new_logs(use_ticks)
+            payloads = BinaryLogEncoder(product).encode(logs)
+            for log, payload in zip(logs, payloads):
+                self.assertEqual(decode_binary_log(payload), json.loads(Log.to_json_str(log, product)))
+                self.assertLess(len(payload), len(Log.to_json_str(log, product)))
+
+        with self.assertRaises(LogCodecException):
+            decode_binary_log(bytes(payloads[0])[:-1])
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+
+from matching.engine import Engine, OffsetOrder
+from matching.market_data import MarketDataPublisher, MemoryMarketDataSink
+from matching.memory import MemoryLogStore
+from matching.order_book import OrderBook
+from models.models import Order, Product
+from models.types import Side
+from tests.test_order_book import new_order
+
+
+class FailingSink(MemoryMarketDataSink):
+    def __init__(self):
+        super().__init__()
+        self.failing = True
+
+    async def store(self, payloads):
+        if self.failing:
+            raise ConnectionError("broker down")
+        await super().store(payloads)
+
+
+class MarketDataTest(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.product = Product(_id="BTC-USD", base_currency="BTC", quote_currency="USD", base_scale=6,
+                               quote_scale=2)
+        self.sink = MemoryMarketDataSink()
+
+    def new_publisher(self, use_ticks: bool = False) -> (OrderBook, MarketDataPublisher):
+        order_book = OrderBook(self.product, 0, 0, use_ticks=use_ticks)
+        order_book.track_levels()
+        publisher = MarketDataPublisher(self.product, self.sink, use_ticks=use_ticks, checkpoint_interval=3600)
+        return order_book, publisher
+
+    async def test_checkpoint_then_updates(self):
+        order_book, publisher = self.new_publisher()
+        order_book.apply_order(new_order(1, Side.SideBuy, "10.00", "1.000000"))
+        order_book.apply_order(new_order(2, Side.SideSell, "11.00", "2.000000"))
+        # the first batch is published as a checkpoint
+        publisher.on_batch(order_book)
+        publisher.on_commit(order_book.log_seq)
+        await publisher.publish()
+
+        order_book.apply_order(new_order(3, Side.SideBuy, "10.00", "0.500000"))
+        order_book.apply_order(new_order(4, Side.SideBuy, "9.00", "1.000000"))
+        publisher.on_batch(order_book)
+        order_book.apply_order(new_order(5, Side.SideSell, "9.00", "1.500000"))
+        publisher.on_batch(order_book)
+        publisher.on_commit(order_book.log_seq)
+        await publisher.publish()
+
+        checkpoint, update = self.sink.messages()
+        self.assertEqual(checkpoint, {"type": "l2checkpoint", "product_id": "BTC-USD", "log_seq": 2,
+                                      "bids": [["10.00", "1.000000", 1]], "asks": [["11.00", "2.000000", 1]]})
+        # the two batches of the commit are coalesced, the level at 10.00 was filled and is reported with size 0
+        self.assertEqual(update["type"], "l2update")
+        self.assertEqual(update["log_seq"], order_book.log_seq)
+        self.assertEqual(sorted(update["changes"]), [["buy", "10.00", "0", 0], ["buy", "9.00", "1.000000", 1]])
+
+    async def test_not_ahead_of_commit(self):
+        order_book, publisher = self.new_publisher()
+        publisher.on_batch(order_book)
+        order_book.apply_order(new_order(1, Side.SideBuy, "10.00", "1.000000"))
+        publisher.on_batch(order_book)
+        committed_seq = order_book.log_seq
+        order_book.apply_order(new_order(2, Side.SideBuy, "9.00", "1.000000"))
+        publisher.on_batch(order_book)
+
+        # only the batches whose logs are acknowledged are published
+        publisher.on_commit(committed_seq)
+        await publisher.publish()
+        self.assertEqual([message["log_seq"] for message in self.sink.messages()], [0, committed_seq])
+        publisher.on_commit(order_book.log_seq)
+        await publisher.publish()
+        self.assertEqual(self.sink.messages()[-1]["changes"], [["buy", "9.00", "1.000000", 1]])
+
+    async def test_failed_publish(self):
+        self.sink = FailingSink()
+        order_book, publisher = self.new_publisher()
+        publisher.on_batch(order_book)
+        order_book.apply_order(new_order(1, Side.SideBuy, "10.00", "1.000000"))
+        publisher.on_batch(order_book)
+        publisher.on_commit(order_book.log_seq)
+        with self.assertRaises(ConnectionError):
+            await publisher.publish()
+
+        # the messages are kept and published again before the next ones
+        order_book.apply_order(new_order(2, Side.SideBuy, "9.00", "1.000000"))
+        publisher.on_batch(order_book)
+        publisher.on_commit(order_book.log_seq)
+        self.sink.failing = False
+        await publisher.publish()
+        self.assertEqual([message["log_seq"] for message in self.sink.messages()], [0, 1, 2])
+
+    async def test_no_changes(self):
+        order_book, publisher = self.new_publisher()
+        publisher.on_batch(order_book)
+        await publisher.publish()
+        publisher.on_batch(order_book)
+        await publisher.publish()
+        # only the empty checkpoint
+        self.assertEqual(len(self.sink.messages()), 1)
+
+    async def test_ticks(self):
+        order_book, publisher = self.new_publisher(use_ticks=True)
+        order = new_order(1, Side.SideSell, "10.50", "1.250000")
+        order_book.apply_order(Order.from_json_str(Order.to_json_str(order), product=self.product))
+        publisher.on_batch(order_book)
+        publisher.on_commit(order_book.log_seq)
+        await publisher.publish()
+
+        checkpoint = self.sink.messages()[0]
+        self.assertEqual(checkpoint["asks"], [["10.50", "1.250000", 1]])
+
+    async def test_engine(self):
+        # the engine publishes the levels once the committer acknowledged their logs
+        log_store = MemoryLogStore()
+        publisher = MarketDataPublisher(self.product, self.sink, checkpoint_interval=3600)
+        engine = Engine(product=self.product, order_reader=None, log_store=log_store, snapshot_store=None,
+                        market_data=publisher)
+        tasks = [asyncio.create_task(engine.run_applier()), asyncio.create_task(engine.run_committer()),
+                 asyncio.create_task(publisher.run())]
+        try:
+            await engine.order_chan.put(OffsetOrder(1, new_order(1, Side.SideBuy, "10.00", "1.000000")))
+            await engine.order_chan.put(OffsetOrder(2, new_order(2, Side.SideSell, "11.00", "1.000000")))
+            for _ in range(100):
+                if len(self.sink.payloads) > 0 and self.sink.messages()[-1]["log_seq"] == 2:
+                    break
+                await asyncio.sleep(0.001)
+            self.assertEqual(len(log_store.payloads), 2)
+            levels = dict()
+            for message in self.sink.messages():
+                if message["type"] == "l2checkpoint":
+                    levels = {("buy", price): size for price, size, _ in message["bids"]}
+                    levels.update({("sell", price): size for price, size, _ in message["asks"]})
+                else:
+                    levels.update({(side, price): size for side, price, size, _ in message["changes"]})
+            self.assertEqual(levels, {("buy", "10.00"): "1.000000", ("sell", "11.00"): "1.000000"})
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
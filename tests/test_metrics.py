@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import asyncio
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest import TestCase, IsolatedAsyncioTestCase
+
+from matching.engine import Engine
+from matching.host import EngineHost, load_products
+from models.types import Side, OrderStatus
+from tests.test_order_book import new_order
+from utils.metrics import Histogram, MetricsRegistry, MetricsExporter, Metric, bucket_index, bucket_upper, \
+    render_metrics, METRIC_COUNTER, METRIC_HISTOGRAM
+
+
+class HistogramTest(TestCase):
+    def test_buckets(self):
+        # each value lies in its bucket, within an eighth of itself
+        for value in list(range(1, 100)) + [1000, 1023, 1024, 1025, 123456789, 2 ** 39]:
+            index = bucket_index(value)
+            self.assertLessEqual(value, bucket_upper(index))
+            self.assertGreater(value, bucket_upper(index - 1) if index > 0 else 0)
+            self.assertLessEqual(bucket_upper(index) - value, value / 8)
+        # the powers of two are upper bounds of buckets
+        self.assertEqual(bucket_upper(bucket_index(1024)), 1024)
+
+    def test_percentile(self):
+        histogram = Histogram()
+        for value in range(1, 1001):
+            histogram.record(value * 1000)
+        histogram.record(10 ** 15)
+        self.assertEqual(histogram.count, 1001)
+        self.assertAlmostEqual(histogram.percentile(0.5), 500000, delta=500000 / 8)
+        self.assertAlmostEqual(histogram.percentile(0.99), 990000, delta=990000 / 8)
+        # values beyond the last bucket are counted in it
+        self.assertGreater(histogram.percentile(1.0), 10 ** 11)
+
+        histogram = Histogram()
+        histogram.record(3000, count=5)
+        self.assertEqual((histogram.count, histogram.sum), (5, 15000))
+        self.assertEqual(histogram.cumulative([2048, 4096]), [0, 5])
+
+        # a value on a bound is counted in the bucket of that bound
+        histogram = Histogram()
+        histogram.record(2048)
+        histogram.record(2049)
+        self.assertEqual(histogram.cumulative([1024, 2048, 4096]), [0, 1, 2])
+        self.assertEqual(histogram.percentile(0.5), 2048)
+
+    def test_render(self):
+        histogram = Histogram()
+        histogram.record(1500)
+        histogram.record(2048)
+        histogram.record(3 * 10 ** 9)
+        text = render_metrics([
+            Metric("orders_total", METRIC_COUNTER, "orders", {"product": "BTC-USD"}, 3),
+            Metric("orders_total", METRIC_COUNTER, "orders", {"product": "ETH-USD"}, 4),
+            Metric("apply_seconds", METRIC_HISTOGRAM, "apply", {"product": "BTC-USD"}, histogram),
+        ])
+        lines = text.splitlines()
+        self.assertEqual(lines[:4], ['# HELP orders_total orders', '# TYPE orders_total counter',
+                                     'orders_total{product="BTC-USD"} 3', 'orders_total{product="ETH-USD"} 4'])
+        self.assertIn('apply_seconds_bucket{product="BTC-USD",le="1.024e-06"} 0', lines)
+        self.assertIn('apply_seconds_bucket{product="BTC-USD",le="2.048e-06"} 2', lines)
+        self.assertIn('apply_seconds_bucket{product="BTC-USD",le="4.29497"} 3', lines)
+        self.assertIn('apply_seconds_bucket{product="BTC-USD",le="+Inf"} 3', lines)
+        self.assertIn('apply_seconds_sum{product="BTC-USD"} 3.000003548', lines)
+        self.assertIn('apply_seconds_count{product="BTC-USD"} 3', lines)
+
+
+class MetricsExporterTest(IsolatedAsyncioTestCase):
+    def setUp(self):
+        settings = SimpleNamespace(product_id="BTC-USD", base_currency="BTC", quote_currency="USD", base_scale=6,
+                                   quote_scale=2, products=[], stats_interval=0)
+        self.host = EngineHost(load_products(settings), settings)
+        product = self.host.products[0]
+        engine = Engine(product=product, order_reader=None, log_store=None, snapshot_store=None)
+        for i, side in ((1, Side.SideSell), (2, Side.SideSell), (3, Side.SideBuy)):
+            engine.apply_order(new_order(i, side, "10.00", "1.000000"))
+        cancel = new_order(2, Side.SideSell, "10.00", "1.000000")
+        cancel.status = OrderStatus.OrderStatusCancelling
+        engine.apply_order(cancel)
+        self.host.engines = {product.id: engine}
+
+    async def test_serve(self):
+        exporter = self.host.metrics_exporter
+        await exporter.start_server("127.0.0.1", 0)
+        port = exporter.server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            response = (await reader.read()).decode("utf8")
+            writer.close()
+        finally:
+            exporter.close()
+
+        self.assertTrue(response.startswith("HTTP/1.1 200 OK"))
+        self.assertIn('matching_matches_total{product="BTC-USD"} 1', response)
+        self.assertIn('matching_cancels_total{product="BTC-USD"} 1', response)
+        self.assertIn('matching_book_orders{product="BTC-USD",side="sell"} 0', response)
+        self.assertIn('matching_book_levels{product="BTC-USD",side="buy"} 0', response)
+        self.assertIn('matching_order_chan_depth{product="BTC-USD"} 0', response)
+        self.assertIn("# TYPE matching_apply_seconds histogram", response)
+
+    def test_write_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "metrics.prom")
+            registry = MetricsRegistry()
+            registry.register(lambda: [Metric("up", METRIC_COUNTER, "up", {}, 1)])
+            MetricsExporter(registry).write_file(path)
+            with open(path) as f:
+                self.assertEqual(f.read(), "# HELP up up\n# TYPE up counter\nup 1\n")
+            self.assertEqual(os.listdir(directory), ["metrics.prom"])
@@ -3,7 +3,7 @@
 from decimal import Decimal
 from unittest import TestCase
 
-from models.models import Order
+from models.models import Order, MassCancelOrder, Product
 from models.types import TimeInForceType, OrderType, Side, OrderStatus
 
 
@@ -34,3 +34,22 @@ class UtilsTest(TestCase):
         self.assertEqual(order.side, order2.side)
         self.assertEqual(order.time_in_force, order2.time_in_force)
         self.assertEqual(order.status, order2.status)
+
+    def test_mass_cancel_order(self):
+        order = MassCancelOrder(_id=1, created_at=1695783003020967000, product_id="BTC-USD", user_id=7,
+                                side=Side.SideSell, price_high=Decimal("20.50"))
+        order2 = Order.from_json_str(Order.to_json_str(order))
+        self.assertIsInstance(order2, MassCancelOrder)
+        self.assertEqual((order2.type, order2.user_id, order2.side, order2.price_low, order2.price_high),
+                         (OrderType.OrderTypeMassCancel, 7, Side.SideSell, None, Decimal("20.50")))
+
+        # side and bounds are optional, the bounds are scaled in tick mode
+        product = Product(_id="BTC-USD", base_currency="BTC", quote_currency="USD", base_scale=6, quote_scale=2)
+        order3 = Order.from_json_str('{"id": 2, "created_at": 0, "product_id": "BTC-USD", "user_id": 7, '
+                                     '"type": "mass_cancel", "price_low": "1.5"}', product=product)
+        self.assertEqual((order3.side, order3.price_low, order3.price_high), (None, 150, None))
+        # bounds with more decimals than the product select the ticks within them
+        order4 = Order.from_json_str('{"id": 3, "created_at": 0, "product_id": "BTC-USD", "user_id": 7, '
+                                     '"type": "mass_cancel", "price_low": "1.501", "price_high": "2.009"}',
+                                     product=product)
+        self.assertEqual((order4.price_low, order4.price_high), (151, 200))
@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import json
+import random
+from decimal import Decimal
+from unittest import TestCase
+
+from matching.log import Log, MatchLog, OpenLog, DoneLog
+from matching.log_codec import JsonLogEncoder, BinaryLogEncoder, decode_binary_log
+from matching.order_book import OrderBook, LIQUIDITY_MIN_WINDOW
+from models.models import Order, Product, MassCancelOrder, InvalidOrder
+from models.types import TimeInForceType, OrderType, Side, OrderStatus, DoneReason
+from replay import comparable
+
+
+def new_order(_id: int, side: Side, price: str, size: str, funds: str = "0.00",
+              _type: OrderType = OrderType.OrderTypeLimit,
+              time_in_force: TimeInForceType = TimeInForceType.GoodTillCanceled) -> Order:
+    return Order(_id=_id, created_at=1695783003020967000, product_id="BTC-USD", user_id=1, client_oid="",
+                 price=Decimal(price), size=Decimal(size), funds=Decimal(funds), _type=_type,
+                 side=side, time_in_force=time_in_force, status=OrderStatus.OrderStatusNew)
+
+
+class OrderBookTest(TestCase):
+    def setUp(self):
+        self.product = Product(_id="BTC-USD", base_currency="BTC", quote_currency="USD", base_scale=6,
+                               quote_scale=2)
+        self.order_book = OrderBook(self.product, 0, 0)
+
+    def tearDown(self):
+        pass
+
+    def test_apply_order_match(self):
+        for i in range(1, 4):
+            logs = self.order_book.apply_order(new_order(i, Side.SideSell, "10.00", "1.00"))
+            self.assertEqual(len(logs), 1)
+            self.assertIsInstance(logs[0], OpenLog)
+
+        logs = self.order_book.apply_order(new_order(4, Side.SideBuy, "10.00", "5.00"))
+        self.assertEqual([type(log) for log in logs],
+                         [MatchLog, DoneLog, MatchLog, DoneLog, MatchLog, DoneLog, OpenLog])
+        self.assertEqual([log.maker_order_id for log in logs if isinstance(log, MatchLog)], [1, 2, 3])
+        self.assertEqual([log.sequence for log in logs], list(range(4, 11)))
+        self.assertEqual(logs[-1].remaining_size, Decimal("2.00"))
+        self.assertEqual(len(self.order_book.depths[Side.SideSell].orders), 0)
+
+        logs = self.order_book.apply_order(new_order(5, Side.SideSell, "10.00", "2.00"))
+        self.assertEqual([type(log) for log in logs], [MatchLog, DoneLog, DoneLog])
+        self.assertEqual(logs[0].trade_seq, 4)
+        self.assertEqual(logs[1].order_id, 4)
+        self.assertEqual(logs[2].order_id, 5)
+        self.assertEqual(logs[2].reason, DoneReason.DoneReasonFilled)
+        self.assertEqual(len(self.order_book.depths[Side.SideBuy].orders), 0)
+
+    def test_apply_order_price_priority(self):
+        self.order_book.apply_order(new_order(1, Side.SideSell, "11.00", "1.00"))
+        self.order_book.apply_order(new_order(2, Side.SideSell, "10.00", "1.00"))
+        self.order_book.apply_order(new_order(3, Side.SideSell, "12.00", "1.00"))
+
+        logs = self.order_book.apply_order(new_order(4, Side.SideBuy, "11.00", "3.00"))
+        match_logs = [log for log in logs if isinstance(log, MatchLog)]
+        self.assertEqual([log.maker_order_id for log in match_logs], [2, 1])
+        self.assertEqual([log.price for log in match_logs], [Decimal("10.00"), Decimal("11.00")])
+        self.assertEqual(list(self.order_book.depths[Side.SideSell].orders.keys()), [3])
+        self.assertEqual(self.order_book.depths[Side.SideBuy].orders[4].size, Decimal("1.00"))
+
+    def test_apply_order_partial_maker(self):
+        self.order_book.apply_order(new_order(1, Side.SideBuy, "10.00", "5.00"))
+
+        logs = self.order_book.apply_order(new_order(2, Side.SideSell, "9.00", "2.00"))
+        self.assertEqual([type(log) for log in logs], [MatchLog, DoneLog])
+        self.assertEqual(logs[0].price, Decimal("10.00"))
+        self.assertEqual(self.order_book.depths[Side.SideBuy].orders[1].size, Decimal("3.00"))
+
+    def test_apply_market_buy_by_funds(self):
+        self.order_book.apply_order(new_order(1, Side.SideSell, "10.00", "1.00"))
+        self.order_book.apply_order(new_order(2, Side.SideSell, "20.00", "1.00"))
+
+        logs = self.order_book.apply_order(new_order(3, Side.SideBuy, "0", "0", funds="20.00",
+                                                     _type=OrderType.OrderTypeMarket))
+        self.assertEqual([type(log) for log in logs], [MatchLog, DoneLog, MatchLog, DoneLog])
+        self.assertEqual(logs[0].size, Decimal("1.00"))
+        self.assertEqual(logs[2].size, Decimal("0.500000"))
+        self.assertEqual(logs[3].reason, DoneReason.DoneReasonFilled)
+        self.assertEqual(self.order_book.depths[Side.SideSell].orders[2].size, Decimal("0.500000"))
+
+    def test_cancel_order(self):
+        self.order_book.apply_order(new_order(1, Side.SideBuy, "10.00", "5.00"))
+
+        logs = self.order_book.cancel_order(new_order(1, Side.SideBuy, "10.00", "5.00"))
+        self.assertEqual(len(logs), 1)
+        self.assertEqual(logs[0].reason, DoneReason.DoneReasonCancelled)
+        self.assertEqual(logs[0].remaining_size, Decimal("5.00"))
+        self.assertEqual(len(self.order_book.depths[Side.SideBuy].orders), 0)
+
+    def test_duplicate_order(self):
+        self.order_book.apply_order(new_order(1, Side.SideBuy, "10.00", "5.00"))
+        logs = self.order_book.apply_order(new_order(1, Side.SideBuy, "10.00", "5.00"))
+        self.assertEqual(len(logs), 0)
+
+    def test_depth_price_levels(self):
+        self.order_book.apply_order(new_order(1, Side.SideBuy, "10.00", "1.00"))
+        self.order_book.apply_order(new_order(2, Side.SideBuy, "12.00", "1.00"))
+        self.order_book.apply_order(new_order(3, Side.SideBuy, "10.00", "2.00"))
+        self.order_book.apply_order(new_order(4, Side.SideBuy, "11.00", "1.00"))
+
+        bids = self.order_book.depths[Side.SideBuy]
+        self.assertEqual(bids.best_level().price, Decimal("12.00"))
+        self.assertEqual([level.price for level in bids.iter_levels()],
+                         [Decimal("12.00"), Decimal("11.00"), Decimal("10.00")])
+        self.assertEqual([order.order_id for order in bids.iter_orders()], [2, 4, 1, 3])
+
+        # cancel in the middle of a level and a whole level
+        self.order_book.cancel_order(new_order(1, Side.SideBuy, "10.00", "1.00"))
+        self.order_book.cancel_order(new_order(4, Side.SideBuy, "11.00", "1.00"))
+        self.assertEqual([order.order_id for order in bids.iter_orders()], [2, 3])
+        self.assertEqual(len(bids.levels), 2)
+
+        asks = self.order_book.depths[Side.SideSell]
+        self.assertIsNone(asks.best_level())
+        self.assertIsNone(asks.best_order())
+
+    def test_top_levels(self):
+        self.assertIsNone(self.order_book.best_bid())
+        self.assertEqual(self.order_book.top_levels(Side.SideSell, 5), [])
+
+        self.order_book.apply_order(new_order(1, Side.SideBuy, "10.00", "1.00"))
+        self.order_book.apply_order(new_order(2, Side.SideBuy, "10.00", "2.50"))
+        self.order_book.apply_order(new_order(3, Side.SideBuy, "9.00", "1.00"))
+        self.order_book.apply_order(new_order(4, Side.SideSell, "11.00", "3.00"))
+        self.order_book.apply_order(new_order(5, Side.SideSell, "12.00", "1.00"))
+        self.assertEqual(self.order_book.best_bid(), (Decimal("10.00"), Decimal("3.50"), 2))
+        self.assertEqual(self.order_book.best_ask(), (Decimal("11.00"), Decimal("3.00"), 1))
+        self.assertEqual(self.order_book.top_levels(Side.SideSell, 5),
+                         [(Decimal("11.00"), Decimal("3.00"), 1), (Decimal("12.00"), Decimal("1.00"), 1)])
+
+        # partial fill, full fill and cancel update the aggregates
+        self.order_book.apply_order(new_order(6, Side.SideSell, "10.00", "1.50"))
+        self.assertEqual(self.order_book.best_bid(), (Decimal("10.00"), Decimal("2.00"), 1))
+        self.order_book.cancel_order(new_order(2, Side.SideBuy, "10.00", "2.00"))
+        self.assertEqual(self.order_book.top_levels(Side.SideBuy, 1), [(Decimal("9.00"), Decimal("1.00"), 1)])
+
+        restored = OrderBook(self.product, 0, 0)
+        restored.restore(self.order_book.snapshot())
+        self.assertEqual(restored.top_levels(Side.SideSell, 2), self.order_book.top_levels(Side.SideSell, 2))
+
+    def test_is_order_will_not_match(self):
+        self.assertTrue(self.order_book.is_order_will_not_match(new_order(1, Side.SideBuy, "10.00", "1.00")))
+        self.order_book.apply_order(new_order(2, Side.SideSell, "10.00", "1.00"))
+        self.assertTrue(self.order_book.is_order_will_not_match(new_order(3, Side.SideBuy, "9.00", "1.00")))
+        self.assertFalse(self.order_book.is_order_will_not_match(new_order(4, Side.SideBuy, "10.00", "1.00")))
+
+    def test_is_order_will_full_match(self):
+        self.order_book.apply_order(new_order(1, Side.SideSell, "10.00", "1.00"))
+        self.order_book.apply_order(new_order(2, Side.SideSell, "11.00", "1.00"))
+        self.assertTrue(self.order_book.is_order_will_full_match(new_order(3, Side.SideBuy, "11.00", "2.00")))
+        self.assertFalse(self.order_book.is_order_will_full_match(new_order(4, Side.SideBuy, "10.00", "2.00")))
+
+    def test_time_in_force(self):
+        self.order_book.apply_order(new_order(1, Side.SideSell, "10.00", "1.00"))
+        self.order_book.apply_order(new_order(2, Side.SideSell, "11.00", "1.00"))
+
+        # IOC: the remaining size is cancelled in the same pass, never opened
+        logs = self.order_book.apply_order(new_order(3, Side.SideBuy, "10.00", "1.50",
+                                                     time_in_force=TimeInForceType.ImmediateOrCancel))
+        self.assertEqual([type(log) for log in logs], [MatchLog, DoneLog, DoneLog])
+        self.assertEqual((logs[-1].order_id, logs[-1].remaining_size, logs[-1].reason),
+                         (3, Decimal("0.50"), DoneReason.DoneReasonCancelled))
+        self.assertIsNone(self.order_book.best_bid())
+
+        # GTX: cancelled whole when it crosses, put in orderBook otherwise
+        logs = self.order_book.apply_order(new_order(4, Side.SideBuy, "11.00", "1.00",
+                                                     time_in_force=TimeInForceType.GoodTillCrossing))
+        self.assertEqual([(type(log), log.reason) for log in logs], [(DoneLog, DoneReason.DoneReasonCancelled)])
+        self.assertEqual(self.order_book.best_ask(), (Decimal("11.00"), Decimal("1.00"), 1))
+        logs = self.order_book.apply_order(new_order(5, Side.SideBuy, "10.00", "1.00",
+                                                     time_in_force=TimeInForceType.GoodTillCrossing))
+        self.assertEqual([type(log) for log in logs], [OpenLog])
+
+        # FOK: cancelled whole unless its size is available at its price
+        logs = self.order_book.apply_order(new_order(6, Side.SideSell, "10.00", "2.00",
+                                                     time_in_force=TimeInForceType.FillOrKill))
+        self.assertEqual([(type(log), log.remaining_size) for log in logs], [(DoneLog, Decimal("2.00"))])
+        logs = self.order_book.apply_order(new_order(7, Side.SideSell, "10.00", "1.00",
+                                                     time_in_force=TimeInForceType.FillOrKill))
+        self.assertEqual([type(log) for log in logs], [MatchLog, DoneLog, DoneLog])
+        self.assertIsNone(self.order_book.best_bid())
+
+    def test_mass_cancel(self):
+        orders = [
+            new_order(1, Side.SideBuy, "9.00", "1.00"),
+            new_order(2, Side.SideBuy, "10.00", "1.00"),
+            new_order(3, Side.SideSell, "11.00", "1.00"),
+            new_order(4, Side.SideSell, "12.00", "1.00"),
+            new_order(5, Side.SideSell, "12.00", "1.00"),
+        ]
+        orders[4].user_id = 2
+        for order in orders:
+            self.order_book.apply_order(order)
+
+        logs = self.order_book.mass_cancel(MassCancelOrder(6, 0, "BTC-USD", 1, side=Side.SideSell,
+                                                           price_low=Decimal("11.50")))
+        self.assertEqual([(type(log), log.order_id, log.remaining_size) for log in logs],
+                         [(DoneLog, 4, Decimal("1.00"))])
+
+        logs = self.order_book.mass_cancel(MassCancelOrder(7, 0, "BTC-USD", 1))
+        self.assertEqual([log.order_id for log in logs], [1, 2, 3])
+        self.assertEqual([log.sequence for log in logs], [7, 8, 9])
+        self.assertEqual(list(self.order_book.depths[Side.SideSell].orders), [5])
+        self.assertEqual({side: list(depth.user_orders) for side, depth in self.order_book.depths.items()},
+                         {Side.SideBuy: [], Side.SideSell: [2]})
+        self.assertEqual(self.order_book.mass_cancel(MassCancelOrder(8, 0, "BTC-USD", 1)), [])
+
+    def test_liquidity(self):
+        self.assertEqual(self.order_book.liquidity(Side.SideSell, Decimal("10.00")), (0, 0))
+        self.order_book.apply_order(new_order(1, Side.SideSell, "10.00", "1.00"))
+        self.order_book.apply_order(new_order(2, Side.SideSell, "11.00", "2.00"))
+        self.order_book.apply_order(new_order(3, Side.SideBuy, "9.00", "1.00"))
+        liquidity = self.order_book.liquidity
+        self.assertEqual(liquidity(Side.SideSell, Decimal("10.50")), (Decimal("1.00"), Decimal("10.00")))
+        self.assertEqual(liquidity(Side.SideSell, Decimal("11.00")), (Decimal("3.00"), Decimal("32.00")))
+        self.assertEqual(liquidity(Side.SideBuy, Decimal("9.00")), (Decimal("1.00"), Decimal("9.00")))
+        self.assertEqual(liquidity(Side.SideBuy, Decimal("8.999")), (Decimal("1.00"), Decimal("9.00")))
+        self.assertEqual(liquidity(Side.SideBuy, Decimal("9.001")), (0, 0))
+
+        # the index follows fills, cancels and new levels, across windows of the grid and off the grid
+        self.check_liquidity(self.order_book, lambda price: price, random.Random(7))
+
+    def test_liquidity_ticks(self):
+        order_book = OrderBook(self.product, 0, 0, use_ticks=True)
+        self.check_liquidity(order_book, lambda price: int(price.scaleb(2)), random.Random(11))
+
+    def check_liquidity(self, order_book: OrderBook, to_price, rnd: random.Random):
+        def random_price():
+            # mostly near 10.00, sometimes far, beyond the smallest window of the grid
+            if rnd.random() < 0.05:
+                return Decimal(rnd.randint(1, 10 * LIQUIDITY_MIN_WINDOW)).scaleb(-1)
+            return Decimal("{}.{:02d}".format(rnd.randint(5, 14), rnd.randint(0, 99)))
+
+        for i in range(4, 1284):
+            side = rnd.choice([Side.SideBuy, Side.SideSell])
+            size = Decimal(rnd.randint(1, 5))
+            if not order_book.use_ticks and rnd.random() < 0.05:
+                # more decimals than the product scales
+                size += Decimal("0.0000001")
+            order = new_order(i, side, "0", "0")
+            order.price = to_price(random_price())
+            order.size = size if not order_book.use_ticks else int(size) * 10 ** 6
+            order_book.apply_order(order)
+            if rnd.random() < 0.2:
+                depth = order_book.depths[side]
+                if len(depth.orders) > 0:
+                    resting = rnd.choice(list(depth.orders.values()))
+                    order_book.cancel_order(new_order(resting.order_id, side, str(resting.price), "1.00"))
+
+            for side in (Side.SideBuy, Side.SideSell):
+                depth = order_book.depths[side]
+                price = to_price(random_price())
+                levels = [level for level in depth.iter_levels()
+                          if (level.price >= price if side == Side.SideBuy else level.price <= price)]
+                self.assertEqual(order_book.liquidity(side, price), (sum(level.size for level in levels),
+                                                                     sum(level.size * level.price for level in levels)))
+
+    def test_tick_mode_logs(self):
+        messages = [
+            (1, "sell", "10.00", "1.000000", "0.00", "limit"),
+            (2, "sell", "10.50", "2.500000", "0.00", "limit"),
+            (3, "buy", "10.50", "2.000000", "0.00", "limit"),
+            (4, "buy", "0.00", "0.000000", "20.00", "market"),
+            (5, "sell", "9.00", "4.000000", "0.00", "limit"),
+            (6, "sell", "0.00", "0.500000", "0.00", "market"),
+        ]
+        order_book = OrderBook(self.product, 0, 0)
+        tick_order_book = OrderBook(self.product, 0, 0, use_ticks=True)
+
+        for _id, side, price, size, funds, _type in messages:
+            message = Order.to_json_str(new_order(_id, Side(side), price, size, funds, _type=OrderType(_type)))
+            tick_order = Order.from_json_str(message, product=self.product)
+            self.assertIsInstance(tick_order.price, int)
+
+            logs = order_book.apply_order(Order.from_json_str(message))
+            tick_logs = tick_order_book.apply_order(tick_order)
+            self.assertEqual(len(logs), len(tick_logs))
+            for log, tick_log in zip(logs, tick_logs):
+                tick_log.time = log.time
+                self.assertEqual(Log.to_json_str(log), Log.to_json_str(tick_log, self.product))
+
+    def test_short_decimals(self):
+        # inputs with fewer decimals than the scales of the product: decimal mode writes them as they were
+        # given, tick mode at the scales of the product, the same amounts in json and in binary
+        messages = [
+            (1, "sell", "100.5", "1", "0", "limit"),
+            (2, "sell", "101", "2.5", "0", "limit"),
+            (3, "buy", "101", "2", "0", "limit"),
+            (4, "buy", "0", "0", "150.5", "market"),
+            (5, "sell", "99", "4.25", "0", "limit"),
+            (6, "sell", "0", "0.5", "0", "market"),
+        ]
+        order_book = OrderBook(self.product, 0, 0)
+        tick_order_book = OrderBook(self.product, 0, 0, use_ticks=True)
+        logs = list()
+        tick_logs = list()
+        for message in (self.new_message(*message) for message in messages):
+            logs.extend(order_book.apply_order(Order.from_json_str(message)))
+            tick_logs.extend(tick_order_book.apply_order(Order.from_json_str(message, product=self.product)))
+
+        self.assertIn('"price": "100.5"', Log.to_json_str(logs[0]))
+        self.assertIn('"remaining_size": "1"', Log.to_json_str(logs[0]))
+        self.assertIn('"price": "100.50"', Log.to_json_str(tick_logs[0], self.product))
+        self.assertEqual(len(logs), len(tick_logs))
+        for log, tick_log in zip(logs, tick_logs):
+            tick_log.time = log.time
+        for encoder, tick_encoder, decode in ((JsonLogEncoder(), JsonLogEncoder(self.product), json.loads),
+                                              (BinaryLogEncoder(), BinaryLogEncoder(self.product), decode_binary_log)):
+            self.assertEqual([comparable(decode(bytes(payload))) for payload in encoder.encode(logs)],
+                             [comparable(decode(bytes(payload))) for payload in tick_encoder.encode(tick_logs)])
+
+    def test_invalid_order(self):
+        # an order with more decimals than the product is cancelled whole in tick mode, as it is given
+        order_book = OrderBook(self.product, 0, 0, use_ticks=True)
+        order_book.apply_order(Order.from_json_str(self.new_message(1, "sell", "10.00", "1.000000", "0", "limit"),
+                                                   product=self.product))
+        order = Order.from_json_str(self.new_message(2, "buy", "10.001", "0.5", "0", "limit"), product=self.product)
+        self.assertIsInstance(order, InvalidOrder)
+        logs = order_book.apply_order(order)
+        self.assertEqual([(type(log), log.order_id, log.reason) for log in logs],
+                         [(DoneLog, 2, DoneReason.DoneReasonCancelled)])
+        self.assertIn('"remaining_size": "0.5", "price": "10.001"', Log.to_json_str(logs[0], self.product))
+        self.assertEqual(order_book.apply_order(order), [])
+        self.assertEqual(order_book.depths[Side.SideSell].orders[1].size, 1000000)
+
+        # a cancel request is applied whatever its price
+        cancel = Order.from_json_str(self.new_message(1, "sell", "10.001", "1", "0", "limit", "cancelling"),
+                                     product=self.product)
+        logs = order_book.cancel_order(cancel)
+        self.assertEqual([(log.order_id, log.reason) for log in logs], [(1, DoneReason.DoneReasonCancelled)])
+
+    def new_message(self, _id: int, side: str, price: str, size: str, funds: str, _type: str,
+                    status: str = "new") -> str:
+        return json.dumps({"id": _id, "created_at": 0, "product_id": self.product.id, "user_id": 1,
+                           "client_oid": "", "price": price, "size": size, "funds": funds, "type": _type,
+                           "side": side, "time_in_force": "GTC", "status": status})
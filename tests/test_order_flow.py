@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# encoding: utf-8
+from unittest import TestCase
+
+from benchmarks.order_flow import OrderFlowGenerator, apply
+from matching.order_book import OrderBook
+from models.models import Order, Product
+from models.types import Side
+from utils.utils import from_ticks
+
+
+class OrderFlowTest(TestCase):
+    def setUp(self):
+        self.product = Product(_id="BTC-USD", base_currency="BTC", quote_currency="USD", base_scale=6,
+                               quote_scale=2)
+
+    def test_deterministic(self):
+        orders = [Order.to_json_str(order) for order in OrderFlowGenerator(self.product, seed=5).orders(500)]
+        self.assertEqual(orders, [Order.to_json_str(order)
+                                  for order in OrderFlowGenerator(self.product, seed=5).orders(500)])
+        self.assertNotEqual(orders, [Order.to_json_str(order)
+                                     for order in OrderFlowGenerator(self.product, seed=6).orders(500)])
+
+    def test_target_depth_and_ticks(self):
+        books = list()
+        for use_ticks in (False, True):
+            generator = OrderFlowGenerator(self.product, seed=5, target_depth=200, use_ticks=use_ticks)
+            order_book = OrderBook(self.product, 0, 0, use_ticks=use_ticks)
+            for order in generator.orders(5000):
+                apply(order_book, order)
+            books.append(order_book)
+
+        # the book stays around its target depth, and the same flow in ticks gives the same book
+        depth = sum(len(depth.orders) for depth in books[0].depths.values())
+        self.assertTrue(100 < depth < 400, depth)
+        for side in (Side.SideBuy, Side.SideSell):
+            self.assertEqual([(order.order_id, order.size) for order in books[0].depths[side].iter_orders()],
+                             [(order.order_id, from_ticks(order.size, 6))
+                              for order in books[1].depths[side].iter_orders()])
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import os
+import tempfile
+from unittest import TestCase, IsolatedAsyncioTestCase
+
+import replay
+from matching.file_store import read_order_file, write_order_file, read_log_file
+from matching.memory import MemoryConsumer, Record
+
+
+class MemoryConsumerTest(IsolatedAsyncioTestCase):
+    async def test_fetch(self):
+        consumer = MemoryConsumer([Record(offset, b"{}") for offset in range(5, 10)])
+        consumer.set_offset(7)
+        self.assertEqual([record.offset for record in await consumer.fetch_messages(2)], [7, 8])
+        self.assertEqual([record.offset for record in await consumer.fetch_messages(2)], [9])
+        self.assertTrue(consumer.exhausted())
+        self.assertEqual(await consumer.fetch_messages(2, timeout_ms=1), [])
+
+
+class ReplayTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = lambda name: os.path.join(self.directory.name, name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_order_file(self):
+        messages = [b'{"id": 1}', b'{"id": 2}']
+        for name in ("orders.jsonl", "orders.bin"):
+            write_order_file(self.path(name), messages)
+            self.assertEqual(read_order_file(self.path(name)), [Record(0, messages[0]), Record(1, messages[1])])
+
+    def test_replay(self):
+        self.assertEqual(replay.main(["generate", self.path("orders.bin"), "--count", "2000", "--depth", "200"]), 0)
+        self.assertEqual(len(read_order_file(self.path("orders.bin"))), 2200)
+
+        # the same orders give the same logs, in json and in binary, with or without ticks
+        for log_format in ("json", "binary"):
+            for name, ticks in (("a", []), ("b", ["--ticks"])):
+                self.assertEqual(replay.main(["run", self.path("orders.bin"), "--log-format", log_format,
+                                              "--logs", self.path(name + "." + log_format),
+                                              "--snapshot-dir", self.path(name + log_format)] + ticks), 0)
+            logs = read_log_file(self.path("a." + log_format), log_format)
+            self.assertGreaterEqual(len(logs), 2200)
+            self.assertEqual(logs[-1]["sequence"], len(logs))
+            self.assertEqual(replay.main(["compare", self.path("a." + log_format), self.path("a." + log_format),
+                                          "--log-format", log_format]), 0)
+        self.assertEqual(replay.main(["compare", self.path("a.binary"), self.path("b.binary"),
+                                      "--log-format", "binary"]), 0)
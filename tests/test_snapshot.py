@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import copy
+import io
+import json
+from unittest import TestCase
+
+from matching.engine import Snapshot, Engine
+from matching.order_book import OrderBook, OrderBookSnapshot, OrderBookDelta, OrderBookSnapshotException
+from matching.snapshot_codec import JsonSnapshotCodec, BinarySnapshotCodec, SnapshotCodecException
+from models.models import Order, Product
+from models.types import Side, OrderType
+from tests.test_order_book import new_order
+
+
+def order_book_state(order_book: OrderBook):
+    orders = list()
+    for side in (Side.SideSell, Side.SideBuy):
+        for order in order_book.depths[side].iter_orders():
+            orders.append((order.order_id, order.user_id, str(order.price), str(order.size), str(order.funds),
+                           order.side, order.type, order.time_in_force))
+    window = order_book.order_id_window
+    return orders, order_book.trade_seq, order_book.log_seq, window.min, window.max, list(window.bit_map.data)
+
+
+class SnapshotTest(TestCase):
+    def setUp(self):
+        self.product = Product(_id="BTC-USD", base_currency="BTC", quote_currency="USD", base_scale=6,
+                               quote_scale=2)
+
+    def tearDown(self):
+        pass
+
+    def new_order_book(self, use_ticks: bool = False) -> OrderBook:
+        order_book = OrderBook(self.product, 0, 0, use_ticks=use_ticks)
+        orders = [
+            new_order(1, Side.SideSell, "10.00", "1.000000"),
+            new_order(2, Side.SideSell, "11.00", "2.0"),
+            new_order(3, Side.SideBuy, "9.00", "3.000000"),
+            new_order(4, Side.SideBuy, "9.00", "1.500000"),
+            new_order(5, Side.SideBuy, "10.00", "0.250000"),
+        ]
+        for order in orders:
+            if use_ticks:
+                order = Order.from_json_str(Order.to_json_str(order), product=self.product)
+            order_book.apply_order(order)
+        return order_book
+
+    def assert_round_trip(self, codec, use_ticks: bool = False):
+        order_book = self.new_order_book(use_ticks)
+        data = codec.encode(Snapshot(order_book.snapshot(), 42))
+
+        snapshot = codec.decode(data)
+        self.assertEqual(snapshot.order_offset, 42)
+        restored = OrderBook(self.product, 0, 0, use_ticks=use_ticks)
+        restored.restore(snapshot.order_book_snapshot)
+        self.assertEqual(order_book_state(restored), order_book_state(order_book))
+
+        stream = io.BytesIO()
+        codec.encode_to(Snapshot(order_book.snapshot(), 42), stream)
+        stream.seek(0)
+        restored = OrderBook(self.product, 0, 0, use_ticks=use_ticks)
+        restored.restore(codec.decode_from(stream).order_book_snapshot)
+        self.assertEqual(order_book_state(restored), order_book_state(order_book))
+
+    def test_json_round_trip(self):
+        self.assert_round_trip(JsonSnapshotCodec())
+        self.assert_round_trip(JsonSnapshotCodec(), use_ticks=True)
+
+    def test_binary_round_trip(self):
+        self.assert_round_trip(BinarySnapshotCodec())
+        self.assert_round_trip(BinarySnapshotCodec(), use_ticks=True)
+
+    def test_json_legacy_window(self):
+        # snapshots written before the window was stored as bytes hold a list of ints
+        order_book = self.new_order_book()
+        snapshot_dict = json.loads(Snapshot.to_json_str(Snapshot(order_book.snapshot(), 1)))
+        window_dict = snapshot_dict["order_book_snapshot"]["order_id_window"]
+        window_dict["bit_map"]["data"] = list(order_book.order_id_window.bit_map.data)
+
+        restored = OrderBook(self.product, 0, 0)
+        restored.restore(Snapshot.from_json_str(json.dumps(snapshot_dict)).order_book_snapshot)
+        self.assertEqual(order_book_state(restored), order_book_state(order_book))
+
+    def test_binary_empty_snapshot(self):
+        codec = BinarySnapshotCodec()
+        snapshot = codec.decode(codec.encode(Snapshot(None, 7)))
+        self.assertIsNone(snapshot.order_book_snapshot)
+        self.assertEqual(snapshot.order_offset, 7)
+
+    def test_binary_invalid(self):
+        codec = BinarySnapshotCodec()
+        data = codec.encode(Snapshot(self.new_order_book().snapshot(), 1))
+        with self.assertRaises(SnapshotCodecException):
+            codec.decode(b"XXXX" + data[4:])
+        with self.assertRaises(SnapshotCodecException):
+            codec.decode(data[:-1])
+
+    def test_restore_bulk_load(self):
+        order_book = self.new_order_book()
+        order_book.apply_order(new_order(6, Side.SideBuy, "9.00", "1.000000"))
+        order_book.apply_order(new_order(7, Side.SideSell, "10.00", "1.000000"))
+        snapshot = order_book.snapshot()
+        # asks then bids, each side in price-time priority
+        self.assertEqual([order.order_id for order in snapshot.orders], [1, 7, 2, 3, 4, 6])
+
+        restored = OrderBook(self.product, 0, 0)
+        restored.restore(snapshot)
+        self.assertEqual(order_book_state(restored), order_book_state(order_book))
+        self.assertEqual(restored.depths[Side.SideBuy].keys, order_book.depths[Side.SideBuy].keys)
+        self.assertEqual(restored.depths[Side.SideSell].keys, order_book.depths[Side.SideSell].keys)
+
+        # orders in time priority only, as written before, are sorted on restore
+        snapshot.orders.sort(key=lambda order: order.order_id)
+        restored = OrderBook(self.product, 0, 0)
+        restored.restore(snapshot)
+        self.assertEqual(order_book_state(restored), order_book_state(order_book))
+
+    def test_delta_snapshot(self):
+        order_book = self.new_order_book()
+        order_book.track_changes()
+        base = order_book.snapshot()
+        base.orders = [copy.copy(order) for order in base.orders]
+
+        order_book.apply_order(new_order(6, Side.SideBuy, "10.00", "0.500000"))
+        order_book.apply_order(new_order(7, Side.SideSell, "12.00", "1.000000"))
+        order_book.cancel_order(new_order(3, Side.SideBuy, "9.00", "3.000000"))
+        self.assertEqual(order_book.pending_changes(), 3)
+
+        delta = order_book.delta_snapshot(base_log_seq=base.log_seq)
+        self.assertEqual(order_book.pending_changes(), 0)
+        self.assertEqual(sorted(order.order_id for order in delta.orders), [1, 7])
+        self.assertEqual(delta.removed, [3])
+
+        for codec in (JsonSnapshotCodec(), BinarySnapshotCodec()):
+            snapshot = codec.decode(codec.encode(Snapshot(delta, 43)))
+            self.assertTrue(snapshot.is_delta())
+            snapshot = Snapshot.merge(Snapshot(base, 42), snapshot)
+            self.assertFalse(snapshot.is_delta())
+            self.assertEqual(snapshot.order_offset, 43)
+
+            restored = OrderBook(self.product, 0, 0)
+            restored.restore(snapshot.order_book_snapshot)
+            self.assertEqual(order_book_state(restored), order_book_state(order_book))
+
+    def test_merge_deltas(self):
+        order_book = self.new_order_book()
+        order_book.track_changes()
+        base = Snapshot(order_book.snapshot(), 1)
+        base.order_book_snapshot.orders = [copy.copy(order) for order in base.order_book_snapshot.orders]
+
+        order_book.apply_order(new_order(6, Side.SideBuy, "9.50", "0.500000"))
+        delta1 = Snapshot(order_book.delta_snapshot(base_log_seq=base.order_book_snapshot.log_seq), 2)
+        order_book.cancel_order(new_order(6, Side.SideBuy, "9.50", "0.500000"))
+        order_book.apply_order(new_order(7, Side.SideBuy, "9.00", "1.000000"))
+        delta2 = Snapshot(order_book.delta_snapshot(base_log_seq=delta1.order_book_snapshot.log_seq), 3)
+
+        merged = Snapshot.merge(delta1, delta2)
+        self.assertTrue(merged.is_delta())
+        self.assertEqual(merged.order_book_snapshot.base_log_seq, base.order_book_snapshot.log_seq)
+        self.assertEqual([order.order_id for order in merged.order_book_snapshot.orders], [7])
+        self.assertEqual(merged.order_book_snapshot.removed, [6])
+
+        restored = OrderBook(self.product, 0, 0)
+        restored.restore(Snapshot.merge(base, merged).order_book_snapshot)
+        self.assertEqual(order_book_state(restored), order_book_state(order_book))
+
+        with self.assertRaises(OrderBookSnapshotException):
+            Snapshot.merge(Snapshot.merge(base, delta2), delta1)
+
+    def test_engine_snapshot_chain(self):
+        engine = Engine(product=self.product, order_reader=None, log_store=None, snapshot_store=None,
+                        snapshot_delta_chain=2, snapshot_delta_max_changes=3)
+
+        def take_snapshot():
+            capture = engine.take_snapshot()
+            order_book_snapshot = capture.materialize()
+            capture.release()
+            return order_book_snapshot
+
+        engine.order_book.apply_order(new_order(1, Side.SideBuy, "9.00", "1.000000"))
+        self.assertIsInstance(take_snapshot(), OrderBookSnapshot)
+
+        engine.order_book.apply_order(new_order(2, Side.SideBuy, "9.00", "1.000000"))
+        self.assertIsInstance(take_snapshot(), OrderBookDelta)
+        engine.order_book.apply_order(new_order(3, Side.SideBuy, "9.00", "1.000000"))
+        self.assertIsInstance(take_snapshot(), OrderBookDelta)
+        # chain length reached
+        engine.order_book.apply_order(new_order(4, Side.SideBuy, "9.00", "1.000000"))
+        self.assertIsInstance(take_snapshot(), OrderBookSnapshot)
+
+        # too many changes
+        for i in range(5, 9):
+            engine.order_book.apply_order(new_order(i, Side.SideBuy, "9.00", "1.000000"))
+        self.assertIsInstance(take_snapshot(), OrderBookSnapshot)
+
+    def test_capture_price_time_priority(self):
+        # orders arrive out of price order, interleaved across the levels
+        order_book = OrderBook(self.product, 0, 0)
+        for _id, side, price in ((1, Side.SideSell, "11.00"), (2, Side.SideSell, "10.00"), (3, Side.SideBuy, "8.00"),
+                                 (4, Side.SideSell, "11.00"), (5, Side.SideBuy, "9.00"), (6, Side.SideSell, "10.00"),
+                                 (7, Side.SideBuy, "8.00")):
+            order_book.apply_order(new_order(_id, side, price, "1.000000"))
+
+        capture = order_book.capture()
+        snapshot = capture.materialize()
+        capture.release()
+        self.assertEqual([order.order_id for order in snapshot.orders], [2, 6, 1, 4, 5, 3, 7])
+        restored = OrderBook(self.product, 0, 0)
+        restored.restore(snapshot)
+        self.assertEqual(order_book_state(restored), order_book_state(order_book))
+
+    def test_capture_copy_on_write(self):
+        order_book = self.new_order_book()
+        order_book.track_changes()
+        expected = self.new_order_book()
+        full_capture = order_book.capture()
+        order_book.apply_order(new_order(6, Side.SideSell, "9.00", "1.000000"))
+        order_book.apply_order(new_order(7, Side.SideBuy, "8.00", "1.000000"))
+        delta_capture = order_book.capture(base_log_seq=full_capture.log_seq)
+        expected_delta = copy.deepcopy(order_book)
+
+        # fill and cancel captured orders, add new ones
+        order_book.apply_order(new_order(8, Side.SideSell, "0.00", "10.000000", _type=OrderType.OrderTypeMarket))
+        order_book.cancel_order(new_order(1, Side.SideSell, "10.00", "1.000000"))
+        order_book.apply_order(new_order(9, Side.SideBuy, "10.50", "1.000000"))
+        self.assertEqual(list(order_book.depths[Side.SideBuy].orders.keys()), [9])
+
+        restored = OrderBook(self.product, 0, 0)
+        restored.restore(full_capture.materialize())
+        self.assertEqual(order_book_state(restored), order_book_state(expected))
+
+        delta = delta_capture.materialize()
+        self.assertEqual(sorted(order.order_id for order in delta.orders), [3, 7])
+        restored.restore(restored.snapshot().apply_delta(delta))
+        self.assertEqual(order_book_state(restored)[:3], order_book_state(expected_delta)[:3])
+
+        full_capture.release()
+        delta_capture.release()
+        self.assertEqual(order_book.depths[Side.SideBuy].captures, ())
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import sys
+import time
+from unittest import TestCase
+
+from matching.supervisor import Supervisor, SupervisorException, assign_products
+from models.models import Product
+
+
+def crash_worker(worker_id: int, products: list, conn, health_interval: float):
+    conn.send({"worker": worker_id, "time": time.time(), "stats": {products[0].id: {"orders": 5}}})
+    sys.exit(3)
+
+
+def new_products(n: int) -> list:
+    return [Product(_id="P{}-USD".format(i), base_currency="P{}".format(i), quote_currency="USD", base_scale=6,
+                    quote_scale=2) for i in range(n)]
+
+
+class SupervisorTest(TestCase):
+    def test_assign_products(self):
+        products = new_products(300)
+        assignment = assign_products(products, 4)
+        self.assertEqual(sum(len(worker_products) for worker_products in assignment), 300)
+        self.assertTrue(all(len(worker_products) > 30 for worker_products in assignment))
+        self.assertEqual([[product.id for product in worker_products] for worker_products in assignment],
+                         [[product.id for product in worker_products] for worker_products in
+                          assign_products(products, 4)])
+
+        # adding a worker only moves products to the new worker
+        before = {product.id: worker for worker, worker_products in enumerate(assignment)
+                  for product in worker_products}
+        for worker, worker_products in enumerate(assign_products(products, 5)):
+            for product in worker_products:
+                self.assertIn(worker, (before[product.id], 4))
+
+        assignment = assign_products(products, 4, pinned={"P7-USD": 2})
+        self.assertIn("P7-USD", [product.id for product in assignment[2]])
+        with self.assertRaises(SupervisorException):
+            assign_products(products, 4, pinned={"P7-USD": 4})
+
+    def test_restart_crashed_worker(self):
+        supervisor = Supervisor(products=new_products(1), workers=2, health_interval=0.1, restart_backoff=0.1,
+                                worker_target=crash_worker)
+        self.assertEqual(len(supervisor.workers), 1)
+        worker = supervisor.workers[0]
+        supervisor.start_worker(worker)
+        try:
+            deadline = time.monotonic() + 30
+            while worker.restarts < 2 and time.monotonic() < deadline:
+                supervisor.poll(timeout=0.1)
+                supervisor.check()
+            self.assertEqual(worker.restarts, 2)
+            self.assertEqual(worker.health["stats"]["P0-USD"]["orders"], 5)
+        finally:
+            supervisor.stop_worker(worker)
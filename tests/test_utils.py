@@ -3,7 +3,7 @@
 from decimal import Decimal
 from unittest import TestCase
 
-from utils.utils import truncate_decimal
+from utils.utils import truncate_decimal, to_ticks, from_ticks, ticks_within
 
 
 class UtilsTest(TestCase):
@@ -16,3 +16,13 @@ class UtilsTest(TestCase):
     def test_truncate_decimal(self):
         d = truncate_decimal(Decimal("1.234567"), 4)
         self.assertEqual(d, Decimal("1.2345"))
+
+    def test_ticks(self):
+        self.assertEqual(to_ticks(Decimal("1.23"), 4), 12300)
+        self.assertEqual(str(from_ticks(12300, 4)), "1.2300")
+        self.assertEqual(str(from_ticks(Decimal("1.2"), 4)), "1.2")
+        with self.assertRaises(ValueError):
+            to_ticks(Decimal("1.23456"), 4)
+        self.assertEqual(ticks_within(Decimal("1.23456"), 4, upper=False), 12346)
+        self.assertEqual(ticks_within(Decimal("1.23456"), 4, upper=True), 12345)
+        self.assertEqual(ticks_within(Decimal("1.23"), 4, upper=True), 12300)
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import logging
+import threading
+from collections import deque
+from typing import Dict, Optional, Deque
+
+# event types of the audit log
+AUDIT_FETCH: str = "fetch"
+AUDIT_MATCH: str = "match"
+AUDIT_OPEN: str = "open"
+AUDIT_DONE: str = "done"
+
+# message prefix of each event type, followed by the json of the record
+AUDIT_PREFIXES: Dict[str, str] = {
+    AUDIT_FETCH: "fetch_order",
+    AUDIT_MATCH: "MatchLog",
+    AUDIT_OPEN: "OpenLog",
+    AUDIT_DONE: "DoneLog",
+}
+AUDIT_LEVELS: Dict[str, int] = {
+    AUDIT_FETCH: logging.DEBUG,
+    AUDIT_MATCH: logging.INFO,
+    AUDIT_OPEN: logging.INFO,
+    AUDIT_DONE: logging.INFO,
+}
+AUDIT_RING_SIZE: int = 65536
+
+
+def parse_level(level) -> int:
+    # a level number, or a level name such as "DEBUG"
+    if isinstance(level, int):
+        return level
+    number = logging.getLevelName(str(level).upper())
+    if not isinstance(number, int):
+        raise ValueError("invalid log level {}".format(level))
+    return number
+
+
+class AuditLogger(object):
+    """
+    Audit log of the fetched orders and the match, open and done logs, kept off the applier.
+
+    event() only checks the level and the sampling of the event type, and keeps a reference to the
+    record. The records are serialized and handed to the logging handlers by a background thread,
+    through a bounded ring: when the handlers fall behind and the ring is full, new records are
+    dropped and counted rather than blocking the applier. The records must not be changed after
+    they are passed to event(), which holds for the logs and the fetched orders.
+
+    Before start() the records are written in the caller, formatted only when the level is enabled.
+    The records of a book in tick mode are passed with its product and written with their ticks
+    converted back to the decimals of the product, as in the log topic.
+    """
+
+    def __init__(self, logger: Optional[logging.Logger] = None, ring_size: int = AUDIT_RING_SIZE,
+                 levels: Optional[Dict[str, object]] = None, sample_every: Optional[Dict[str, int]] = None,
+                 flush_interval: float = 0.05):
+        self.logger: logging.Logger = logging.getLogger("matching.audit") if logger is None else logger
+        self.ring: Deque[tuple] = deque()
+        self.flush_interval: float = flush_interval
+        self.thread: Optional[threading.Thread] = None
+        self.stopping: threading.Event = threading.Event()
+        # records dropped on a full ring, and the count last reported
+        self.dropped: int = 0
+        self.reported_dropped: int = 0
+        self.configure(ring_size=ring_size, levels=levels, sample_every=sample_every)
+
+    def configure(self, ring_size: int = AUDIT_RING_SIZE, levels: Optional[Dict[str, object]] = None,
+                  sample_every: Optional[Dict[str, int]] = None):
+        self.ring_size: int = ring_size
+        # level of each event type, the defaults overridden by levels
+        self.levels: Dict[str, int] = dict(AUDIT_LEVELS)
+        for event_type, level in (levels or dict()).items():
+            self.levels[event_type] = parse_level(level)
+        # only one of every n events of a type is written, all of them if the type is not listed
+        self.sample_every: Dict[str, int] = {event_type: n for event_type, n in (sample_every or dict()).items()
+                                             if n > 1}
+        self.sample_counts: Dict[str, int] = dict()
+
+    def event(self, event_type: str, record, product=None):
+        level = self.levels[event_type]
+        if not self.logger.isEnabledFor(level):
+            return
+
+        if event_type in self.sample_every:
+            count = self.sample_counts.get(event_type, 0) + 1
+            self.sample_counts[event_type] = count
+            if count % self.sample_every[event_type] != 0:
+                return
+
+        if self.thread is None:
+            self.write(event_type, level, record, product)
+        elif len(self.ring) >= self.ring_size:
+            self.dropped += 1
+        else:
+            self.ring.append((event_type, level, record, product))
+
+    def write(self, event_type: str, level: int, record, product=None):
+        # the records of a book in tick mode come with its product, their ticks are written as decimals
+        if product is None:
+            json_str = type(record).to_json_str(record)
+        else:
+            json_str = type(record).to_json_str(record, product)
+        self.logger.log(level, "{}: {}".format(AUDIT_PREFIXES[event_type], json_str))
+
+    def drain(self):
+        # deque appends and pops are thread safe, the applier keeps appending meanwhile
+        ring = self.ring
+        while len(ring) > 0:
+            self.write(*ring.popleft())
+
+        if self.dropped != self.reported_dropped:
+            self.logger.warning("audit log dropped {} records, ring size {}".format(
+                self.dropped - self.reported_dropped, self.ring_size))
+            self.reported_dropped = self.dropped
+
+    def run(self):
+        while not self.stopping.wait(self.flush_interval):
+            try:
+                self.drain()
+            except Exception as ex:
+                logging.error("audit log error: {}".format(ex))
+        self.drain()
+
+    def start(self):
+        if self.thread is not None:
+            return
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self.run, name="audit-log", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        # write the records left in the ring and go back to writing in the caller
+        if self.thread is None:
+            return
+        self.stopping.set()
+        self.thread.join()
+        self.thread = None
+        # records appended while the thread was stopping
+        self.drain()
+
+
+# the audit log of the process
+audit_logger: AuditLogger = AuditLogger()
+
+
+# audit(event_type, record), bound once as it is called for every log
+audit = audit_logger.event
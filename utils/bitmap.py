@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # encoding: utf-8
-from typing import List
+import base64
+from typing import Union, List
 
 TA = [1, 2, 4, 8, 16, 32, 64, 128]
 TB = [254, 253, 251, 247, 239, 223, 191, 127]
@@ -9,7 +10,8 @@ TB = [254, 253, 251, 247, 239, 223, 191, 127]
 class BitMap(object):
     def __init__(self, length):
         r = 1 if length % 8 != 0 else 0
-        self.data = [0] * (length // 8 + r)
+        # one byte per 8 bits, serialized as raw bytes
+        self.data = bytearray(length // 8 + r)
 
     def get(self, i) -> bool:
         return self.data[i // 8] & TA[i % 8] != 0
@@ -21,8 +23,25 @@ class BitMap(object):
         else:
             self.data[idx] = self.data[idx] & TB[bit]
 
+    def clear_range(self, start: int, end: int):
+        # clear the bits start to end - 1: masks for the first and the last byte, whole bytes between
+        if start >= end:
+            return
+        data = self.data
+        first, last = start >> 3, (end - 1) >> 3
+        if first == last:
+            data[first] &= ~(((1 << (end - start)) - 1) << (start & 7)) & 0xFF
+            return
+        data[first] &= (1 << (start & 7)) - 1
+        if last > first + 1:
+            data[first + 1:last] = bytes(last - first - 1)
+        data[last] &= ~((1 << (((end - 1) & 7) + 1)) - 1) & 0xFF
+
     @staticmethod
-    def from_data(data: List[int]):
+    def from_data(data: Union[bytes, bytearray, memoryview, str, List[int]]):
+        # raw bytes, the base64 string written by JsonEncoder, or the list of ints of older snapshots
         bitmap = BitMap(0)
-        bitmap.data = data
+        if isinstance(data, str):
+            data = base64.b64decode(data)
+        bitmap.data = bytearray(data)
         return bitmap
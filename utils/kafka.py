@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 # encoding: utf-8
-from random import random
-from typing import List
+import asyncio
+import logging
+from collections import deque
+from typing import List, Dict, Deque
 from aiokafka import AIOKafkaProducer, AIOKafkaConsumer
 
 
@@ -12,8 +14,13 @@ class KafkaException(Exception):
 class KafkaProducer(object):
     def __init__(self, brokers: List[str]):
         self.producer = AIOKafkaProducer(bootstrap_servers=','.join(brokers))
+        self.started = False
 
     async def start(self):
+        # the producer may be shared, it is started once
+        if self.started:
+            return
+        self.started = True
         await self.producer.start()
 
     async def send(self, topic: str, payload: bytes):
@@ -22,20 +29,32 @@ class KafkaProducer(object):
     async def send_and_wait(self, topic: str, payload: bytes):
         await self.producer.send_and_wait(topic=topic, value=payload)
 
-    async def send_batch(self, topic: str, payloads: List[bytes]):
-        bat = self.producer.create_batch()
-        [bat.append(key=None, value=payload, timestamp=None) for payload in payloads]
-        if bat.record_count() != len(payloads):
-            raise KafkaException("bat.record_count() != len(payloads)")
-
+    async def send_batch(self, topic: str, payloads: List[bytes]) -> asyncio.Future:
+        # Send the payloads in as few batches as needed, without waiting for the acknowledgements. All
+        # batches of a topic go to the same partition so the payloads keep their order. The returned
+        # future is done once all the batches are acknowledged.
         partitions = await self.producer.partitions_for(topic)
         if len(partitions) == 0:
             raise KafkaException("len(partitions) == 0")
+        partition = min(partitions)
 
-        # partition = partitions[0]
-        partition = random.choice(partitions)
-
-        await self.producer.send_batch(batch=bat, topic=topic, partition=partition)
+        futures = list()
+        bat = self.producer.create_batch()
+        for payload in payloads:
+            if bat.append(key=None, value=payload, timestamp=None) is not None:
+                continue
+
+            # batch is full, send it and start a new one
+            if bat.record_count() == 0:
+                raise KafkaException("payload of {} bytes does not fit in a batch".format(len(payload)))
+            futures.append(await self.producer.send_batch(batch=bat, topic=topic, partition=partition))
+            bat = self.producer.create_batch()
+            if bat.append(key=None, value=payload, timestamp=None) is None:
+                raise KafkaException("payload of {} bytes does not fit in a batch".format(len(payload)))
+
+        if bat.record_count() > 0:
+            futures.append(await self.producer.send_batch(batch=bat, topic=topic, partition=partition))
+        return asyncio.gather(*futures)
 
     async def flush(self):
         await self.producer.flush()
@@ -63,3 +82,109 @@ class KafkaConsumer(object):
     async def fetch_message(self):
         kafka_record = await self.consumer.getone()
         return kafka_record
+
+    async def fetch_messages(self, max_records: int, timeout_ms: int = 1000) -> list:
+        # the records available, up to max_records, waiting up to timeout_ms for the first one
+        records = await self.consumer.getmany(timeout_ms=timeout_ms, max_records=max_records)
+        if len(records) == 1:
+            return next(iter(records.values()))
+        return [kafka_record for partition_records in records.values() for kafka_record in partition_records]
+
+
+class SharedKafkaConsumer(object):
+    """
+    One consumer for the topics of many readers. Fetched records are dispatched to a buffer per
+    topic, read through the TopicConsumer of the topic. The partitions of a topic are paused
+    while its buffer holds max_buffered records, so a busy topic does not hold back the others.
+    """
+
+    def __init__(self, brokers: List[str], topics: List[str], group_id: str, max_buffered: int = 10000,
+                 max_records: int = 1000):
+        self.consumer = AIOKafkaConsumer(*topics, bootstrap_servers=','.join(brokers), group_id=group_id)
+        self.max_buffered: int = max_buffered
+        self.max_records: int = max_records
+        self.buffers: Dict[str, Deque] = {topic: deque() for topic in topics}
+        self.events: Dict[str, asyncio.Event] = {topic: asyncio.Event() for topic in topics}
+        self.paused: set = set()
+        self.started: bool = False
+        self.task = None
+
+    async def start(self):
+        # shared by the readers, it is started once, and dispatches once the consumer is started
+        if self.started:
+            return
+        self.started = True
+        await self.consumer.start()
+        self.task = asyncio.ensure_future(self.run_dispatcher())
+
+    def topic_consumer(self, topic: str):
+        return TopicConsumer(self, topic)
+
+    def topic_partitions(self, topic: str) -> list:
+        return [partition for partition in self.consumer.assignment() if partition.topic == topic]
+
+    def set_offset(self, topic: str, offset):
+        partitions = self.topic_partitions(topic)
+        if len(partitions) == 0:
+            raise KafkaException("len(partitions) == 0")
+
+        for partition in partitions:
+            self.consumer.seek(partition=partition, offset=offset)
+        # records fetched before the seek are dropped
+        self.buffers[topic].clear()
+
+    async def run_dispatcher(self):
+        while True:
+            try:
+                records = await self.consumer.getmany(timeout_ms=1000, max_records=self.max_records)
+            except Exception as ex:
+                logging.error("{}".format(str(ex)))
+                await asyncio.sleep(1)
+                continue
+
+            for partition, partition_records in records.items():
+                topic = partition.topic
+                buffer = self.buffers[topic]
+                buffer.extend(partition_records)
+                self.events[topic].set()
+                if len(buffer) >= self.max_buffered and topic not in self.paused:
+                    self.paused.add(topic)
+                    self.consumer.pause(*self.topic_partitions(topic))
+
+    async def fetch_messages(self, topic: str, max_records: int, timeout_ms: int = 1000) -> list:
+        buffer = self.buffers[topic]
+        if len(buffer) == 0:
+            event = self.events[topic]
+            event.clear()
+            try:
+                await asyncio.wait_for(event.wait(), timeout=timeout_ms / 1000)
+            except asyncio.TimeoutError:
+                return list()
+
+        records = [buffer.popleft() for _ in range(min(max_records, len(buffer)))]
+        if topic in self.paused and len(buffer) < self.max_buffered // 2:
+            self.paused.discard(topic)
+            self.consumer.resume(*self.topic_partitions(topic))
+        return records
+
+
+class TopicConsumer(object):
+    # the KafkaConsumer interface over one topic of a SharedKafkaConsumer
+    def __init__(self, shared: SharedKafkaConsumer, topic: str):
+        self.shared: SharedKafkaConsumer = shared
+        self.topic: str = topic
+
+    async def start(self):
+        await self.shared.start()
+
+    def set_offset(self, offset):
+        self.shared.set_offset(self.topic, offset)
+
+    async def fetch_message(self):
+        records = list()
+        while len(records) == 0:
+            records = await self.shared.fetch_messages(self.topic, max_records=1)
+        return records[0]
+
+    async def fetch_messages(self, max_records: int, timeout_ms: int = 1000) -> list:
+        return await self.shared.fetch_messages(self.topic, max_records=max_records, timeout_ms=timeout_ms)
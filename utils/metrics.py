@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# encoding: utf-8
+import asyncio
+import logging
+import os
+from collections import namedtuple
+from typing import Callable, Dict, Iterable, List, Optional
+
+# kinds of metrics, as the TYPE of the Prometheus text format
+METRIC_COUNTER: str = "counter"
+METRIC_GAUGE: str = "gauge"
+METRIC_HISTOGRAM: str = "histogram"
+
+# a sample of a metric: value is a number, or a Histogram for the histograms
+Metric = namedtuple("Metric", ["name", "kind", "help", "labels", "value"])
+
+# a histogram bucket is one of 2 ** HISTOGRAM_SUB_BITS sub-buckets of a power of two, so a
+# recorded value is known within 1 / 2 ** HISTOGRAM_SUB_BITS of itself. A bucket holds the values
+# above the upper bound of the previous one up to its own, like the le buckets of Prometheus.
+HISTOGRAM_SUB_BITS: int = 3
+HISTOGRAM_SUB_COUNT: int = 1 << HISTOGRAM_SUB_BITS
+# values up to 2 ** HISTOGRAM_MAX_BITS ns (about 18 minutes), larger ones are counted in the last bucket
+HISTOGRAM_MAX_BITS: int = 40
+# exported bucket bounds in ns: the powers of two from 1us to about 68s
+EXPORT_BOUNDS_NS: List[int] = [1 << bits for bits in range(10, 37)]
+
+
+def bucket_index(value: int) -> int:
+    value -= 1
+    if value < HISTOGRAM_SUB_COUNT:
+        return value if value > 0 else 0
+    shift = value.bit_length() - HISTOGRAM_SUB_BITS - 1
+    return (shift + 1) * HISTOGRAM_SUB_COUNT + (value >> shift) - HISTOGRAM_SUB_COUNT
+
+
+def bucket_upper(index: int) -> int:
+    # the largest value of the bucket
+    if index < HISTOGRAM_SUB_COUNT:
+        return index + 1
+    shift = index // HISTOGRAM_SUB_COUNT - 1
+    return (index % HISTOGRAM_SUB_COUNT + HISTOGRAM_SUB_COUNT + 1) << shift
+
+
+class Histogram(object):
+    """
+    Log-linear latency histogram of integer nanoseconds, in the manner of HdrHistogram: fixed
+    buckets, a power of two split in HISTOGRAM_SUB_COUNT, so record() is a few integer operations
+    and the histogram takes the same memory whatever the values. Percentiles are the upper bounds
+    of their buckets.
+    """
+
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self):
+        self.counts: List[int] = [0] * ((HISTOGRAM_MAX_BITS - HISTOGRAM_SUB_BITS + 1) * HISTOGRAM_SUB_COUNT)
+        self.count: int = 0
+        self.sum: int = 0
+
+    def record(self, value: int, count: int = 1):
+        # count values of value ns, bucket_index inlined
+        below = value - 1
+        if below < HISTOGRAM_SUB_COUNT:
+            index = below if below > 0 else 0
+        else:
+            shift = below.bit_length() - HISTOGRAM_SUB_BITS - 1
+            index = (shift + 1) * HISTOGRAM_SUB_COUNT + (below >> shift) - HISTOGRAM_SUB_COUNT
+            if index >= len(self.counts):
+                index = len(self.counts) - 1
+        self.counts[index] += count
+        self.count += count
+        self.sum += value * count
+
+    def percentile(self, p: float) -> int:
+        if self.count == 0:
+            return 0
+        rank = max(int(p * self.count + 0.5), 1)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return bucket_upper(index)
+        return bucket_upper(len(self.counts) - 1)
+
+    def cumulative(self, bounds: List[int]) -> List[int]:
+        # the number of values less than or equal to each bound, which must be ascending upper bounds
+        # of buckets
+        cumulative = list()
+        seen = 0
+        index = 0
+        for bound in bounds:
+            end = min(bucket_index(bound) + 1, len(self.counts))
+            while index < end:
+                seen += self.counts[index]
+                index += 1
+            cumulative.append(seen)
+        return cumulative
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+                          for k, v in labels.items()) + "}"
+
+
+def render_metrics(metrics: Iterable[Metric]) -> str:
+    # the Prometheus text format of the metrics, the samples of a name grouped under one HELP and TYPE,
+    # the histograms in seconds
+    families: Dict[str, List[Metric]] = dict()
+    for metric in metrics:
+        families.setdefault(metric.name, list()).append(metric)
+
+    lines = list()
+    for name, samples in families.items():
+        lines.append("# HELP {} {}".format(name, samples[0].help))
+        lines.append("# TYPE {} {}".format(name, samples[0].kind))
+        for metric in samples:
+            if metric.kind != METRIC_HISTOGRAM:
+                lines.append("{}{} {}".format(name, format_labels(metric.labels), metric.value))
+                continue
+
+            histogram: Histogram = metric.value
+            for bound, count in zip(EXPORT_BOUNDS_NS, histogram.cumulative(EXPORT_BOUNDS_NS)):
+                labels = dict(metric.labels, le="{:g}".format(bound / 1e9))
+                lines.append("{}_bucket{} {}".format(name, format_labels(labels), count))
+            labels = dict(metric.labels, le="+Inf")
+            lines.append("{}_bucket{} {}".format(name, format_labels(labels), histogram.count))
+            lines.append("{}_sum{} {:.9f}".format(name, format_labels(metric.labels), histogram.sum / 1e9))
+            lines.append("{}_count{} {}".format(name, format_labels(metric.labels), histogram.count))
+    lines.append("")
+    return "\n".join(lines)
+
+
+class MetricsRegistry(object):
+    """
+    Collects the metrics of its collectors, functions returning the current samples. The values
+    are only read when the metrics are exported, the instrumented code keeps plain counters and
+    histograms.
+    """
+
+    def __init__(self):
+        self.collectors: List[Callable[[], Iterable[Metric]]] = list()
+
+    def register(self, collector: Callable[[], Iterable[Metric]]):
+        self.collectors.append(collector)
+
+    def collect(self) -> List[Metric]:
+        metrics = list()
+        for collector in self.collectors:
+            metrics.extend(collector())
+        return metrics
+
+    def render(self) -> str:
+        return render_metrics(self.collect())
+
+
+class MetricsExporter(object):
+    # exports the metrics of a registry on a local http endpoint, or to a file rewritten periodically
+
+    def __init__(self, registry: MetricsRegistry):
+        self.registry: MetricsRegistry = registry
+        self.server: Optional[asyncio.AbstractServer] = None
+
+    async def start_server(self, host: str, port: int):
+        self.server = await asyncio.start_server(self.handle, host=host, port=port)
+        logging.info("metrics served on http://{}:{}/metrics".format(host, port))
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await reader.readline()
+            # skip the headers
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+
+            parts = request.split()
+            if len(parts) >= 2 and parts[0] == b"GET" and parts[1].split(b"?")[0] in (b"/metrics", b"/"):
+                status = "200 OK"
+                body = self.registry.render().encode("utf8")
+            else:
+                status = "404 Not Found"
+                body = b"not found\n"
+            writer.write("HTTP/1.1 {}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         "Content-Length: {}\r\nConnection: close\r\n\r\n".format(status, len(body)).encode("utf8"))
+            writer.write(body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError) as ex:
+            logging.warning("metrics request error: {}".format(ex))
+        finally:
+            writer.close()
+
+    def write_file(self, path: str):
+        # written to a temporary file and renamed, so readers never see a partial file
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(self.registry.render())
+        os.replace(tmp_path, path)
+
+    async def run_file(self, path: str, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.write_file(path)
+            except OSError as ex:
+                logging.error("write metrics file error: {}".format(ex))
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+            self.server = None
@@ -9,7 +9,18 @@ class RedisClient(object):
         self.redis = aioredis.from_url(url=url)
 
     async def get(self, name):
-        await self.redis.get(name=name)
+        return await self.redis.get(name=name)
 
     async def set(self, name, value):
         await self.redis.set(name=name, value=value)
+
+    async def rpush(self, name, value):
+        await self.redis.rpush(name, value)
+
+    async def lrange(self, name, start, end):
+        return await self.redis.lrange(name, start, end)
+
+    async def set_and_delete(self, name, value, delete_name):
+        # set name and delete delete_name in one transaction
+        async with self.redis.pipeline(transaction=True) as pipe:
+            await pipe.set(name, value).delete(delete_name).execute()
@@ -1,8 +1,11 @@
 #!/usr/bin/env python
 # encoding: utf-8
+import base64
 import json
+import math
 from decimal import Decimal, ROUND_DOWN
 from enum import Enum
+from functools import lru_cache
 
 
 class JsonEncoder(json.JSONEncoder):
@@ -11,8 +14,59 @@ class JsonEncoder(json.JSONEncoder):
             return str(obj.value)
         elif isinstance(obj, Decimal):
             return str(obj)
+        elif isinstance(obj, (bytes, bytearray)):
+            return base64.b64encode(obj).decode("ascii")
+        elif hasattr(obj, "__slots__"):
+            return slots_dict(obj)
+        elif hasattr(obj, "__dict__"):
+            return vars(obj)
         return super().default(obj)
 
 
+@lru_cache(maxsize=None)
+def slot_names(cls) -> tuple:
+    # all slots of a class, the slots of the base classes first
+    names = list()
+    for klass in reversed(cls.__mro__):
+        names.extend(klass.__dict__.get("__slots__", ()))
+    return tuple(names)
+
+
+def slots_dict(obj) -> dict:
+    # vars() for objects with __slots__
+    return {name: getattr(obj, name) for name in slot_names(type(obj))}
+
+
 def truncate_decimal(d, places) -> Decimal:
     return d.quantize(Decimal(10) ** -places, rounding=ROUND_DOWN)
+
+
+def to_ticks(d: Decimal, places) -> int:
+    # scale a decimal to an integer number of ticks of 10^-places
+    ticks = d.scaleb(places)
+    if ticks != ticks.to_integral_value():
+        raise ValueError("{} has more than {} decimal places".format(d, places))
+    return int(ticks)
+
+
+def ticks_within(d: Decimal, places, upper: bool) -> int:
+    # the ticks of 10^-places nearest to a bound within it: the floor of an upper bound, the ceiling of a lower one
+    ticks = d.scaleb(places)
+    return math.floor(ticks) if upper else math.ceil(ticks)
+
+
+def from_ticks(ticks, places) -> Decimal:
+    # decimals are passed through unchanged, so a value that was never scaled keeps its exponent
+    if isinstance(ticks, int):
+        return Decimal(ticks).scaleb(-places)
+    return ticks
+
+
+def decimal_to_raw(d: Decimal) -> (int, int):
+    # coefficient and exponent of a decimal, it keeps its exponent on the way back
+    exponent = d.as_tuple().exponent
+    return int(d.scaleb(-exponent)), exponent
+
+
+def raw_to_decimal(coefficient: int, exponent: int) -> Decimal:
+    return Decimal(coefficient).scaleb(exponent)
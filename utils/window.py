@@ -1,8 +1,8 @@
 #!/usr/bin/env python
 # encoding: utf-8
-from typing import List
+from typing import Union, List
 
-from utils.bitmap import BitMap
+from utils.bitmap import BitMap, TA
 
 
 class WindowException(Exception):
@@ -10,6 +10,12 @@ class WindowException(Exception):
 
 
 class Window(object):
+    """
+    The ids seen in (min, max], a ring of cap bits where an id is at bit id % cap. When an id
+    beyond max slides the window, the bits of the ids that leave it are cleared, so they are free
+    for the new ids that take their place.
+    """
+
     def __init__(self, _min, _max):
         self.min = _min
         self.max = _max
@@ -17,21 +23,53 @@ class Window(object):
         self.bit_map = BitMap(_max - _min)
 
     def put(self, val):
+        # the bit map is read and written inline, put is called for every order
+        i = val % self.cap
+        data = self.bit_map.data
         if val <= self.min:
             raise WindowException("expired val {}, current Window [{}-{}]"
                                   .format(val, self.min, self.max))
         elif val > self.max:
+            # the ids skipped by the slide are cleared, the bit of val is set below
+            if val > self.max + 1:
+                self.clear(self.max + 1, val - 1)
             delta = val - self.max
             self.min += delta
             self.max += delta
-            self.bit_map.set(val % self.cap, True)
-        elif self.bit_map.get(val % self.cap):
+            data[i >> 3] |= TA[i & 7]
+        elif data[i >> 3] & TA[i & 7]:
             raise WindowException("existed val {}".format(val))
         else:
-            self.bit_map.set(val % self.cap, True)
+            data[i >> 3] |= TA[i & 7]
+
+    def clear(self, first, last):
+        # clear the bits of the ids first to last, in at most two ranges of the ring
+        if last - first + 1 >= self.cap:
+            self.bit_map.clear_range(0, self.cap)
+            return
+        start = first % self.cap
+        end = start + last - first + 1
+        if end <= self.cap:
+            self.bit_map.clear_range(start, end)
+        else:
+            self.bit_map.clear_range(start, self.cap)
+            self.bit_map.clear_range(0, end - self.cap)
+
+    def resized(self, cap: int):
+        # a window of cap ids ending at max, with the ids of this window that are still in it
+        if cap == self.cap:
+            return self
+        window = Window(self.max - cap, self.max)
+        for val in range(max(self.min, window.min) + 1, self.max + 1):
+            if self.bit_map.get(val % self.cap):
+                window.bit_map.set(val % cap, True)
+        return window
+
+    def copy(self):
+        return Window.from_raw(_min=self.min, _max=self.max, _cap=self.cap, bitmap_data=self.bit_map.data)
 
     @staticmethod
-    def from_raw(_min: int, _max: int, _cap: int, bitmap_data: List[int]):
+    def from_raw(_min: int, _max: int, _cap: int, bitmap_data: Union[bytes, bytearray, str, List[int]]):
         window = Window(_min, _max)
         window.min = _min
         window.max = _max